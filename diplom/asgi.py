@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'diplom.settings')
 
 application = get_asgi_application()
+
+# Писатель очереди попыток стартует с сервером и сразу дописывает журналы упавших процессов
+from main.submissions import start_submission_writer  # noqa: E402
+
+start_submission_writer()
@@ -3,6 +3,7 @@
 from pathlib import Path
 import os
 
+from main.db import database_settings
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -35,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы в замер попали все остальные middleware
+    'main.instrumentation.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,7 +51,8 @@ ROOT_URLCONF = 'diplom.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, который учитывает время отрисовки в замерах запроса
+        'BACKEND': 'main.instrumentation.TimedTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,11 +72,9 @@ WSGI_APPLICATION = 'diplom.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# SQLite по умолчанию; PostgreSQL - через переменные окружения DB_* (см. main/db.py)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(BASE_DIR),
 }
 
 
@@ -124,3 +126,51 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+
+# Максимальное число тестов, чьи скомпилированные ключи ответов держатся в памяти процесса
+# (ключ сверяется с версией содержимого теста в кэше Django; при нескольких процессах
+# в CACHES нужен общий кэш, иначе правки теста видны только сохранившему их процессу)
+ANSWER_KEY_CACHE_SIZE = 256
+
+# Сколько секунд после срока попытки ещё принимаются автосохранение и отправка формы
+ATTEMPT_DEADLINE_GRACE = 30
+
+# Очередь отложенной записи завершённых попыток (main/submissions.py)
+SUBMISSION_QUEUE_ENABLED = os.environ.get('SUBMISSION_QUEUE_ENABLED', '1') == '1'
+SUBMISSION_JOURNAL_DIR = BASE_DIR / 'journal'
+SUBMISSION_JOURNAL_FSYNC = True
+SUBMISSION_BATCH_SIZE = 200  # Попыток в одной транзакции
+SUBMISSION_BATCH_WAIT = 0.05  # Секунд на добор пачки
+SUBMISSION_QUEUE_MAX_SIZE = 5000  # При переполнении попытки записываются сразу в запросе
+
+# Замеры запросов (main/instrumentation.py): заголовок Server-Timing и /metrics
+PERFORMANCE_METRICS_ENABLED = os.environ.get('PERFORMANCE_METRICS_ENABLED', '1') == '1'
+SERVER_TIMING_HEADER = True
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # Остальным /metrics доступен только персоналу и по токену
+# Адреса обратных прокси через запятую: для их запросов адрес клиента берётся из X-Forwarded-For.
+# За прокси на той же машине без этой настройки любой запрос пришёл бы с 127.0.0.1
+METRICS_TRUSTED_PROXIES = [address for address in os.environ.get('METRICS_TRUSTED_PROXIES', '').split(',') if address]
+# Токен сборщика метрик (заголовок Authorization: Bearer <токен>); пустой - вход по токену выключен
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Асинхронные страницы прохождения теста (main/async_views.py). Выключены по умолчанию;
+# под ASGI-сервером их включают явно переменной окружения ASYNC_VIEWS=1
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# Уменьшенные копии изображений вопросов (main/images.py)
+QUESTION_IMAGE_WIDTHS = (320, 640, 960, 1280)  # Ширины копий в пикселях
+QUESTION_IMAGE_QUALITY = 80  # Качество WebP
+IMAGE_WORKER_ENABLED = os.environ.get('IMAGE_WORKER_ENABLED', '1') == '1'  # Иначе копии строятся в запросе
+
+# Подбор вопросов персонализированного теста по усвоению (main/mastery.py)
+MASTERY_LEARNING_RATE = 0.5  # Вес нового ответа в среднем баллах за вопрос
+MASTERY_HALF_LIFE_DAYS = 14  # За это время без повторения усвоение считается вдвое меньшим
+MASTERY_WEAK_LEVEL = 0.8  # Вопросы с усвоением ниже попадают в персонализированный тест
+MASTERY_SPACING_HOURS = 12  # Вопросы, отвеченные недавно, выбираются реже
+
+# Поиск преподавателя по тестам и вопросам (main/search.py)
+SEARCH_PAGE_SIZE = 20  # Результатов на странице
+
+# Проверка текстовых ответов (main/matching.py)
+TEXT_ANSWER_MAX_TYPOS = 1  # Допустимые опечатки в ответе
+TEXT_ANSWER_FUZZY_MIN_LENGTH = 5  # Более короткие ответы сравниваются без опечаток
@@ -2,8 +2,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
+from main.images import VARIANT_DIR, serve_variant
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('main.urls'))
+    path('', include('main.urls')),
+    # Копии изображений с именами из хэша содержимого кэшируются браузером навсегда
+    path(f'{settings.MEDIA_URL.lstrip("/")}{VARIANT_DIR}/<path:path>', serve_variant),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -3,7 +3,7 @@
 
 from django.contrib import admin
 from django.contrib.auth.models import User  # Стандартный импорт
-from .models import Test, Question, Option, StudentAnswer
+from .models import Test, Question, TestQuestion, Option, StudentAnswer, Attempt, AttemptAnswer, StudentStats, QuestionMastery
 from .models import Profile
 
 # admin.site.register(User)  # Не нужно создавать UserAdmin
@@ -11,6 +11,11 @@ admin.site.register(Test)
 admin.site.register(Question)
 admin.site.register(Option)
 admin.site.register(StudentAnswer)
+admin.site.register(Attempt)
+admin.site.register(AttemptAnswer)
+admin.site.register(StudentStats)
+admin.site.register(TestQuestion)
+admin.site.register(QuestionMastery)
 
 admin.site.register(Profile)
 
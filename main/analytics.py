@@ -0,0 +1,179 @@
+# main/analytics.py
+"""
+Анализ заданий теста (item analysis) для преподавателя.
+
+Для каждого вопроса считаются достаточные статистики (суммы баллов,
+квадратов баллов, произведений с итоговым баллом, число ответивших,
+частоты выбора вариантов). Они аддитивны, поэтому хранятся в кэше и
+при появлении новых попыток дополняются только по этим попыткам.
+Все статистики получаются фиксированным числом групповых запросов.
+
+Попытка с выборкой из пула (Attempt.draw, main/pools.py) видела только
+свои вопросы, поэтому показатели вопроса считаются по попыткам, которым
+он достался: для таких попыток отдельно накапливаются показы вопросов.
+"""
+import math
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+from .models import Attempt, StudentAnswer
+
+CACHE_KEY = 'item_analysis:2:{test_id}'
+
+
+def empty_stats():
+    return {
+        'last_attempt_id': 0,
+        'attempts': 0,
+        'sum_total': 0.0,
+        'sum_total_sq': 0.0,
+        'questions': {},  # id вопроса -> [ответили, Σx, Σx², Σxy]
+        'options': {},  # id варианта -> число выборов
+        'drawn': [0, 0.0, 0.0],  # Попытки с выборкой: [число, Σy, Σy²]
+        'shown': {},  # id вопроса -> [показан в попытках с выборкой, Σy, Σy²]
+    }
+
+
+def _question_sums(test_id, after_id, upto_id):
+    """Суммы по вопросам: сначала балл студента за вопрос, затем агрегат по вопросу"""
+    answers = StudentAnswer._meta.db_table
+    attempts = Attempt._meta.db_table
+    sql = f"""
+        SELECT item.question_id, SUM(item.answered), SUM(item.item_score),
+               SUM(item.item_score * item.item_score), SUM(item.item_score * item.total_score)
+        FROM (
+            SELECT sa.question_id,
+                   MAX(sa.score) AS item_score,
+                   MAX(CASE WHEN sa.selected_option_id IS NOT NULL
+                            OR COALESCE(sa.answer_text, '') <> '' THEN 1 ELSE 0 END) AS answered,
+                   MAX(a.score) AS total_score
+            FROM {answers} sa
+            JOIN {attempts} a ON a.user_id = sa.user_id AND a.test_id = sa.test_id
+            WHERE sa.test_id = %s AND a.id > %s AND a.id <= %s
+            GROUP BY sa.question_id, sa.user_id
+        ) item
+        GROUP BY item.question_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [test_id, after_id, upto_id])
+        return cursor.fetchall()
+
+
+def update_stats(test_id, stats):
+    """Дополняет статистики попытками, появившимися после последнего пересчёта"""
+    last_id = stats['last_attempt_id']
+    new_attempts = Attempt.objects.filter(test_id=test_id, id__gt=last_id)
+    bounds = new_attempts.aggregate(
+        max_id=Max('id'),
+        open_id=Min('id', filter=Q(status=Attempt.IN_PROGRESS)),
+    )
+    upto_id = bounds['max_id']
+    # Незавершённая попытка получит результат позже следующих за ней, поэтому окно обрывается перед ней
+    if bounds['open_id'] is not None:
+        upto_id = bounds['open_id'] - 1
+    if upto_id is None or upto_id <= last_id:
+        return stats
+
+    totals = new_attempts.filter(id__lte=upto_id).aggregate(
+        count=Count('id'),
+        sum_total=Sum('score'),
+        sum_total_sq=Sum(F('score') * F('score')),
+        drawn=Count('id', filter=Q(draw__isnull=False)),
+    )
+    stats['attempts'] += totals['count']
+    stats['sum_total'] += totals['sum_total'] or 0
+    stats['sum_total_sq'] += totals['sum_total_sq'] or 0
+
+    if totals['drawn']:
+        drawn = stats['drawn']
+        for score, draw in new_attempts.filter(id__lte=upto_id, draw__isnull=False).values_list('score', 'draw'):
+            for sums in (drawn, *(stats['shown'].setdefault(question_id, [0, 0.0, 0.0]) for question_id in draw['questions'])):
+                sums[0] += 1
+                sums[1] += score
+                sums[2] += score * score
+
+    for question_id, answered, sum_x, sum_x2, sum_xy in _question_sums(test_id, last_id, upto_id):
+        sums = stats['questions'].setdefault(question_id, [0, 0.0, 0.0, 0.0])
+        sums[0] += answered or 0
+        sums[1] += sum_x or 0
+        sums[2] += sum_x2 or 0
+        sums[3] += sum_xy or 0
+
+    option_counts = StudentAnswer.objects.filter(
+        test_id=test_id,
+        selected_option__isnull=False,
+        user__attempts__test_id=test_id,
+        user__attempts__id__gt=last_id,
+        user__attempts__id__lte=upto_id,
+    ).values('selected_option_id').annotate(count=Count('id'))
+    for row in option_counts:
+        option_id = row['selected_option_id']
+        stats['options'][option_id] = stats['options'].get(option_id, 0) + row['count']
+
+    stats['last_attempt_id'] = upto_id
+    return stats
+
+
+def get_item_stats(test_id):
+    key = CACHE_KEY.format(test_id=test_id)
+    cached = cache.get(key)
+    stats = cached or empty_stats()
+    previous_id = stats['last_attempt_id']
+    update_stats(test_id, stats)
+    if cached is None or stats['last_attempt_id'] != previous_id:
+        cache.set(key, stats, None)
+    return stats
+
+
+def invalidate_item_stats(test_id):
+    cache.delete(CACHE_KEY.format(test_id=test_id))
+
+
+def _correlation(n, sum_x, sum_x2, sum_y, sum_y2, sum_xy):
+    variance_x = n * sum_x2 - sum_x * sum_x
+    variance_y = n * sum_y2 - sum_y * sum_y
+    if variance_x <= 0 or variance_y <= 0:
+        return None
+    return (n * sum_xy - sum_x * sum_y) / math.sqrt(variance_x * variance_y)
+
+
+def item_analysis(test):
+    """
+    Отчёт по вопросам теста. Для каждого вопроса возвращаются:
+    индекс трудности (средний балл за вопрос), дискриминативность
+    (точечно-бисериальная корреляция балла за вопрос с баллом за
+    остальные вопросы), доля пропусков и частоты выбора вариантов.
+    """
+    stats = get_item_stats(test.id)
+    drawn_count, drawn_sum, drawn_sum_sq = stats['drawn']
+    report = []
+    for question in test.questions.all():
+        answered, sum_x, sum_x2, sum_xy = stats['questions'].get(question.id, (0, 0.0, 0.0, 0.0))
+        # Вопрос видели все попытки без выборки и те попытки с выборкой, которым он достался
+        shown, shown_sum, shown_sum_sq = stats['shown'].get(question.id, (0, 0.0, 0.0))
+        n = stats['attempts'] - drawn_count + shown
+        sum_total = stats['sum_total'] - drawn_sum + shown_sum
+        sum_total_sq = stats['sum_total_sq'] - drawn_sum_sq + shown_sum_sq
+        # Балл за остальные вопросы: y' = y - x
+        sum_rest = sum_total - sum_x
+        sum_rest_sq = sum_total_sq - 2 * sum_xy + sum_x2
+        sum_x_rest = sum_xy - sum_x2
+        options = [
+            {
+                'option': option,
+                'count': stats['options'].get(option.id, 0),
+                'share': stats['options'].get(option.id, 0) / n if n else 0,
+            }
+            for option in question.options.all()
+        ]
+        report.append({
+            'question': question,
+            'shown': n,
+            'difficulty': sum_x / n if n else None,
+            'discrimination': _correlation(n, sum_x, sum_x2, sum_rest, sum_rest_sq, sum_x_rest) if n else None,
+            'blank_rate': (n - answered) / n if n else None,
+            'options': options,
+        })
+    return stats['attempts'], report
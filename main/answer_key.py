@@ -0,0 +1,177 @@
+# main/answer_key.py
+"""
+Скомпилированный ключ ответов теста.
+
+Ключ собирается один раз из вопросов и вариантов теста и хранится в
+LRU-кэше процесса вместе с версией содержимого теста из общего кэша
+(main.fragments.get_content_version). Сигналы на Test/Question/Option
+сбрасывают ключ изменённого теста в своём процессе и меняют версию
+(см. main/signals.py), а остальные процессы замечают новую версию при
+следующем обращении. Проверка ответов не обращается к базе данных.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from django.conf import settings
+
+from .fragments import get_content_version
+from .matching import compile_matcher
+
+
+def normalize_text_answer(value):
+    """Приводит текстовый ответ к виду, в котором он сохраняется; с эталоном его сравнивает TextMatcher"""
+    return (value or '').strip().lower()
+
+
+class QuestionKey(NamedTuple):
+    id: int
+    is_text_answer: bool
+    is_multiple_choice: bool
+    option_ids: frozenset
+    correct_option_ids: frozenset
+    text_matcher: object  # main.matching.TextMatcher у текстового вопроса, иначе None
+
+    def score(self, selected_ids=(), answer_text=None):
+        """
+        Возвращает (балл, правильно выбрано, неправильно выбрано) за ответ.
+        Правила совпадают с исходными: множественный выбор оценивается как
+        max(0, правильные - неправильные) / число правильных вариантов.
+        """
+        if self.is_text_answer:
+            is_correct = self.text_matcher.matches(answer_text)
+            return (1 if is_correct else 0), 0, 0
+
+        selected = set(selected_ids)
+        correct_selected = len(selected & self.correct_option_ids)
+        incorrect_selected = len(selected - self.correct_option_ids)
+        if self.is_multiple_choice:
+            if not self.correct_option_ids:
+                return 0, correct_selected, incorrect_selected
+            question_score = max(0, correct_selected - incorrect_selected) / len(self.correct_option_ids)
+        else:
+            first = selected_ids[0] if selected_ids else None
+            question_score = 1 if (len(selected_ids) == 1 and first in self.correct_option_ids) else 0
+        return question_score, correct_selected, incorrect_selected
+
+
+class AnswerKey(NamedTuple):
+    test_id: int
+    questions: tuple
+    # Разделы пула: ((название, (id вопросов, ...)), ...), вопросы без раздела - под ''
+    sections: tuple = ()
+
+    @property
+    def total(self):
+        return len(self.questions)
+
+    def restrict(self, question_ids):
+        """Ключ только с заданными вопросами (вытянутыми студентом из пула)"""
+        question_ids = set(question_ids)
+        return self._replace(questions=tuple(q for q in self.questions if q.id in question_ids))
+
+    def question(self, question_id):
+        for question_key in self.questions:
+            if question_key.id == question_id:
+                return question_key
+        return None
+
+
+def compile_answer_key(test_id, questions=None):
+    """
+    Собирает ключ ответов. Если переданы вопросы с предзагруженными
+    вариантами (prefetch_related('options')), к базе идёт один запрос -
+    за ссылками теста. Вопросы в ключе идут в порядке теста (TestQuestion.position).
+    """
+    from .models import Question, TestQuestion
+    if questions is None:
+        questions = Question.objects.filter(linked_tests=test_id).prefetch_related('options')
+    # Раздел и место вопроса задаются ссылкой теста на вопрос, поэтому читаются отдельно и от переданных вопросов
+    section_of = {}
+    position_of = {}
+    for question_id, section, position in TestQuestion.objects.filter(test_id=test_id).values_list(
+        'question_id', 'section', 'position',
+    ):
+        section_of[question_id] = section
+        position_of[question_id] = position
+
+    compiled = []
+    sections = {}
+    for question in sorted(questions, key=lambda q: (position_of.get(q.id, 0), q.id)):
+        sections.setdefault(section_of.get(question.id, ''), []).append(question.id)
+        options = list(question.options.all())
+        compiled.append(QuestionKey(
+            id=question.id,
+            is_text_answer=question.is_text_answer,
+            is_multiple_choice=question.is_multiple_choice,
+            option_ids=frozenset(option.id for option in options),
+            correct_option_ids=frozenset(option.id for option in options if option.is_correct),
+            # Разбор эталона кэшируется по его строке, общей у копий вопроса
+            text_matcher=compile_matcher(question.correct_text_answer) if question.is_text_answer else None,
+        ))
+    return AnswerKey(
+        test_id=test_id,
+        questions=tuple(compiled),
+        sections=tuple((name, tuple(ids)) for name, ids in sorted(sections.items())),
+    )
+
+
+class AnswerKeyCache:
+    """
+    Потокобезопасный LRU-кэш ключей с ограничением по числу тестов.
+    Ключ выдаётся только для той версии содержимого, с которой был сохранён.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, test_id, version):
+        with self._lock:
+            entry = self._data.get(test_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._data.move_to_end(test_id)
+            return entry[1]
+
+    def set(self, test_id, version, key):
+        with self._lock:
+            self._data[test_id] = (version, key)
+            self._data.move_to_end(test_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, test_id):
+        with self._lock:
+            self._data.pop(test_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+answer_key_cache = AnswerKeyCache(getattr(settings, 'ANSWER_KEY_CACHE_SIZE', 256))
+
+
+def get_answer_key(test, questions=None):
+    """
+    Возвращает ключ ответов теста из кэша, при промахе компилирует его.
+    test может быть экземпляром Test или его id.
+    """
+    test_id = getattr(test, 'pk', test)
+    # Версия читается до сборки: ключ, собранный во время правки, сохранится
+    # со старой версией и будет пересобран при следующем обращении
+    version = get_content_version(test_id)
+    key = answer_key_cache.get(test_id, version)
+    if key is None:
+        key = compile_answer_key(test_id, questions)
+        answer_key_cache.set(test_id, version, key)
+    return key
+
+
+def invalidate_answer_key(test_id):
+    answer_key_cache.invalidate(test_id)
@@ -11,4 +11,4 @@ class MainConfig(AppConfig):
     name = 'main'
 
     def ready(self):
-        from . import signals
+        from . import db, instrumentation, signals
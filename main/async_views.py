@@ -0,0 +1,170 @@
+# main/async_views.py
+"""
+Асинхронные версии страниц прохождения теста для запуска под ASGI.
+
+Под uvicorn синхронное представление занимает поток на всё время
+запроса, включая ожидание блокировки записи SQLite. Здесь чтения идут
+через асинхронный ORM (aget, afirst, async for), а действия, которым
+нужна транзакция или запись в журнал, - через sync_to_async. Проверка
+ответов выполняется прямо в цикле событий: она не обращается к базе.
+
+Какие представления подключать, решает настройка ASYNC_VIEWS: по умолчанию
+она выключена, асинхронные страницы включаются явно переменной окружения
+ASYNC_VIEWS=1. Логика совпадает с main.views.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils import timezone
+
+from .attempts import (
+    AttemptClosed, apply_result, astart_attempt, finalize_attempt, finalize_expired_attempts, is_open, parse_autosave,
+    remaining_seconds, save_answers, student_answer_rows, submission_from_attempt,
+)
+from .forms import TestCodeForm
+from .fragments import test_questions_html
+from .grading import grade_submission, submission_from_post
+from .models import Attempt, Profile, Test
+from .pools import drawn_questions, student_answer_key
+from .submissions import enqueue_submission, submission_queue
+from .views import build_detailed_results
+
+# Шаблоны обращаются к пользователю и сессии лениво, поэтому отрисовка идёт в потоке
+arender = sync_to_async(render)
+
+ALREADY_PASSED = 'Вы уже проходили этот тест. Повторное прохождение невозможно.'
+
+
+async def current_user(request):
+    """Пользователь запроса с загруженным профилем, доступный шаблонам без запросов к базе"""
+    user = await request.auser()
+    # request.user и request.auser() кэшируют пользователя независимо
+    request.user = user
+    if user.is_authenticated:
+        user.profile = await Profile.objects.aget(user=user)
+    return user
+
+
+@login_required
+async def start_test(request, test_id):
+    test = await aget_object_or_404(Test.objects.select_related('grading_scheme'), pk=test_id)
+    user = await current_user(request)
+    if user.profile.role != 'student' or not test.is_active:
+        return await arender(request, 'main/error.html', {'message': 'Этот тест сейчас недоступен.'})
+
+    attempt = await astart_attempt(user, test)
+    if attempt.status == Attempt.FINISHED or submission_queue.is_pending(attempt.id):
+        return await arender(request, 'main/error.html', {'message': ALREADY_PASSED})
+    if not is_open(attempt):
+        await sync_to_async(finalize_expired_attempts)(test)
+        return redirect('test_result', test_id=test.id)
+
+    saved = submission_from_attempt([answer async for answer in attempt.answers.all()])
+    # Страница теста с пулом собирается из фрагментов в порядке выборки студента
+    draw = (await sync_to_async(student_answer_key)(test, attempt))[1] if attempt.draw is not None else None
+    return await arender(request, 'main/test_timer.html', {
+        'test': test,
+        'questions_html': await sync_to_async(test_questions_html)(test.id, draw),
+        'remaining_seconds': remaining_seconds(attempt),
+        'saved_answers': {**saved.selected, **saved.texts},
+    })
+
+
+@login_required
+async def autosave_answers(request, test_id):
+    """Принимает пачку изменённых ответов в JSON: {"answers": {"<id вопроса>": [id вариантов] или "текст"}}"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Ожидается POST-запрос.'}, status=405)
+    user = await request.auser()
+    attempt = await Attempt.objects.filter(user=user, test_id=test_id).select_related('test').afirst()
+    if attempt is None or not is_open(attempt):
+        return JsonResponse({'error': 'Попытка завершена или время вышло.'}, status=409)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные данные.'}, status=400)
+    answers = payload.get('answers') if isinstance(payload, dict) else None
+    # Ответы на вопросы вне выборки студента отбрасываются
+    answer_key, _ = await sync_to_async(student_answer_key)(attempt.test, attempt)
+    saved = await sync_to_async(save_answers)(attempt, parse_autosave(answer_key, answers))
+    return JsonResponse({'saved': saved, 'remaining': remaining_seconds(attempt)})
+
+
+@login_required
+async def submit_answers(request, test_id):
+    test = await aget_object_or_404(
+        Test.objects.select_related('grading_scheme').prefetch_related(Test.prefetch_questions('options')), pk=test_id
+    )
+    user = await current_user(request)
+    if user.profile.role != 'student':
+        return redirect('index')
+    if request.method != 'POST':
+        return redirect('start_test', test_id=test.id)
+
+    attempt = await Attempt.objects.filter(user=user, test=test).afirst()
+    if attempt is None:
+        return redirect('start_test', test_id=test.id)
+    if attempt.status == Attempt.FINISHED or submission_queue.is_pending(attempt.id):
+        return await arender(request, 'main/error.html', {'message': ALREADY_PASSED})
+    attempt.test = test
+
+    # Вопросы с вариантами уже загружены prefetch_related; разделы пула читаются в потоке ORM
+    answer_key, draw = await sync_to_async(student_answer_key)(test, attempt, list(test.questions.all()))
+    questions = drawn_questions(test.questions.all(), draw)
+    if is_open(attempt):
+        submission = submission_from_post(answer_key, request.POST)
+    else:
+        submission = submission_from_attempt([answer async for answer in attempt.answers.all()])
+    grades = grade_submission(answer_key, submission)
+    submitted_at = timezone.now()
+    # Запись в журнал (fsync) и проверка транзакции подключения - в потоке ORM
+    if await sync_to_async(enqueue_submission)(attempt, submission, submitted_at):
+        apply_result(attempt, answer_key, grades, submitted_at)
+        student_answers = student_answer_rows(attempt, answer_key, submission, grades)
+    else:
+        try:
+            student_answers = await sync_to_async(finalize_attempt)(
+                attempt, answer_key, submission, grades, submitted_at
+            )
+        except AttemptClosed:
+            return await arender(request, 'main/error.html', {'message': ALREADY_PASSED})
+    detailed_results, total_score, fully_correct = build_detailed_results(questions, answer_key, submission, grades)
+    max_possible_score = answer_key.total
+
+    return await arender(request, 'main/result.html', {
+        'test': test,
+        'correct': total_score,
+        'fully_correct': fully_correct,
+        'total': max_possible_score,
+        'score': attempt.percentage,
+        'grade': attempt.grade,
+        'incorrect': max_possible_score - total_score,
+        'results': detailed_results,
+        'answers_by_question': {answer.question_id: answer for answer in student_answers}
+    })
+
+
+@login_required
+async def enter_test_code(request):
+    # Профиль нужен только шаблону, а переход к тесту обходится без него
+    request.user = await request.auser()
+    form = TestCodeForm()
+    error = None
+    if request.method == 'POST':
+        form = TestCodeForm(request.POST)
+        if form.is_valid():
+            code = form.cleaned_data['code'].strip().upper()
+            test = await Test.objects.filter(code=code).only('id', 'is_active').afirst()
+            if test is None:
+                error = "Тест с таким кодом не найден."
+            elif not test.is_active:
+                return await arender(request, 'main/error.html', {'message': 'Этот тест сейчас недоступен.'})
+            else:
+                return redirect('start_test', test_id=test.id)
+    return await arender(request, 'main/enter_test_code.html', {
+        'form': form,
+        'error': error
+    })
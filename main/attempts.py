@@ -0,0 +1,278 @@
+# main/attempts.py
+"""
+Жизненный цикл попытки прохождения теста.
+
+Попытка создаётся при открытии теста и получает срок, после которого
+сервер не принимает ответы. Во время прохождения страница небольшими
+пачками присылает изменённые ответы, которые записываются в
+AttemptAnswer одним upsert-запросом, поэтому перезагрузка страницы ничего
+не теряет. При завершении ответы проверяются и переносятся в StudentAnswer,
+а попытка получает результат и обновляет усвоение вопросов (main/mastery.py);
+после срока учитываются только сохранённые.
+"""
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .answer_key import get_answer_key, normalize_text_answer
+from .grading import Submission, grade_batch
+from .mastery import record_mastery
+from .pools import new_draw, student_answer_key
+from .models import Attempt, AttemptAnswer, StudentAnswer
+from .stats import record_finished
+
+# Запас на сетевую задержку последнего автосохранения и отправки формы по таймеру
+DEADLINE_GRACE = timedelta(seconds=getattr(settings, 'ATTEMPT_DEADLINE_GRACE', 30))
+
+
+class AttemptClosed(Exception):
+    """Попытка уже завершена или её время истекло"""
+
+
+def start_attempt(user, test):
+    """Возвращает попытку студента по тесту, создавая новую со сроком по time_limit"""
+    attempt = Attempt.objects.filter(user=user, test=test).first()
+    if attempt is not None:
+        return attempt
+    return create_attempt(user, test)
+
+
+def create_attempt(user, test):
+    """Создаёт попытку; если её уже создал параллельный запрос, возвращает существующую"""
+    now = timezone.now()
+    attempt = Attempt(
+        user=user,
+        test=test,
+        status=Attempt.IN_PROGRESS,
+        started_at=now,
+        deadline=now + timedelta(minutes=test.time_limit),
+        finished_at=None,
+        draw=new_draw(test, user.id),
+    )
+    try:
+        with transaction.atomic():
+            attempt.save()
+    except IntegrityError:
+        # Тест открыт одновременно в двух вкладках
+        attempt = Attempt.objects.get(user=user, test=test)
+    return attempt
+
+
+async def astart_attempt(user, test):
+    """Асинхронный start_attempt: существующая попытка читается асинхронным ORM"""
+    attempt = await Attempt.objects.filter(user=user, test=test).afirst()
+    if attempt is not None:
+        return attempt
+    # Создание с разбором гонки вкладок требует транзакции, которой нет в асинхронном ORM
+    return await sync_to_async(create_attempt)(user, test)
+
+
+def is_open(attempt, now=None):
+    """Принимает ли попытка ответы"""
+    if attempt.status != Attempt.IN_PROGRESS:
+        return False
+    if attempt.deadline is None:
+        return True
+    return (now or timezone.now()) <= attempt.deadline + DEADLINE_GRACE
+
+
+def remaining_seconds(attempt, now=None):
+    if attempt.deadline is None:
+        return None
+    return max(0, int((attempt.deadline - (now or timezone.now())).total_seconds()))
+
+
+def submission_from_attempt(attempt_answers):
+    """Собирает ответ из сохранённых строк AttemptAnswer"""
+    selected = {}
+    texts = {}
+    for answer in attempt_answers:
+        if answer.answer_text:
+            texts[answer.question_id] = answer.answer_text
+        else:
+            selected[answer.question_id] = list(answer.selected_options)
+    return Submission(selected=selected, texts=texts)
+
+
+def parse_autosave(answer_key, answers):
+    """
+    Проверяет пачку автосохранения {id вопроса: [id вариантов] или текст}
+    и возвращает Submission только с переданными вопросами. Вопросы и
+    варианты, которых нет в ключе теста, отбрасываются.
+    """
+    selected = {}
+    texts = {}
+    if not isinstance(answers, dict):
+        return Submission(selected=selected, texts=texts)
+    for raw_id, value in answers.items():
+        if not str(raw_id).isdigit():
+            continue
+        question_key = answer_key.question(int(raw_id))
+        if question_key is None:
+            continue
+        if question_key.is_text_answer:
+            texts[question_key.id] = normalize_text_answer(value if isinstance(value, str) else '')
+        else:
+            values = value if isinstance(value, list) else [value]
+            option_ids = []
+            for option_id in values:
+                if isinstance(option_id, str) and option_id.isdigit():
+                    option_id = int(option_id)
+                if isinstance(option_id, int) and option_id in question_key.option_ids and option_id not in option_ids:
+                    option_ids.append(option_id)
+            selected[question_key.id] = option_ids if question_key.is_multiple_choice else option_ids[:1]
+    return Submission(selected=selected, texts=texts)
+
+
+def save_answers(attempt, submission):
+    """Записывает ответы попытки одним upsert-запросом и возвращает их число"""
+    rows = [
+        AttemptAnswer(attempt=attempt, question_id=question_id, selected_options=option_ids)
+        for question_id, option_ids in submission.selected.items()
+    ] + [
+        AttemptAnswer(attempt=attempt, question_id=question_id, answer_text=text)
+        for question_id, text in submission.texts.items()
+    ]
+    if rows:
+        AttemptAnswer.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['attempt', 'question'],
+            update_fields=['selected_options', 'answer_text', 'updated_at'],
+        )
+    return len(rows)
+
+
+def student_answer_rows(attempt, answer_key, submission, grades):
+    """Строки StudentAnswer по проверенному ответу (как их сохраняла отправка формы)"""
+    rows = []
+    for question_grade in grades:
+        question_key = answer_key.question(question_grade.question_id)
+        if question_key.is_text_answer:
+            rows.append(StudentAnswer(
+                user_id=attempt.user_id,
+                test_id=attempt.test_id,
+                question_id=question_key.id,
+                answer_text=submission.texts.get(question_key.id),
+                is_correct=question_grade.score == 1,
+                score=question_grade.score,
+            ))
+            continue
+        # Для одиночного выбора сохраняется только первый вариант
+        selected_ids = submission.selected.get(question_key.id, [])
+        stored_ids = selected_ids if question_key.is_multiple_choice else selected_ids[:1]
+        for option_id in stored_ids:
+            is_correct = option_id in question_key.correct_option_ids
+            rows.append(StudentAnswer(
+                user_id=attempt.user_id,
+                test_id=attempt.test_id,
+                question_id=question_key.id,
+                selected_option_id=option_id,
+                is_correct=is_correct,
+                score=question_grade.score if is_correct else 0,
+            ))
+    return rows
+
+
+RESULT_FIELDS = ['status', 'finished_at', 'score', 'total', 'percentage', 'grade', 'passed']
+
+
+def apply_result(attempt, answer_key, grades, finished_at=None):
+    """Выставляет попытке результат и статус завершённой (без записи в базу)"""
+    attempt.set_result(sum(question_grade.score for question_grade in grades), answer_key.total)
+    attempt.status = Attempt.FINISHED
+    attempt.finished_at = finished_at or timezone.now()
+
+
+def finalize_attempt(attempt, answer_key, submission, grades, finished_at=None):
+    """
+    Завершает попытку: выставляет результат и записывает StudentAnswer.
+    Условный UPDATE по статусу не даёт завершить попытку дважды.
+    """
+    apply_result(attempt, answer_key, grades, finished_at)
+    rows = student_answer_rows(attempt, answer_key, submission, grades)
+    with transaction.atomic():
+        updated = Attempt.objects.filter(pk=attempt.pk, status=Attempt.IN_PROGRESS).update(
+            **{field: getattr(attempt, field) for field in RESULT_FIELDS}
+        )
+        if not updated:
+            raise AttemptClosed
+        StudentAnswer.objects.bulk_create(rows)
+        record_finished([attempt])
+        record_mastery([(attempt, grades)])
+    return rows
+
+
+def finalize_attempts(items):
+    """
+    Завершает пачку попыток одной транзакцией. items - тройки
+    (id попытки, Submission, время завершения). Попытки каждого теста
+    проверяются одним вызовом grade_batch (попытки теста с пулом - каждая
+    по своему ключу), уже завершённые пропускаются.
+    Возвращает список завершённых попыток.
+    """
+    by_id = {}
+    for attempt_id, submission, finished_at in items:
+        by_id.setdefault(attempt_id, (submission, finished_at))
+    if not by_id:
+        return []
+    with transaction.atomic():
+        attempts = list(
+            Attempt.objects.select_for_update(of=('self',))
+            .select_related('test__grading_scheme')
+            .filter(pk__in=list(by_id), status=Attempt.IN_PROGRESS)
+            .order_by('test_id', 'id')
+        )
+        rows = []
+        results = []
+        for test_id, group in groupby(attempts, key=attrgetter('test_id')):
+            group = list(group)
+            test = group[0].test
+            # У попытки с выборкой из пула свой ключ, остальные проверяются общим
+            batches = [([attempt], student_answer_key(test, attempt)[0]) for attempt in group if attempt.draw is not None]
+            shared = [attempt for attempt in group if attempt.draw is None]
+            if shared:
+                batches.append((shared, get_answer_key(test_id)))
+            for part, answer_key in batches:
+                submissions = [by_id[attempt.id][0] for attempt in part]
+                batch = grade_batch(answer_key, submissions)
+                for index, attempt in enumerate(part):
+                    grades = batch.row(index)
+                    apply_result(attempt, answer_key, grades, by_id[attempt.id][1])
+                    rows.extend(student_answer_rows(attempt, answer_key, submissions[index], grades))
+                    results.append((attempt, grades))
+        if attempts:
+            Attempt.objects.bulk_update(attempts, RESULT_FIELDS)
+            StudentAnswer.objects.bulk_create(rows)
+            record_finished(attempts)
+            record_mastery(results)
+    return attempts
+
+
+def finalize_expired_attempts(test):
+    """
+    Завершает брошенные попытки теста с истёкшим сроком по сохранённым ответам.
+    Отправленные попытки, которые ещё лежат в журнале очереди записи,
+    пропускаются: их завершит писатель или replay_submissions по
+    отправленной форме, а не по устаревшему автосохранению.
+    Возвращает число завершённых.
+    """
+    from .submissions import unwritten_attempt_ids
+
+    expired = list(Attempt.objects.filter(
+        test=test,
+        status=Attempt.IN_PROGRESS,
+        deadline__lt=timezone.now() - DEADLINE_GRACE,
+    ).prefetch_related('answers'))
+    if expired:
+        unwritten = unwritten_attempt_ids()
+        expired = [attempt for attempt in expired if attempt.id not in unwritten]
+    return len(finalize_attempts(
+        (attempt.id, submission_from_attempt(attempt.answers.all()), attempt.deadline)
+        for attempt in expired
+    ))
@@ -0,0 +1,227 @@
+# main/bank.py
+"""
+Банк вопросов с адресацией по содержимому.
+
+Каждый вопрос хранит content_hash - SHA-256 от нормализованного текста,
+типа ответа, правильного текстового ответа, вариантов (без учёта порядка)
+и содержимого изображения. TestBuilder перед вставкой ищет вопросы с теми
+же хэшами в тестах того же преподавателя и вместо новой копии добавляет в
+тест ссылку (TestQuestion) на существующий вопрос. Вопросы разных
+преподавателей не разделяются: правка одного не меняет тесты другого.
+Вопрос переживает тест, в котором создан (Question.test обнуляется), пока
+на него ссылаются другие тесты; иначе он удаляется вместе с тестом.
+
+merge_duplicates() сливает дубликаты, накопленные до банка: ссылки
+тестов, ответы студентов, сохранённые ответы попыток и усвоение
+переводятся на вопрос с меньшим id, остальные копии удаляются. Попытки
+тестов, в которые входили обе копии, пересчитываются (main/regrade.py).
+"""
+import hashlib
+import json
+import re
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.fields.files import FieldFile
+
+from .analytics import invalidate_item_stats
+from .answer_key import invalidate_answer_key, normalize_text_answer
+from .fragments import bump_content_version
+from .models import AttemptAnswer, Question, QuestionMastery, StudentAnswer, TestQuestion
+from .regrade import regrade_test
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(value):
+    return WHITESPACE.sub(' ', value or '').strip()
+
+
+def image_digest(image):
+    """SHA-256 содержимого изображения; пустая строка, если изображения нет"""
+    if not image:
+        return ''
+    digest = hashlib.sha256()
+    try:
+        image.open('rb')
+        for chunk in image.chunks():
+            digest.update(chunk)
+    except (OSError, ValueError):
+        # Файл пропал из хранилища: различаем хотя бы по имени
+        return f'name:{image.name}'
+    if isinstance(image, FieldFile):
+        image.close()
+    else:
+        # Загруженный файл ещё будет сохранён при вставке вопроса
+        image.seek(0)
+    return digest.hexdigest()
+
+
+def option_key(text, is_correct):
+    return normalize_text(text), bool(is_correct)
+
+
+def question_hash(text, is_text_answer, is_multiple_choice, correct_text_answer, options, image=''):
+    """Хэш содержимого вопроса: options - пары (текст, правильный), image - image_digest()"""
+    content = {
+        'text': normalize_text(text),
+        'type': 'text' if is_text_answer else ('multiple' if is_multiple_choice else 'single'),
+        'answer': normalize_text_answer(correct_text_answer) if is_text_answer else '',
+        'options': [] if is_text_answer else sorted(option_key(*option) for option in options),
+        'image': image,
+    }
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def stored_question_hash(question):
+    """Хэш сохранённого вопроса; варианты лучше предзагрузить (prefetch_related('options'))"""
+    return question_hash(
+        question.text, question.is_text_answer, question.is_multiple_choice, question.correct_text_answer,
+        [(option.text, option.is_correct) for option in question.options.all()],
+        image_digest(question.image),
+    )
+
+
+def existing_questions(hashes, creator):
+    """Вопросы из тестов преподавателя по хэшам: {хэш: вопрос с меньшим id}"""
+    found = {}
+    questions = Question.objects.filter(content_hash__in=set(hashes), test_links__test__creator=creator)
+    for question in questions.distinct().order_by('id'):
+        found.setdefault(question.content_hash, question)
+    return found
+
+
+def fill_hashes(batch_size=500):
+    """Заполняет content_hash вопросам, созданным до банка; возвращает их число"""
+    filled = 0
+    while True:
+        questions = list(Question.objects.filter(content_hash='').prefetch_related('options').order_by('id')[:batch_size])
+        if not questions:
+            return filled
+        for question in questions:
+            question.content_hash = stored_question_hash(question)
+        # bulk_update без сигналов: содержимое вопросов не меняется
+        Question.objects.bulk_update(questions, ['content_hash'])
+        filled += len(questions)
+
+
+def duplicate_hashes():
+    return list(
+        Question.objects.exclude(content_hash='').values('content_hash').order_by('content_hash')
+        .annotate(copies=Count('id')).filter(copies__gt=1).values_list('content_hash', flat=True)
+    )
+
+
+def _owners(question_ids):
+    """{id вопроса: id преподавателя} для вопросов, входящих только в тесты одного преподавателя"""
+    creators = {}
+    links = TestQuestion.objects.filter(question_id__in=question_ids).values_list('question_id', 'test__creator_id')
+    for question_id, creator_id in links:
+        creators.setdefault(question_id, set()).add(creator_id)
+    return {question_id: ids.pop() for question_id, ids in creators.items() if len(ids) == 1}
+
+
+def _sorted_options(question):
+    return sorted(question.options.all(), key=lambda option: (*option_key(option.text, option.is_correct), option.id))
+
+
+def _merge_question(keep, duplicate):
+    """
+    Переводит всё, что ссылается на duplicate, на keep. Возвращает
+    (затронутые тесты, тесты, где были обе копии и попытки нужно пересчитать).
+    """
+    option_map = {
+        old.id: new.id for old, new in zip(_sorted_options(duplicate), _sorted_options(keep))
+    }
+    linked_to_keep = set(TestQuestion.objects.filter(question=keep).values_list('test_id', flat=True))
+    duplicate_links = TestQuestion.objects.filter(question=duplicate)
+    linked_to_duplicate = set(duplicate_links.values_list('test_id', flat=True))
+    # В тестах, где есть обе копии, вторая копия и ответы на неё убираются
+    both = linked_to_keep & linked_to_duplicate
+    StudentAnswer.objects.filter(question=duplicate, test_id__in=both).delete()
+    AttemptAnswer.objects.filter(question=duplicate, attempt__test_id__in=both).delete()
+    # Там оставшаяся копия встаёт на место той, что шла в тесте раньше
+    for test_id, position in duplicate_links.filter(test_id__in=both).values_list('test_id', 'position'):
+        TestQuestion.objects.filter(test_id=test_id, question=keep, position__gt=position).update(position=position)
+    duplicate_links.filter(test_id__in=both).delete()
+    # Ссылка переходит на keep вместе с позицией: порядок вопросов в тестах не меняется
+    duplicate_links.update(question=keep)
+
+    StudentAnswer.objects.filter(question=duplicate, selected_option__isnull=True).update(question=keep)
+    for old_id, new_id in option_map.items():
+        StudentAnswer.objects.filter(question=duplicate, selected_option_id=old_id).update(
+            question=keep, selected_option_id=new_id,
+        )
+    attempt_answers = list(AttemptAnswer.objects.filter(question=duplicate))
+    for answer in attempt_answers:
+        answer.question = keep
+        answer.selected_options = [option_map.get(option_id, option_id) for option_id in answer.selected_options]
+    AttemptAnswer.objects.bulk_update(attempt_answers, ['question', 'selected_options'])
+
+    kept_mastery = {row.user_id: row for row in QuestionMastery.objects.filter(question=keep)}
+    merged = []
+    for row in QuestionMastery.objects.filter(question=duplicate, user_id__in=list(kept_mastery)):
+        target = kept_mastery[row.user_id]
+        if row.last_seen_at > target.last_seen_at:
+            target.strength, target.last_score, target.last_seen_at = row.strength, row.last_score, row.last_seen_at
+        target.answer_count += row.answer_count
+        merged.append(target)
+    QuestionMastery.objects.bulk_update(merged, ['strength', 'answer_count', 'last_score', 'last_seen_at'])
+    QuestionMastery.objects.filter(question=duplicate, user_id__in=list(kept_mastery)).delete()
+    QuestionMastery.objects.filter(question=duplicate).update(question=keep)
+
+    if keep.test_id is None and duplicate.test_id is not None:
+        Question.objects.filter(pk=keep.pk).update(test_id=duplicate.test_id)
+    duplicate.delete()
+    return linked_to_keep | linked_to_duplicate, both
+
+
+def merge_duplicates(batch_size=100, dry_run=False):
+    """
+    Сливает вопросы с одинаковым content_hash из тестов одного
+    преподавателя пачками по batch_size хэшей, каждая пачка - в своей
+    транзакции. Возвращает число удалённых копий.
+    """
+    hashes = duplicate_hashes()
+    removed = 0
+    for start in range(0, len(hashes), batch_size):
+        batch = hashes[start:start + batch_size]
+        with transaction.atomic():
+            questions = list(
+                Question.objects.select_for_update().filter(content_hash__in=batch)
+                .prefetch_related('options').order_by('content_hash', 'id')
+            )
+            owners = _owners([question.pk for question in questions])
+            groups = {}
+            for question in questions:
+                # Вопросы без тестов и общие для нескольких преподавателей не сливаются
+                if question.pk in owners:
+                    groups.setdefault((question.content_hash, owners[question.pk]), []).append(question)
+            tests = set()
+            regrade = set()
+            for keep, *duplicates in groups.values():
+                for duplicate in duplicates:
+                    removed += 1
+                    if not dry_run:
+                        touched, both = _merge_question(keep, duplicate)
+                        tests |= touched
+                        regrade |= both
+            if dry_run:
+                continue
+            for test_id in tests:
+                invalidate_answer_key(test_id)
+                bump_content_version(test_id)
+                invalidate_item_stats(test_id)
+            # Из этих тестов убран вопрос вместе с ответами: баллы попыток считаются заново
+            for test_id in sorted(regrade):
+                regrade_test(test_id)
+    return removed
+
+
+def prune_orphans(question_ids=None):
+    """Удаляет вопросы удалённых тестов, которые не входят ни в один другой тест"""
+    orphans = Question.objects.filter(test__isnull=True, test_links__isnull=True, studentanswer__isnull=True)
+    if question_ids is not None:
+        orphans = orphans.filter(pk__in=question_ids)
+    _, deleted = Question.objects.filter(pk__in=list(orphans.values_list('pk', flat=True))).delete()
+    return deleted.get(Question._meta.label, 0)
@@ -0,0 +1,55 @@
+# main/benchmarks/__init__.py
+"""
+Замеры производительности, запускаемые командой `manage.py benchmark <имя>`.
+
+Каждый замер работает на временной базе (как тесты Django), поэтому
+рабочая база не меняется.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def temporary_database(on_disk=False):
+    """
+    Создаёт тестовую базу с применёнными миграциями и удаляет её после замера.
+    on_disk - SQLite в файле, а не в памяти: нужно замерам с параллельными потоками.
+    """
+    setup_test_environment()
+    if on_disk and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def timer(results, name):
+    started = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - started
+
+
+def registry():
+    """Имя замера -> функция run(stdout, **options); run может вернуть список нарушений"""
+    from . import asgi, codes, concurrency, images, routes, submissions
+    return {
+        'asgi': asgi.run,
+        'codes': codes.run,
+        'concurrency': concurrency.run,
+        'images': images.run,
+        'routes': routes.run,
+        'submissions': submissions.run,
+    }
+
+
+# Замеры, которым нужна база в файле
+ON_DISK = {'asgi', 'concurrency', 'submissions'}
@@ -0,0 +1,170 @@
+# main/benchmarks/asgi.py
+"""
+Пропускная способность страниц прохождения теста: WSGI против ASGI.
+
+N студентов одновременно открывают тест, шлют автосохранение и вводят
+код теста. WSGI - по потоку на клиента и синхронные представления
+main.views, как в многопоточном сервере. ASGI - один цикл событий,
+AsyncClient на клиента и представления main.async_views, как под
+uvicorn. Оба варианта идут через полный стек middleware Django на одной
+базе в файле с настройками main.db; HTTP-сервер в замер не входит.
+Выводятся запросы в секунду, задержки p50/p95 и число ошибок.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from main import async_views, urls, views
+from main.builders import TestBuilder
+from main.models import Attempt
+
+from .datagen import create_users
+
+DEFAULT_SIZES = (10, 50)  # Число одновременных клиентов
+QUESTIONS = 20
+DURATION = 5.0
+
+
+def urlconf(module):
+    """URLconf приложения, в котором страницы прохождения теста взяты из module"""
+    attempt_patterns = urls.attempt_patterns(module)
+    names = {pattern.name for pattern in attempt_patterns}
+
+    class URLConf:
+        urlpatterns = [pattern for pattern in urls.urlpatterns if pattern.name not in names] + attempt_patterns
+
+    return URLConf
+
+
+def make_exam(creator, clients, label):
+    builder = TestBuilder(creator)
+    builder.add_test(
+        title=f'Экзамен {label}',
+        description='',
+        time_limit=600,
+        questions=[
+            {
+                'text': f'Вопрос {number}',
+                'options': [{'text': f'Вариант {option}', 'is_correct': option == 0} for option in range(4)],
+            }
+            for number in range(QUESTIONS)
+        ],
+    )
+    test, = builder.save()
+    return test, create_users(label, clients, 'student')
+
+
+def requests_for(test, rng, question_options):
+    """Следующий запрос клиента: (метод, url, данные, content_type)"""
+    kind = rng.random()
+    if kind < 0.6:
+        question_id, option_ids = rng.choice(question_options)
+        body = json.dumps({'answers': {str(question_id): [rng.choice(option_ids)]}})
+        return 'post', reverse('autosave_answers', args=[test.id]), body, 'application/json'
+    if kind < 0.8:
+        return 'get', reverse('start_test', args=[test.id]), None, None
+    return 'post', reverse('enter_test_code'), {'code': test.code}, None
+
+
+def send(client, request):
+    method, url, data, content_type = request
+    if method == 'get':
+        return client.get(url)
+    if content_type:
+        return client.post(url, data, content_type=content_type)
+    return client.post(url, data)
+
+
+def run_wsgi(test, students, question_options, duration):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def student(user):
+        client = Client()
+        rng = random.Random(user.id)
+        try:
+            client.force_login(user)
+            client.get(reverse('start_test', args=[test.id]))
+            while time.monotonic() < stop_at:
+                request = requests_for(test, rng, question_options)
+                started = time.perf_counter()
+                try:
+                    ok = send(client, request).status_code < 400
+                except Exception:
+                    ok = False
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    if not ok:
+                        errors.append(request[1])
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=student, args=(user,)) for user in students]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+
+async def run_asgi(test, students, question_options, duration):
+    latencies = []
+    errors = []
+    stop_at = time.monotonic() + duration
+
+    async def student(user):
+        client = AsyncClient()
+        rng = random.Random(user.id)
+        await client.aforce_login(user)
+        await client.get(reverse('start_test', args=[test.id]))
+        while time.monotonic() < stop_at:
+            request = requests_for(test, rng, question_options)
+            started = time.perf_counter()
+            try:
+                ok = (await send(client, request)).status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors.append(request[1])
+
+    await asyncio.gather(*(student(user) for user in students))
+    return sorted(latencies), errors
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000 if values else 0.0
+
+
+def run(stdout, sizes=DEFAULT_SIZES, duration=DURATION, **options):
+    creator = User.objects.create_user('benchmark_teacher')
+    stdout.write(f'{"сервер":>6} | {"клиентов":>8} | {"запросов/с":>10} | {"p50, мс":>8} | {"p95, мс":>8} | {"ошибок":>6}')
+    for clients in sizes:
+        for mode in ('wsgi', 'asgi'):
+            test, students = make_exam(creator, clients, f'{mode}{clients}')
+            question_options = [
+                (question.id, [option.id for option in question.options.all()])
+                for question in test.questions.prefetch_related('options')
+            ]
+            connections.close_all()
+            module = async_views if mode == 'asgi' else views
+            with override_settings(ROOT_URLCONF=urlconf(module), SUBMISSION_QUEUE_ENABLED=False):
+                if mode == 'asgi':
+                    latencies, errors = asyncio.run(run_asgi(test, students, question_options, duration))
+                else:
+                    latencies, errors = run_wsgi(test, students, question_options, duration)
+            connections.close_all()
+            Attempt.objects.filter(test=test).delete()
+            stdout.write(
+                f'{mode:>6} | {clients:>8} | {len(latencies) / duration:>10.1f} | {percentile(latencies, 0.5):>8.1f} | '
+                f'{percentile(latencies, 0.95):>8.1f} | {len(errors):>6}'
+            )
@@ -0,0 +1,67 @@
+# main/benchmarks/codes.py
+"""
+Стоимость выдачи кода теста в зависимости от размера таблицы Test.
+
+Для каждого размера таблица дозаполняется строками, после чего
+замеряется среднее время выдачи одного кода и число запросов:
+старый способ (случайный код + проверка exists() в цикле) и счётчик
+с ключевой перестановкой.
+"""
+import random
+import string
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from main.models import Test
+from main.utils import generate_unique_code
+
+DEFAULT_SIZES = (0, 10_000, 100_000, 1_000_000)
+FILL_BATCH = 5_000
+
+
+def random_code_with_check():
+    """Прежняя реализация generate_unique_code, для сравнения"""
+    for _ in range(100):
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        if not Test.objects.filter(code=code).exists():
+            return code
+    raise Exception("Не удалось сгенерировать уникальный код теста.")
+
+
+def fill_tests(creator, start, stop):
+    for batch_start in range(start, stop, FILL_BATCH):
+        batch_stop = min(stop, batch_start + FILL_BATCH)
+        Test.objects.bulk_create([
+            # Коды-заполнители вида F000000123 не пересекаются с выдаваемыми на практике
+            Test(title=f'Тест {i}', description='', creator=creator, code=f'F{i:09d}', time_limit=10)
+            for i in range(batch_start, batch_stop)
+        ], batch_size=FILL_BATCH)
+
+
+def measure(function, repeat):
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        elapsed = time.perf_counter() - started
+    return elapsed / repeat * 1e6, len(queries) / repeat
+
+
+def run(stdout, sizes=DEFAULT_SIZES, repeat=500, **options):
+    creator = User.objects.create_user('benchmark_teacher')
+    stdout.write(f'{"строк в Test":>14} | {"старый, мкс":>12} | {"запросов":>8} | {"новый, мкс":>11} | {"запросов":>8}')
+    filled = 0
+    for size in sizes:
+        fill_tests(creator, filled, size)
+        filled = max(filled, size)
+        old_time, old_queries = measure(random_code_with_check, repeat)
+        new_time, new_queries = measure(generate_unique_code, repeat)
+        stdout.write(f'{filled:>14} | {old_time:>12.1f} | {old_queries:>8.1f} | {new_time:>11.1f} | {new_queries:>8.1f}')
@@ -0,0 +1,150 @@
+# main/benchmarks/concurrency.py
+"""
+Параллельные читатели и писатели против настоящих представлений.
+
+Читатели открывают кабинет студента, писатели шлют
+автосохранение ответов. Нагрузка прогоняется дважды на базе в файле:
+с настройками SQLite по умолчанию (журнал DELETE, synchronous=FULL,
+подключение на каждый запрос) и с настройками из main.db (WAL,
+busy_timeout, постоянные подключения). Выводится число запросов в
+секунду для чтения и записи и число ошибок.
+"""
+import json
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client, override_settings
+
+from main.builders import TestBuilder
+from main.db import DEFAULT_SQLITE_PRAGMAS
+from main.models import Attempt
+
+DEFAULT_SIZES = (40,)  # Число одновременных клиентов (половина читает, половина пишет)
+QUESTIONS = 20
+DURATION = 5.0
+
+PROFILES = {
+    'по умолчанию': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+        'conn_max_age': 0,
+        'transaction_mode': None,
+    },
+    'main.db': {
+        # Файл прогона переключается в WAL явно: предыдущий профиль вернул журнал DELETE
+        'pragmas': {'journal_mode': 'WAL', **DEFAULT_SQLITE_PRAGMAS},
+        'conn_max_age': 60,
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+
+
+def make_exam(creator, clients, label):
+    builder = TestBuilder(creator)
+    builder.add_test(
+        title='Нагрузочный тест',
+        description='',
+        time_limit=600,
+        questions=[
+            {
+                'text': f'Вопрос {number}',
+                'options': [{'text': f'Вариант {option}', 'is_correct': option == 0} for option in range(4)],
+            }
+            for number in range(QUESTIONS)
+        ],
+    )
+    test, = builder.save()
+    students = []
+    for number in range(clients):
+        user = User.objects.create_user(f'{label}_{number}')
+        user.profile.role = 'student'
+        user.profile.save()
+        students.append(user)
+    return test, students
+
+
+def apply_profile(profile):
+    database = connections.settings['default']
+    database['CONN_MAX_AGE'] = profile['conn_max_age']
+    options = database.setdefault('OPTIONS', {})
+    if profile['transaction_mode']:
+        options['transaction_mode'] = profile['transaction_mode']
+    else:
+        options.pop('transaction_mode', None)
+
+
+def run_load(test, students, duration):
+    counts = {'read': 0, 'write': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    question_options = [
+        (question.id, [option.id for option in question.options.all()])
+        for question in test.questions.prefetch_related('options')
+    ]
+
+    def student(user, writer):
+        client = Client()
+        rng = random.Random(user.id)
+        try:
+            try:
+                client.force_login(user)
+                if writer:
+                    client.get(f'/test/{test.id}/start/')
+            except Exception:
+                with lock:
+                    counts['errors'] += 1
+                return
+            while time.monotonic() < stop_at:
+                try:
+                    if writer:
+                        question_id, option_ids = rng.choice(question_options)
+                        response = client.post(
+                            f'/test/{test.id}/autosave/',
+                            json.dumps({'answers': {str(question_id): [rng.choice(option_ids)]}}),
+                            content_type='application/json',
+                        )
+                    else:
+                        response = client.get('/dashboard/student/')
+                    ok = response.status_code == 200
+                except Exception:
+                    ok = False
+                with lock:
+                    if ok:
+                        counts['write' if writer else 'read'] += 1
+                    else:
+                        counts['errors'] += 1
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=student, args=(user, index % 2 == 0))
+        for index, user in enumerate(students)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def run(stdout, sizes=DEFAULT_SIZES, duration=DURATION, **options):
+    creator = User.objects.create_user('benchmark_teacher')
+    stdout.write(f'{"настройки":>14} | {"клиентов":>8} | {"чтений/с":>9} | {"записей/с":>9} | {"ошибок":>6}')
+    for clients in sizes:
+        for number, (name, profile) in enumerate(PROFILES.items()):
+            run_profile(stdout, creator, clients, name, profile, f'load{clients}_{number}', duration)
+
+
+def run_profile(stdout, creator, clients, name, profile, label, duration):
+    test, students = make_exam(creator, clients, label)
+    connections.close_all()
+    apply_profile(profile)
+    with override_settings(SQLITE_PRAGMAS=profile['pragmas'], SUBMISSION_QUEUE_ENABLED=False):
+        counts = run_load(test, students, duration)
+    connections.close_all()
+    Attempt.objects.filter(test=test).delete()
+    stdout.write(
+        f'{name:>14} | {clients:>8} | {counts["read"] / duration:>9.1f} | {counts["write"] / duration:>9.1f} | {counts["errors"]:>6}'
+    )
@@ -0,0 +1,149 @@
+# main/benchmarks/datagen.py
+"""
+Генератор синтетических данных для замеров.
+
+DataSpec описывает объём: преподаватели, тесты у каждого, вопросы в
+тесте, варианты в вопросе, студенты и попытки на студента. Данные
+пишутся пачками (bulk_create), попытки проверяются тем же движком,
+что и настоящие отправки, поэтому результаты согласованы с ответами.
+"""
+import random
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from main.answer_key import get_answer_key
+from main.attempts import apply_result, student_answer_rows
+from main.builders import TestBuilder
+from main.grading import Submission, grade_batch
+from main.models import Attempt, Profile, StudentAnswer
+from main.mastery import rebuild_mastery
+from main.stats import rebuild_stats, rebuild_test_counters
+
+
+class DataSpec(NamedTuple):
+    teachers: int = 1
+    tests_per_teacher: int = 2
+    questions: int = 5
+    options: int = 4
+    students: int = 5
+    attempts_per_student: int = 2
+
+    @classmethod
+    def scaled(cls, size):
+        """Объём, у которого с size растут и число строк, и размер каждой страницы"""
+        tests_per_teacher = 2 + size // 10
+        teachers = 1 + size // 20
+        return cls(
+            teachers=teachers,
+            tests_per_teacher=tests_per_teacher,
+            questions=5 + size // 5,
+            options=4,
+            students=size,
+            attempts_per_student=min(teachers * tests_per_teacher, 2 + size // 10),
+        )
+
+
+class World(NamedTuple):
+    """Созданные данные и объекты, с которыми работают замеры"""
+    spec: DataSpec
+    teachers: list
+    students: list
+    tests: list
+
+    @property
+    def teacher(self):
+        return self.teachers[0]
+
+    @property
+    def student(self):
+        return self.students[0]
+
+    @property
+    def test(self):
+        return self.tests[0]
+
+
+def create_users(prefix, count, role):
+    users = User.objects.bulk_create([User(username=f'{prefix}_{role}_{number}') for number in range(count)])
+    # bulk_create не вызывает сигнал, создающий профиль
+    Profile.objects.bulk_create([Profile(user=user, role=role) for user in users])
+    return users
+
+
+def question_data(number, options, label=''):
+    """label делает текст уникальным, иначе банк вопросов объединит одинаковые вопросы разных тестов"""
+    kind = number % 3
+    if kind == 2:
+        return {'text': f'{label}Вопрос {number}', 'is_text_answer': True, 'correct_text_answer': f'ответ {number}'}
+    return {
+        'text': f'{label}Вопрос {number}',
+        'is_multiple_choice': kind == 1,
+        'options': [
+            {'text': f'Вариант {option}', 'is_correct': option == 0 or (kind == 1 and option == 1)}
+            for option in range(options)
+        ],
+    }
+
+
+def random_submission(rng, answer_key):
+    selected = {}
+    texts = {}
+    for question_key in answer_key.questions:
+        if question_key.is_text_answer:
+            texts[question_key.id] = question_key.text_matcher.sample if rng.random() < 0.5 else 'неверно'
+        else:
+            option_ids = sorted(question_key.option_ids)
+            count = rng.randint(1, 2) if question_key.is_multiple_choice else 1
+            selected[question_key.id] = rng.sample(option_ids, min(count, len(option_ids)))
+    return Submission(selected=selected, texts=texts)
+
+
+def generate(spec, prefix='bench', seed=0):
+    """Создаёт данные по spec; prefix делает имена уникальными при повторных вызовах"""
+    rng = random.Random(seed)
+    teachers = create_users(prefix, spec.teachers, 'teacher')
+    students = create_users(prefix, spec.students, 'student')
+
+    tests = []
+    for teacher in teachers:
+        builder = TestBuilder(teacher)
+        for number in range(spec.tests_per_teacher):
+            builder.add_test(
+                title=f'{prefix} тест {number}',
+                description='Синтетический тест',
+                time_limit=30,
+                grading={'name': 'Мои настройки'},
+                questions=[
+                    question_data(question, spec.options, f'{teacher.username}, тест {number}. ')
+                    for question in range(spec.questions)
+                ],
+            )
+        tests.extend(builder.save())
+
+    answer_keys = {test.id: get_answer_key(test.id) for test in tests}
+    finished_at = timezone.now() - timedelta(days=1)
+    attempts = []
+    answers = []
+    for index, student in enumerate(students):
+        chosen = rng.sample(tests, min(spec.attempts_per_student, len(tests)))
+        if index == 0 and tests[0] not in chosen:
+            # У первого студента всегда есть результат по первому тесту - его открывают замеры
+            chosen[0] = tests[0]
+        for test in chosen:
+            attempt = Attempt(user=student, test=test, started_at=finished_at - timedelta(minutes=20))
+            answer_key = answer_keys[test.id]
+            submission = random_submission(rng, answer_key)
+            grades = grade_batch(answer_key, [submission]).row(0)
+            apply_result(attempt, answer_key, grades, finished_at)
+            attempts.append(attempt)
+            answers.extend(student_answer_rows(attempt, answer_key, submission, grades))
+    Attempt.objects.bulk_create(attempts, batch_size=1000)
+    StudentAnswer.objects.bulk_create(answers, batch_size=1000)
+    # Попытки записаны в обход завершения, поэтому сводки считаются целиком
+    rebuild_stats([student.id for student in students])
+    rebuild_test_counters([test.id for test in tests])
+    rebuild_mastery([student.id for student in students])
+    return World(spec=spec, teachers=teachers, students=students, tests=tests)
@@ -0,0 +1,82 @@
+# main/benchmarks/images.py
+"""
+Объём изображений, который экзамен передаёт студентам.
+
+Экзамен из IMAGES вопросов с фотографиями размера, как с телефона,
+проходят N студентов. Сравнивается передача оригиналов (как раньше) и
+копий, которые браузер выберет из srcset для области шириной 600 CSS
+пикселей: 640 на обычном экране и 1280 на экране с плотностью 2.
+Копии строятся той же функцией, что и в фоновом потоке, во временном
+MEDIA_ROOT.
+"""
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+
+from main.builders import TestBuilder
+from main.models import Question
+
+DEFAULT_SIZES = (300,)  # Число студентов
+IMAGES = 30
+PHOTO_SIZE = (3000, 2000)
+
+
+def photo(rng):
+    """Снимок с деталями: увеличенный шум сжимается примерно как фотография"""
+    small = (PHOTO_SIZE[0] // 4, PHOTO_SIZE[1] // 4)
+    channels = [Image.effect_noise(small, rng.randint(40, 80)) for _ in range(3)]
+    image = Image.merge('RGB', channels).resize(PHOTO_SIZE, Image.Resampling.BICUBIC)
+    tint = Image.new('RGB', PHOTO_SIZE, tuple(rng.randint(60, 200) for _ in range(3)))
+    image = Image.blend(tint, image, 0.5)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def run(stdout, sizes=DEFAULT_SIZES, **options):
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root, IMAGE_WORKER_ENABLED=False):
+            run_sizes(stdout, sizes, media_root)
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+def run_sizes(stdout, sizes, media_root):
+    rng = random.Random(IMAGES)
+    builder = TestBuilder(User.objects.create_user('benchmark_teacher'))
+    builder.add_test(title='Экзамен с изображениями', description='', time_limit=60, questions=[
+        {
+            'text': f'Вопрос {number}',
+            'image': SimpleUploadedFile(f'photo{number}.jpg', photo(rng), content_type='image/jpeg'),
+            'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}],
+        }
+        for number in range(IMAGES)
+    ])
+    started = time.perf_counter()
+    # Без фонового потока копии строятся сразу после коммита
+    test, = builder.save()
+    elapsed = time.perf_counter() - started
+
+    questions = list(Question.objects.filter(test=test))
+    original = sum(question.image.size for question in questions)
+
+    def variant_bytes(width):
+        return sum(os.path.getsize(os.path.join(media_root, question.image_variants[str(width)])) for question in questions)
+
+    stdout.write(f'Тест с {IMAGES} изображениями сохранён вместе с копиями за {elapsed:.1f} с')
+    stdout.write(f'{"вариант":>14} | {"на студента, МБ":>15} | {"студентов":>9} | {"всего, МБ":>9} | {"меньше в":>8}')
+    for students in sizes:
+        for label, total in (('оригинал', original), ('webp 640', variant_bytes(640)), ('webp 1280', variant_bytes(1280))):
+            stdout.write(
+                f'{label:>14} | {total / 2 ** 20:>15.2f} | {students:>9} | {total * students / 2 ** 20:>9.1f} | '
+                f'{original / total:>8.1f}'
+            )
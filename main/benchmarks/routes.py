@@ -0,0 +1,254 @@
+# main/benchmarks/routes.py
+"""
+Число запросов, время базы и полное время ответа для каждого маршрута main/urls.py.
+
+Для каждого размера данных (DataSpec.scaled) генерируется новый набор
+данных поверх уже созданных, и каждый маршрут вызывается тестовым
+клиентом. Замер идёт после прогрева кэшей и берётся медиана повторов.
+Результаты сравниваются с базовыми значениями из baselines.json:
+
+- число запросов маршрута не должно расти с размером данных (N+1);
+- число запросов не должно превышать базовое;
+- время ответа не должно превышать базовое больше чем на threshold.
+
+`manage.py benchmark routes --update-baseline` перезаписывает базовые значения.
+"""
+import json
+import os
+import statistics
+import time
+from typing import NamedTuple
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main import urls
+from main.models import Profile
+
+from .datagen import DataSpec, generate
+
+DEFAULT_SIZES = (5, 20, 60)
+REPEAT = 5
+THRESHOLD = 0.5  # Допустимый рост времени ответа относительно базового
+# Абсолютный запас, чтобы шум таймера не ронял замер быстрых страниц
+SLACK_MS = 5.0
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+
+class Route(NamedTuple):
+    user: str  # 'teacher', 'student', 'fresh_student' (без попыток) или 'anonymous'
+    method: str
+    url: object  # функция world -> url
+    data: object = None  # функция world -> данные запроса
+    content_type: str = None
+
+
+def _answers(test):
+    data = {}
+    for question in test.questions.prefetch_related('options'):
+        if question.is_text_answer:
+            data[f'answer_{question.id}'] = 'ответ'
+        else:
+            data[f'answer_{question.id}'] = [str(option.id) for option in question.options.all()[:1]]
+    return data
+
+
+def _autosave(test):
+    question = test.questions.order_by('id').first()
+    return json.dumps({'answers': {str(question.id): 'ответ'}})
+
+
+ROUTES = {
+    'index': Route('student', 'get', lambda world: reverse('index')),
+    'register': Route('anonymous', 'get', lambda world: reverse('register')),
+    'login': Route('anonymous', 'get', lambda world: reverse('login')),
+    'logout': Route('student', 'get', lambda world: reverse('logout')),
+    'create_test': Route('teacher', 'get', lambda world: reverse('create_test')),
+    'import_tests': Route('teacher', 'get', lambda world: reverse('import_tests')),
+    'start_test': Route('fresh_student', 'get', lambda world: reverse('start_test', args=[world.test.id])),
+    'submit_answers': Route(
+        'started_student', 'post',
+        lambda world: reverse('submit_answers', args=[world.test.id]),
+        lambda world: _answers(world.test),
+    ),
+    'autosave_answers': Route(
+        'started_student', 'post',
+        lambda world: reverse('autosave_answers', args=[world.test.id]),
+        lambda world: _autosave(world.test),
+        'application/json',
+    ),
+    'test_result': Route('student', 'get', lambda world: reverse('test_result', args=[world.test.id])),
+    'enter_test_code': Route(
+        'student', 'post', lambda world: reverse('enter_test_code'), lambda world: {'code': world.test.code},
+    ),
+    'test_created': Route('teacher', 'get', lambda world: reverse('test_created', args=[world.test.code])),
+    'test_detail': Route('teacher', 'get', lambda world: reverse('test_detail', args=[world.test.id])),
+    'teacher_dashboard': Route('teacher', 'get', lambda world: reverse('teacher_dashboard')),
+    'student_dashboard': Route('student', 'get', lambda world: reverse('student_dashboard')),
+    'toggle_test_active': Route('teacher', 'get', lambda world: reverse('toggle_test_active', args=[world.test.id])),
+    'test_results': Route('teacher', 'get', lambda world: reverse('test_results', args=[world.test.id])),
+    'export_test_results': Route(
+        'teacher', 'get', lambda world: reverse('export_test_results', args=[world.test.id]) + '?questions=1',
+    ),
+    'test_item_analysis': Route('teacher', 'get', lambda world: reverse('test_item_analysis', args=[world.test.id])),
+    'regrade_test_results': Route(
+        'teacher', 'post', lambda world: reverse('regrade_test_results', args=[world.test.id]), lambda world: {},
+    ),
+    'generate_custom_test': Route('student', 'get', lambda world: reverse('generate_custom_test')),
+    'search': Route('teacher', 'get', lambda world: reverse('search') + '?q=тест'),
+    'metrics': Route('anonymous', 'get', lambda world: reverse('metrics')),
+}
+
+
+def missing_routes():
+    """Маршруты main/urls.py, для которых не описан замер"""
+    return sorted(pattern.name for pattern in urls.urlpatterns if pattern.name not in ROUTES)
+
+
+# Управление транзакциями не считается: внутри TestCase вместо BEGIN выполняются SAVEPOINT и RELEASE
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+class Recorder:
+    """Считает запросы и время их выполнения через execute_wrapper"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                self.queries += 1
+
+
+def _fresh_student(prefix):
+    user = User.objects.create_user(prefix)
+    Profile.objects.filter(user=user).update(role='student')
+    return User.objects.get(pk=user.pk)
+
+
+def _client_for(route, world, counter):
+    client = Client()
+    if route.user == 'anonymous':
+        return client
+    if route.user in ('fresh_student', 'started_student'):
+        user = _fresh_student(f'route_student_{counter}')
+        if route.user == 'started_student':
+            client.force_login(user)
+            client.get(reverse('start_test', args=[world.test.id]))
+    else:
+        user = world.teacher if route.user == 'teacher' else world.student
+    client.force_login(user)
+    return client
+
+
+def _request(client, route, world):
+    kwargs = {}
+    if route.content_type:
+        kwargs['content_type'] = route.content_type
+    data = route.data(world) if route.data else None
+    method = getattr(client, route.method)
+    response = method(route.url(world), data, **kwargs) if data is not None else method(route.url(world))
+    if response.streaming:
+        # Запросы потоковой выгрузки выполняются при чтении тела
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure_route(name, route, world, repeat=REPEAT):
+    """Медианы (запросы, время базы в мс, время ответа в мс) для маршрута; первый вызов - прогрев"""
+    samples = []
+    for index in range(repeat + 1):
+        client = _client_for(route, world, f'{name}_{id(world)}_{index}')
+        recorder = Recorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = _request(client, route, world)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise AssertionError(f'{name}: ответ {response.status_code}')
+        if name == 'toggle_test_active':
+            # Возвращаем тест в исходное состояние для следующих замеров
+            client.get(route.url(world))
+        if index:
+            samples.append((recorder.queries, recorder.seconds * 1000, elapsed * 1000))
+    return (
+        max(sample[0] for sample in samples),
+        statistics.median(sample[1] for sample in samples),
+        statistics.median(sample[2] for sample in samples),
+    )
+
+
+def collect(sizes, repeat=REPEAT, routes=None):
+    """Результаты {маршрут: {размер: {'queries', 'db_ms', 'wall_ms'}}}"""
+    routes = routes or ROUTES
+    results = {name: {} for name in routes}
+    with override_settings(SUBMISSION_QUEUE_ENABLED=False):
+        for size in sizes:
+            world = generate(DataSpec.scaled(size), prefix=f'size{size}', seed=size)
+            for name, route in routes.items():
+                queries, db_ms, wall_ms = measure_route(name, route, world, repeat)
+                results[name][str(size)] = {'queries': queries, 'db_ms': round(db_ms, 2), 'wall_ms': round(wall_ms, 2)}
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump(results, baseline, ensure_ascii=False, indent=2, sort_keys=True)
+        baseline.write('\n')
+
+
+def check(results, baseline, threshold=THRESHOLD, check_latency=True):
+    """Список нарушений: рост запросов с размером данных и регрессии относительно базовых значений"""
+    failures = []
+    for name, by_size in results.items():
+        sizes = sorted(by_size, key=int)
+        counts = [by_size[size]['queries'] for size in sizes]
+        if counts and max(counts) > counts[0]:
+            failures.append(f'{name}: число запросов растёт с данными ({", ".join(map(str, counts))})')
+        for size in sizes:
+            expected = baseline.get(name, {}).get(size)
+            if not expected:
+                continue
+            current = by_size[size]
+            if current['queries'] > expected['queries']:
+                failures.append(f'{name} [{size}]: запросов {current["queries"]}, базовое {expected["queries"]}')
+            limit = expected['wall_ms'] * (1 + threshold) + SLACK_MS
+            if check_latency and current['wall_ms'] > limit:
+                failures.append(f'{name} [{size}]: {current["wall_ms"]:.1f} мс, допустимо {limit:.1f} мс')
+    return failures
+
+
+def run(stdout, sizes=DEFAULT_SIZES, repeat=REPEAT, update_baseline=False, threshold=THRESHOLD, **options):
+    missing = missing_routes()
+    if missing:
+        return [f'Нет замера для маршрутов: {", ".join(missing)}']
+    results = collect(sizes, repeat)
+    stdout.write(f'{"маршрут":>22} | {"размер":>6} | {"запросов":>8} | {"база, мс":>8} | {"ответ, мс":>9}')
+    for name, by_size in results.items():
+        for size, values in by_size.items():
+            stdout.write(
+                f'{name:>22} | {size:>6} | {values["queries"]:>8} | {values["db_ms"]:>8.2f} | {values["wall_ms"]:>9.2f}'
+            )
+    if update_baseline:
+        save_baseline(results)
+        stdout.write(f'Базовые значения сохранены в {BASELINE_PATH}')
+        return []
+    failures = check(results, load_baseline(), threshold)
+    for failure in failures:
+        stdout.write(failure)
+    return failures
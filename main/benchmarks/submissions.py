@@ -0,0 +1,154 @@
+# main/benchmarks/submissions.py
+"""
+Всплеск отправок в конце экзамена: N студентов завершают тест одновременно.
+
+Сравниваются запись попытки прямо в запросе (finalize_attempt в каждом
+потоке) и очередь отложенной записи (SubmissionQueue). Для каждого
+способа выводятся задержки "запроса" (p50, p95, максимум), число ошибок
+блокировки базы и время, за которое все попытки оказались в базе.
+"""
+import queue
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from main.answer_key import get_answer_key
+from main.attempts import AttemptClosed, finalize_attempt
+from main.builders import TestBuilder
+from main.grading import Submission, grade_submission
+from main.models import Attempt
+from main.submissions import SubmissionQueue
+
+DEFAULT_SIZES = (200, 1000)
+QUESTIONS = 20
+WORKERS = 32
+
+
+def make_exam(creator, students, label):
+    builder = TestBuilder(creator)
+    builder.add_test(
+        title=f'Экзамен {label}',
+        description='',
+        time_limit=60,
+        questions=[
+            {
+                'text': f'Вопрос {number}',
+                'is_multiple_choice': number % 2 == 1,
+                'options': [{'text': f'Вариант {option}', 'is_correct': option < 1 + number % 2} for option in range(4)],
+            }
+            for number in range(QUESTIONS)
+        ],
+    )
+    test, = builder.save()
+    users = User.objects.bulk_create([User(username=f'{label}_{number}') for number in range(students)])
+    now = timezone.now()
+    Attempt.objects.bulk_create([
+        Attempt(user=user, test=test, status=Attempt.IN_PROGRESS, started_at=now,
+                deadline=now + timedelta(hours=1), finished_at=None)
+        for user in users
+    ])
+    attempts = list(Attempt.objects.filter(test=test).select_related('test__grading_scheme'))
+    answer_key = get_answer_key(test.id)
+    rng = random.Random(len(attempts))
+    submissions = [
+        Submission(
+            selected={
+                question_key.id: rng.sample(sorted(question_key.option_ids), 1 + question_key.is_multiple_choice)
+                for question_key in answer_key.questions
+            },
+            texts={},
+        )
+        for _ in attempts
+    ]
+    return test, answer_key, list(zip(attempts, submissions))
+
+
+def run_burst(jobs, handle):
+    """Выполняет handle(attempt, submission) в WORKERS потоках, возвращает задержки и число ошибок"""
+    tasks = queue.Queue()
+    for job in jobs:
+        tasks.put(job)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                try:
+                    attempt, submission = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.perf_counter()
+                try:
+                    handle(attempt, submission)
+                except OperationalError:
+                    with lock:
+                        errors.append(attempt.id)
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000 if values else 0.0
+
+
+def report(stdout, label, students, latencies, errors, elapsed):
+    finished = Attempt.objects.filter(test__title=f'Экзамен {label}', status=Attempt.FINISHED).count()
+    stdout.write(
+        f'{label:>9} | {students:>9} | {percentile(latencies, 0.5):>8.1f} | {percentile(latencies, 0.95):>8.1f} | '
+        f'{percentile(latencies, 1.0):>8.1f} | {len(errors):>6} | {finished:>9} | {elapsed:>7.2f}'
+    )
+
+
+def run(stdout, sizes=DEFAULT_SIZES, **options):
+    creator = User.objects.create_user('benchmark_teacher')
+    stdout.write(
+        f'{"способ":>9} | {"студентов":>9} | {"p50, мс":>8} | {"p95, мс":>8} | {"макс, мс":>8} | '
+        f'{"ошибок":>6} | {"записано":>9} | {"всего, с":>7}'
+    )
+    for students in sizes:
+        test, answer_key, jobs = make_exam(creator, students, f'sync{students}')
+
+        def finalize(attempt, submission):
+            try:
+                finalize_attempt(attempt, answer_key, submission, grade_submission(answer_key, submission))
+            except AttemptClosed:
+                pass
+
+        started = time.perf_counter()
+        latencies, errors = run_burst(jobs, finalize)
+        report(stdout, f'sync{students}', students, latencies, errors, time.perf_counter() - started)
+
+        test, answer_key, jobs = make_exam(creator, students, f'queue{students}')
+        directory = tempfile.mkdtemp()
+        submission_queue = SubmissionQueue(directory=directory)
+        submission_queue.start()
+        started = time.perf_counter()
+        latencies, errors = run_burst(
+            jobs, lambda attempt, submission: submission_queue.submit(attempt, submission, timezone.now())
+        )
+        while submission_queue.metrics()['pending']:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        submission_queue.stop()
+        report(stdout, f'queue{students}', students, latencies, errors, elapsed)
+        metrics = submission_queue.metrics()
+        stdout.write(f'{"":>9}   пачек: {metrics["batches"]}, макс. задержка записи: {metrics["max_lag_seconds"]:.2f} с')
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,188 @@
+# main/builders.py
+"""
+Сборка тестов в памяти и запись одной транзакцией.
+
+TestBuilder накапливает тесты, схемы оценивания, вопросы (вместе с
+изображениями) и варианты ответов, а save() записывает их по одному
+bulk_create на таблицу, включая ссылки вопросов на тесты (TestQuestion),
+и добавляет их в поисковый индекс.
+Вопросы, уже сохранённые в банке преподавателя (main/bank.py), не
+копируются: тест получает ссылку на существующий вопрос, а повтор вопроса
+внутри теста добавляется один раз и попадает в duplicates. Порядок вопросов
+в тесте хранится в TestQuestion.position. Число запросов
+не зависит от числа вопросов, кроме разбиения больших вставок на пачки самой базой.
+"""
+from django.db import transaction
+
+from .bank import existing_questions, image_digest, question_hash
+from .images import schedule_variants
+from .models import GradingScheme, Option, Question, Test, TestQuestion
+from .search import index_questions, index_tests
+from .utils import allocate_codes
+
+
+def parse_questions_from_post(data, files):
+    """
+    Разбирает поля формы создания теста (question_N_text, question_N_option_M_text, ...)
+    в список словарей вопросов того же вида, что использует импорт.
+    """
+    questions = []
+    question_index = 0
+    while f'question_{question_index}_text' in data:
+        prefix = f'question_{question_index}'
+        question_text = data.get(f'{prefix}_text')
+        if question_text:
+            has_image = data.get(f'{prefix}_has_image') == 'on'
+            question = {
+                'text': question_text,
+                'is_text_answer': data.get(f'{prefix}_is_text_answer') == 'on',
+                'is_multiple_choice': data.get(f'{prefix}_is_multiple_choice') == 'on',
+                'correct_text_answer': data.get(f'{prefix}_correct_text_answer', ''),
+                'image': files.get(f'{prefix}_image') if has_image else None,
+                'options': [],
+            }
+            option_index = 0
+            while f'{prefix}_option_{option_index}_text' in data:
+                question['options'].append({
+                    'text': data.get(f'{prefix}_option_{option_index}_text') or f"Вариант {option_index + 1}",
+                    'is_correct': data.get(f'{prefix}_option_{option_index}_is_correct') == 'on',
+                })
+                option_index += 1
+            questions.append(question)
+        question_index += 1
+    return questions
+
+
+def question_options(question):
+    """Несохранённые варианты вопроса с правильностью, приведённой как при сохранении"""
+    if question.get('is_text_answer', False):
+        return []
+    options = [
+        Option(text=option['text'], is_correct=option.get('is_correct', False))
+        for option in question.get('options', [])
+    ]
+    Option.normalize_correct(options, question.get('is_multiple_choice', False))
+    return options
+
+
+def content_hash(question, options=None):
+    """Хэш банка для словаря вопроса - тот же, что stored_question_hash() у сохранённой копии"""
+    if options is None:
+        options = question_options(question)
+    return question_hash(
+        question['text'],
+        question.get('is_text_answer', False),
+        question.get('is_multiple_choice', False),
+        question.get('correct_text_answer', ''),
+        [(option.text, option.is_correct) for option in options],
+        image_digest(question.get('image')),
+    )
+
+
+class TestBuilder:
+    def __init__(self, creator):
+        self.creator = creator
+        self.entries = []
+        # (тест, текст вопроса) - повторы вопроса внутри одного теста, добавленные один раз
+        self.duplicates = []
+
+    def add_test(self, title, description, time_limit, questions=(), grading=None, **test_fields):
+        """
+        Добавляет тест. grading - параметры GradingScheme (включая name),
+        questions - словари с ключами text, is_text_answer, is_multiple_choice,
+        correct_text_answer, image, options ([{'text', 'is_correct'}]) и
+        section (раздел пула, см. main/pools.py).
+        """
+        self.entries.append({
+            'test': Test(
+                title=title,
+                description=description,
+                time_limit=time_limit,
+                creator=self.creator,
+                **test_fields
+            ),
+            'grading': grading,
+            'questions': list(questions),
+        })
+
+    @staticmethod
+    def _plan(question):
+        """(варианты, хэш): хэш считается по уже нормализованным вариантам"""
+        options = question_options(question)
+        return options, content_hash(question, options)
+
+    @staticmethod
+    def _build_question(test, question, digest):
+        return Question(
+            test=test,
+            content_hash=digest,
+            text=question['text'],
+            is_text_answer=question.get('is_text_answer', False),
+            is_multiple_choice=question.get('is_multiple_choice', False),
+            correct_text_answer=question.get('correct_text_answer', ''),
+            image=question.get('image'),
+        )
+
+    def save(self):
+        """Записывает всё собранное и возвращает созданные тесты"""
+        tests = [entry['test'] for entry in self.entries]
+        # Коды выдаются заранее, чтобы блокировка счётчика не держалась всю транзакцию
+        without_code = [test for test in tests if not test.code]
+        for test, code in zip(without_code, allocate_codes(len(without_code)) if without_code else []):
+            test.code = code
+        with transaction.atomic():
+            return self._save(tests)
+
+    def _save(self, tests):
+        # Вопросы, которые уже есть в банке преподавателя или повторяются в пачке, не создаются заново
+        plans = [[self._plan(question) for question in entry['questions']] for entry in self.entries]
+        found = existing_questions((digest for plan in plans for _, digest in plan), self.creator)
+        for entry, plan in zip(self.entries, plans):
+            # bulk_create ссылок не вызывает сигналы, поэтому счётчик заполняется сразу
+            entry['test'].question_count = len({digest for _, digest in plan})
+
+        with_grading = [entry for entry in self.entries if entry['grading'] is not None]
+        schemes = GradingScheme.objects.bulk_create([
+            GradingScheme(creator=self.creator, **entry['grading']) for entry in with_grading
+        ])
+        for entry, scheme in zip(with_grading, schemes):
+            entry['test'].grading_scheme = scheme
+
+        Test.objects.bulk_create(tests)
+
+        questions = []
+        options_by_question = []
+        links = []
+        for entry, plan in zip(self.entries, plans):
+            linked = set()
+            for question, (options, digest) in zip(entry['questions'], plan):
+                if digest not in found:
+                    instance = self._build_question(entry['test'], question, digest)
+                    found[digest] = instance
+                    questions.append(instance)
+                    options_by_question.append(options)
+                if digest in linked:
+                    self.duplicates.append((entry['test'], question['text']))
+                    continue
+                linked.add(digest)
+                # Позиция сохраняет порядок автора и для вопросов, взятых из банка
+                links.append((entry['test'], digest, question.get('section', ''), len(linked) - 1))
+        # FileField.pre_save сохраняет загруженные изображения при вставке
+        Question.objects.bulk_create(questions)
+        TestQuestion.objects.bulk_create([
+            TestQuestion(test=test, question=found[digest], section=section, position=position)
+            for test, digest, section, position in links
+        ])
+
+        options = []
+        for question, new_options in zip(questions, options_by_question):
+            for option in new_options:
+                option.question = question
+                options.append(option)
+        Option.objects.bulk_create(options)
+        # bulk_create не вызывает сигналы, поэтому индекс поиска пополняется здесь
+        index_tests(tests)
+        index_questions(questions, options_by_question)
+        # Уменьшенные копии изображений строятся в фоне после коммита
+        schedule_variants(questions)
+        return tests
@@ -0,0 +1,82 @@
+# main/db.py
+"""
+Настройка подключений к базе данных.
+
+database_settings() собирает DATABASES['default'] по переменным окружения:
+по умолчанию SQLite-файл, при DB_ENGINE=postgresql - PostgreSQL с
+постоянными подключениями (CONN_MAX_AGE) или пулом psycopg (DB_POOL=1).
+
+Для SQLite каждое новое подключение получает PRAGMA из SQLITE_PRAGMAS:
+ожидание блокировки вместо ошибки "database is locked",
+synchronous=NORMAL (в режиме WAL не теряет целостность), отображение
+файла в память и кэш страниц. Журнал WAL (читатели не ждут писателя)
+хранится в самом файле базы, поэтому включается один раз миграцией
+0026_sqlite_wal, а не при каждом подключении: иначе любой запуск, даже
+только читающий, переписывал бы файл базы.
+"""
+import os
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'busy_timeout': 20000,  # мс
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # отрицательное значение - в КиБ, т.е. 64 МиБ
+    'temp_store': 'MEMORY',
+}
+
+
+def _env(name, default=None):
+    return os.environ.get(name, default)
+
+
+def database_settings(base_dir):
+    """Настройки базы по умолчанию из переменных окружения DB_*"""
+    engine = _env('DB_ENGINE', 'sqlite').lower()
+    if engine in ('postgres', 'postgresql'):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': _env('DB_NAME', 'diplom'),
+            'USER': _env('DB_USER', 'postgres'),
+            'PASSWORD': _env('DB_PASSWORD', ''),
+            'HOST': _env('DB_HOST', 'localhost'),
+            'PORT': _env('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(_env('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if _env('DB_POOL') == '1':
+            # Пул psycopg (psycopg[pool]) несовместим с постоянными подключениями Django
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': int(_env('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(_env('DB_POOL_MAX_SIZE', '20')),
+                'timeout': int(_env('DB_POOL_TIMEOUT', '10')),
+            }
+        return database
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _env('DB_PATH') or os.path.join(base_dir, 'db.sqlite3'),
+        'CONN_MAX_AGE': int(_env('DB_CONN_MAX_AGE', '60')),
+        'OPTIONS': {
+            # Транзакция сразу берёт блокировку записи: без взаимоблокировок при повышении уровня блокировки
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,159 @@
+# main/exports.py
+"""
+Потоковая выгрузка результатов теста в CSV и XLSX.
+
+Строки собираются из курсоров Attempt и StudentAnswer, идущих по
+user_id параллельно, поэтому в памяти одновременно находится только
+текущий студент. Файл отдаётся по мере формирования строк.
+"""
+import csv
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Attempt, StudentAnswer
+
+CHUNK_SIZE = 2000
+
+
+def result_rows(test, include_questions=False, chunk_size=CHUNK_SIZE):
+    """Заголовок и по одной строке на студента; при include_questions - балл за каждый вопрос"""
+    header = ['Студент', 'Дата прохождения', 'Баллы', 'Результат, %', 'Оценка']
+    question_ids = []
+    if include_questions:
+        question_ids = list(test.ordered_questions().values_list('id', flat=True))
+        header += [f'Вопрос {number}' for number in range(1, len(question_ids) + 1)]
+    yield header
+
+    attempts = Attempt.objects.filter(test=test, status=Attempt.FINISHED).order_by('user_id').values_list(
+        'user_id', 'user__username', 'finished_at', 'score', 'percentage', 'grade'
+    ).iterator(chunk_size=chunk_size)
+    answers = StudentAnswer.objects.filter(test=test).order_by('user_id').values_list(
+        'user_id', 'question_id', 'score'
+    ).iterator(chunk_size=chunk_size) if include_questions else iter(())
+
+    pending = next(answers, None)
+    for user_id, username, finished_at, score, percentage, grade in attempts:
+        row = [
+            username,
+            timezone.localtime(finished_at).strftime('%d.%m.%Y %H:%M') if finished_at else '',
+            round(score, 2),
+            percentage,
+            grade,
+        ]
+        if include_questions:
+            # Ответы идут в том же порядке user_id, что и попытки
+            scores = {}
+            while pending is not None and pending[0] < user_id:
+                pending = next(answers, None)
+            while pending is not None and pending[0] == user_id:
+                _, question_id, answer_score = pending
+                scores[question_id] = max(scores.get(question_id, 0), answer_score)
+                pending = next(answers, None)
+            row += [round(scores[question_id], 2) if question_id in scores else '' for question_id in question_ids]
+        yield row
+
+
+class Echo:
+    """Псевдобуфер: csv.writer пишет в него, а строка сразу возвращается генератору"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff'  # BOM, чтобы Excel открыл кириллицу в UTF-8
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class ZipStream:
+    """Неперематываемый файл для zipfile: записанные байты забираются методом pop()"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Результаты" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def xlsx_stream(rows, rows_per_chunk=500):
+    """
+    Минимальная книга XLSX (строки inline, без sharedStrings), которая
+    записывается в zip по мере поступления строк.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield stream.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            buffer = []
+            for row in rows:
+                buffer.append('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+                if len(buffer) >= rows_per_chunk:
+                    sheet.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+                    yield stream.pop()
+            sheet.write(''.join(buffer).encode('utf-8') + b'</sheetData></worksheet>')
+    yield stream.pop()
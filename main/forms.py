@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import Test, Question, Option, Profile, GradingScheme
+from .importers import FORMAT_CHOICES
 
 # Форма для регистрации нового пользователя
 class RegisterForm(forms.ModelForm):
@@ -89,7 +90,7 @@ class QuestionForm(forms.ModelForm):
         fields = ['text', 'is_text_answer', 'is_multiple_choice', 'correct_text_answer']
         widgets = {
             'correct_text_answer': forms.TextInput(attrs={
-                'placeholder': 'Правильный текстовый ответ',
+                'placeholder': 'Правильный ответ (несколько - через |)',
                 'class': 'correct-text-answer-field'
             }),
         }
@@ -108,4 +109,23 @@ class TestCodeForm(forms.Form):
         # Применяем класс form-control ко всем текстовым полям
         for field_name, field in self.fields.items():
             if isinstance(field, forms.CharField):
-                field.widget.attrs.update({'class': 'form-control'})
\ No newline at end of file
+                field.widget.attrs.update({'class': 'form-control'})
+
+# Форма для импорта тестов из файла
+class TestImportForm(forms.Form):
+    file = forms.FileField(label="Файл с тестами")
+    file_format = forms.ChoiceField(
+        choices=[('', 'Определить по расширению')] + FORMAT_CHOICES,
+        required=False,
+        label="Формат"
+    )
+    title = forms.CharField(max_length=255, required=False, label="Название (для Moodle XML и GIFT)")
+    time_limit = forms.IntegerField(min_value=1, initial=30, label="Время выполнения (мин.)")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field_name, field in self.fields.items():
+            if isinstance(field, forms.ChoiceField):
+                field.widget.attrs.update({'class': 'form-select'})
+            else:
+                field.widget.attrs.update({'class': 'form-control'})
@@ -0,0 +1,121 @@
+# main/fragments.py
+"""
+Кэш отрисованных фрагментов страницы прохождения теста.
+
+Список вопросов с вариантами одинаков для всех студентов, поэтому он
+отрисовывается один раз и хранится в кэше под ключом с версией
+содержимого теста. Для тестов с пулом и перемешиванием вариантов в кэше
+лежат отдельные карточки вопросов, из которых собирается страница
+каждого студента. Версия меняется сигналами при любом изменении теста,
+вопроса или варианта, а старые фрагменты просто вытесняются из кэша.
+Пока один запрос строит фрагмент, остальные ждут его, а не строят заново.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Test
+
+VERSION_KEY = 'test_content_version:{test_id}'
+FRAGMENT_KEY = 'test_questions:{test_id}:{version}'
+PIECES_KEY = 'test_question_pieces:{test_id}:{version}'
+LOCK_KEY = '{key}:lock'
+# Метки в кэшированной карточке вопроса, которые заменяются номером и вариантами студента
+NUMBER_SLOT = '__QUESTION_NUMBER__'
+OPTIONS_SLOT = '__QUESTION_OPTIONS__'
+
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+LOCK_TIMEOUT = 30
+# Сколько ждать фрагмент, который строит другой запрос, прежде чем построить самому
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+
+
+def get_content_version(test_id):
+    key = VERSION_KEY.format(test_id=test_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add не перезапишет версию, выставленную параллельным запросом
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_content_version(test_id):
+    """Делает устаревшими все закэшированные фрагменты теста"""
+    cache.set(VERSION_KEY.format(test_id=test_id), uuid.uuid4().hex, None)
+
+
+def _render_questions(test_id):
+    test = Test.objects.prefetch_related(Test.prefetch_questions('options')).get(id=test_id)
+    return render_to_string('main/includes/test_questions.html', {'test': test})
+
+
+def _render_pieces(test_id):
+    """
+    Части страницы для выборок из пула: {id вопроса: (карточка, {id варианта: html})}.
+    В карточке вместо номера и списка вариантов стоят метки, которые
+    заменяются при сборке страницы студента.
+    """
+    test = Test.objects.prefetch_related(Test.prefetch_questions('options')).get(id=test_id)
+    pieces = {}
+    for question in test.questions.all():
+        card = render_to_string('main/includes/test_question.html', {
+            'question': question, 'number': NUMBER_SLOT, 'options_html': mark_safe(OPTIONS_SLOT),
+        })
+        options = {
+            option.id: render_to_string('main/includes/test_option.html', {'question': question, 'option': option})
+            for option in question.options.all()
+        }
+        pieces[question.id] = (card, options)
+    return pieces
+
+
+def _cached(key_template, test_id, build):
+    """Значение из кэша под версией содержимого теста (строится не более одного раза на версию)"""
+    version = get_content_version(test_id)
+    key = key_template.format(test_id=test_id, version=version)
+    value = cache.get(key)
+    if value is None:
+        lock_key = LOCK_KEY.format(key=key)
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                value = build(test_id)
+                cache.set(key, value, FRAGMENT_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+        else:
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            while value is None and time.monotonic() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                value = cache.get(key)
+            if value is None:
+                value = build(test_id)
+    return value
+
+
+def test_questions_html(test_id, draw=None):
+    """
+    Отрисованный список вопросов теста из кэша. Для выборки из пула
+    (main/pools.py) страница собирается из кэшированных карточек вопросов
+    в порядке выборки: O(k) склеек без отрисовки шаблонов.
+    """
+    if draw is None:
+        return mark_safe(_cached(FRAGMENT_KEY, test_id, _render_questions))
+    pieces = _cached(PIECES_KEY, test_id, _render_pieces)
+    parts = []
+    for question_id in draw.question_ids:
+        # Выборка сохранена при создании попытки: вопрос или вариант могли удалить позже
+        if question_id not in pieces:
+            continue
+        card, options = pieces[question_id]
+        order = [option_id for option_id in draw.option_orders.get(question_id, options) if option_id in options]
+        order += [option_id for option_id in options if option_id not in order]
+        parts.append(
+            card.replace(NUMBER_SLOT, str(len(parts) + 1), 1).replace(OPTIONS_SLOT, ''.join(options[option_id] for option_id in order), 1)
+        )
+    return mark_safe(''.join(parts))
@@ -0,0 +1,234 @@
+# main/grading.py
+"""
+Движок проверки ответов.
+
+Ключ теста (main.answer_key.AnswerKey) разворачивается в массивы по
+вариантам ответа, а пачка попыток - в матрицу "попытки x варианты".
+Баллы всех попыток по всем вопросам считаются за один проход NumPy.
+Если NumPy не установлен или попыток мало, используется та же логика
+на чистом Python (QuestionKey.score).
+
+Правила оценивания:
+- одиночный выбор: 1 балл, если выбран ровно один вариант и он правильный;
+- множественный выбор: max(0, правильные - неправильные) / число правильных;
+- текстовый ответ: 1 балл, если ответ принимает эталон вопроса
+  (варианты, числа с допуском, опечатки - см. main/matching.py).
+"""
+from typing import NamedTuple
+
+from .answer_key import normalize_text_answer
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy необязателен
+    np = None
+
+# Начиная с такого размера пачки векторизация быстрее цикла на Python
+NUMPY_MIN_BATCH = 32
+
+
+class Submission(NamedTuple):
+    selected: dict  # id вопроса -> список id выбранных вариантов
+    texts: dict  # id вопроса -> текстовый ответ
+
+
+class QuestionGrade(NamedTuple):
+    question_id: int
+    score: float
+    correct_selected: int
+    incorrect_selected: int
+
+
+def submission_from_post(answer_key, data):
+    """
+    Собирает ответ из POST-данных формы теста. Варианты, не относящиеся
+    к вопросу, отбрасываются по ключу без обращения к базе, повторы
+    одного варианта - с сохранением порядка.
+    """
+    selected = {}
+    texts = {}
+    for question_key in answer_key.questions:
+        field = f'answer_{question_key.id}'
+        if question_key.is_text_answer:
+            texts[question_key.id] = normalize_text_answer(data.get(field, ''))
+        else:
+            option_ids = []
+            for value in data.getlist(field):
+                if value.isdigit() and int(value) in question_key.option_ids and int(value) not in option_ids:
+                    option_ids.append(int(value))
+            selected[question_key.id] = option_ids
+    return Submission(selected=selected, texts=texts)
+
+
+def submission_from_answers(student_answers):
+    """Собирает ответ из сохранённых строк StudentAnswer одной попытки"""
+    selected = {}
+    texts = {}
+    for answer in student_answers:
+        if answer.selected_option_id:
+            selected.setdefault(answer.question_id, []).append(answer.selected_option_id)
+        elif answer.question_id not in texts:
+            texts[answer.question_id] = answer.answer_text
+    return Submission(selected=selected, texts=texts)
+
+
+class BatchGrades:
+    """Результат проверки пачки попыток: матрицы "попытки x вопросы" и итоговые суммы"""
+
+    def __init__(self, question_ids, scores, correct_selected, incorrect_selected):
+        self.question_ids = question_ids
+        self.scores = scores
+        self.correct_selected = correct_selected
+        self.incorrect_selected = incorrect_selected
+
+    @property
+    def totals(self):
+        if np is not None and isinstance(self.scores, np.ndarray):
+            return self.scores.sum(axis=1).tolist()
+        return [sum(row) for row in self.scores]
+
+    def __len__(self):
+        return len(self.scores)
+
+    def row(self, index):
+        scores = self.scores[index]
+        correct = self.correct_selected[index]
+        incorrect = self.incorrect_selected[index]
+        return [
+            QuestionGrade(question_id, float(scores[i]), int(correct[i]), int(incorrect[i]))
+            for i, question_id in enumerate(self.question_ids)
+        ]
+
+
+def _grade_python(answer_key, submissions):
+    scores, correct_rows, incorrect_rows = [], [], []
+    for submission in submissions:
+        row_scores, row_correct, row_incorrect = [], [], []
+        for question_key in answer_key.questions:
+            if question_key.is_text_answer:
+                result = question_key.score(answer_text=submission.texts.get(question_key.id))
+            else:
+                result = question_key.score(submission.selected.get(question_key.id, []))
+            row_scores.append(result[0])
+            row_correct.append(result[1])
+            row_incorrect.append(result[2])
+        scores.append(row_scores)
+        correct_rows.append(row_correct)
+        incorrect_rows.append(row_incorrect)
+    return BatchGrades([q.id for q in answer_key.questions], scores, correct_rows, incorrect_rows)
+
+
+class KeyArrays:
+    """Ключ теста в виде массивов по всем вариантам всех вопросов"""
+
+    def __init__(self, answer_key):
+        questions = answer_key.questions
+        option_ids, option_question, option_correct = [], [], []
+        for index, question_key in enumerate(questions):
+            for option_id in sorted(question_key.option_ids):
+                option_ids.append(option_id)
+                option_question.append(index)
+                option_correct.append(option_id in question_key.correct_option_ids)
+
+        self.question_ids = [q.id for q in questions]
+        self.option_ids = np.array(option_ids, dtype=np.int64)
+        self.option_order = np.argsort(self.option_ids)
+        self.sorted_option_ids = self.option_ids[self.option_order]
+
+        correct = np.array(option_correct, dtype=bool)
+        membership = np.zeros((len(option_ids), len(questions)), dtype=np.float32)
+        membership[np.arange(len(option_ids)), np.array(option_question, dtype=np.int64)] = 1
+        # Матрицы "вариант -> вопрос" отдельно для правильных и неправильных вариантов
+        self.correct_membership = membership * correct[:, None]
+        self.incorrect_membership = membership * ~correct[:, None]
+
+        self.n_correct = np.array([len(q.correct_option_ids) for q in questions], dtype=np.float32)
+        self.is_multiple = np.array([q.is_multiple_choice for q in questions], dtype=bool)
+        self.text_columns = [(i, q) for i, q in enumerate(questions) if q.is_text_answer]
+
+    def columns(self, option_ids):
+        """Номера столбцов матрицы для id вариантов (-1 для чужих вариантов)"""
+        option_ids = np.asarray(option_ids, dtype=np.int64)
+        if not len(self.sorted_option_ids):
+            return np.full(option_ids.shape, -1, dtype=np.int64)
+        positions = np.searchsorted(self.sorted_option_ids, option_ids)
+        positions = np.minimum(positions, len(self.sorted_option_ids) - 1)
+        found = self.sorted_option_ids[positions] == option_ids
+        return np.where(found, self.option_order[positions], -1)
+
+
+def response_matrix(arrays, n_rows, row_indices, option_ids):
+    """
+    Матрица выбора "попытки x варианты" по парам (номер попытки, id варианта).
+    Пары передаются плоскими массивами, поэтому сборка не требует цикла.
+    """
+    selection = np.zeros((n_rows, len(arrays.option_ids)), dtype=np.float32)
+    if len(option_ids):
+        columns = arrays.columns(option_ids)
+        mask = columns >= 0
+        selection[np.asarray(row_indices, dtype=np.int64)[mask], columns[mask]] = 1
+    return selection
+
+
+def grade_matrix(arrays, selection, texts_by_row=None):
+    """
+    Векторизованная проверка: selection - матрица выбора вариантов,
+    texts_by_row - список словарей {id вопроса: текст} по попыткам.
+    """
+    correct_selected = selection @ arrays.correct_membership
+    incorrect_selected = selection @ arrays.incorrect_membership
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        multiple_scores = np.where(
+            arrays.n_correct > 0,
+            np.maximum(0, correct_selected - incorrect_selected) / arrays.n_correct,
+            0,
+        )
+    single_scores = ((correct_selected == 1) & (incorrect_selected == 0)).astype(np.float32)
+    scores = np.where(arrays.is_multiple, multiple_scores, single_scores).astype(np.float64)
+
+    for column, question_key in arrays.text_columns:
+        # Одинаковые ответы в пачке сравниваются с эталоном один раз
+        verdicts = {}
+        column_scores = []
+        for texts in (texts_by_row or [None] * len(scores)):
+            answer = (texts or {}).get(question_key.id) or ''
+            if answer not in verdicts:
+                verdicts[answer] = 1.0 if question_key.text_matcher.matches(answer) else 0.0
+            column_scores.append(verdicts[answer])
+        scores[:, column] = column_scores
+    return BatchGrades(
+        arrays.question_ids,
+        scores,
+        correct_selected.astype(np.int64),
+        incorrect_selected.astype(np.int64),
+    )
+
+
+def _grade_numpy(answer_key, submissions):
+    arrays = KeyArrays(answer_key)
+    row_indices, option_ids = [], []
+    for row, submission in enumerate(submissions):
+        for selected_ids in submission.selected.values():
+            row_indices.extend([row] * len(selected_ids))
+            option_ids.extend(selected_ids)
+    selection = response_matrix(arrays, len(submissions), row_indices, option_ids)
+    return grade_matrix(arrays, selection, [submission.texts for submission in submissions])
+
+
+def grade_batch(answer_key, submissions, use_numpy=None):
+    """
+    Проверяет пачку попыток одного теста. Возвращает BatchGrades, строки
+    которого соответствуют порядку submissions, столбцы - answer_key.questions.
+    """
+    submissions = list(submissions)
+    if use_numpy is None:
+        use_numpy = np is not None and len(submissions) >= NUMPY_MIN_BATCH
+    if use_numpy and np is not None:
+        return _grade_numpy(answer_key, submissions)
+    return _grade_python(answer_key, submissions)
+
+
+def grade_submission(answer_key, submission):
+    """Проверяет одну попытку и возвращает оценки по вопросам в порядке ключа"""
+    return grade_batch(answer_key, [submission]).row(0)
@@ -0,0 +1,164 @@
+# main/images.py
+"""
+Уменьшенные копии изображений вопросов.
+
+Оригинал, загруженный преподавателем, остаётся как есть. Фоновый поток
+строит по нему WebP нескольких ширин (QUESTION_IMAGE_WIDTHS) и сохраняет
+их под именами из хэша содержимого оригинала:
+question_images/variants/<хэш>-<ширина>.webp. Одинаковые загрузки
+получают одни и те же файлы, а изменённое изображение - новые имена,
+поэтому копии можно кэшировать в браузере навсегда (serve_variant).
+
+Пути копий записываются в Question.image_variants, после чего версия
+содержимого теста меняется и кэш фрагментов перерисовывает вопросы с
+srcset. Пока копий нет, страница показывает оригинал. Замена изображения
+вопроса сбрасывает его копии и ставит новые в обработку (main/signals.py).
+"""
+import hashlib
+import io
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.views.static import serve
+from PIL import Image, ImageOps
+
+from .fragments import bump_content_version
+from .models import Question, TestQuestion
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'question_images/variants'
+# Год: имя файла меняется вместе с содержимым
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'QUESTION_IMAGE_WIDTHS', (320, 640, 960, 1280)))
+
+
+def webp_quality():
+    return getattr(settings, 'QUESTION_IMAGE_QUALITY', 80)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def variant_name(digest, width):
+    return f'{VARIANT_DIR}/{digest}-{width}.webp'
+
+
+def encode_variant(image, width):
+    height = max(1, round(image.height * width / image.width))
+    if width < image.width:
+        # reducing_gap сначала грубо уменьшает в целое число раз: в разы быстрее почти без потери качества
+        resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    else:
+        resized = image
+    buffer = io.BytesIO()
+    resized.save(buffer, 'WEBP', quality=webp_quality(), method=4)
+    return buffer.getvalue()
+
+
+def build_variants(image_file):
+    """Сохраняет копии изображения и возвращает {ширина: путь в хранилище}"""
+    image_file.open('rb')
+    try:
+        data = image_file.read()
+    finally:
+        image_file.close()
+    digest = content_hash(data)
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG сразу декодируется в уменьшенном в 2-8 раз виде, если копиям хватает этого размера
+        largest = max(variant_widths())
+        source.draft('RGB', (largest, max(1, round(source.height * largest / source.width))))
+        # Поворот по EXIF делают браузеры, а WebP без EXIF потерял бы его
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    # Копии не шире оригинала: узкое изображение получает одну копию своей ширины
+    widths = sorted({min(width, image.width) for width in variant_widths()})
+    variants = {}
+    for width in widths:
+        name = variant_name(digest, width)
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(encode_variant(image, width)))
+        variants[str(width)] = name
+    return variants
+
+
+def process_questions(question_ids):
+    """Строит копии для вопросов с изображениями; возвращает число обработанных вопросов"""
+    processed = 0
+    questions = Question.objects.filter(pk__in=question_ids).exclude(image='').exclude(image__isnull=True)
+    for question in questions.only('id', 'test_id', 'image'):
+        try:
+            variants = build_variants(question.image)
+        except (OSError, ValueError):
+            logger.exception('Не удалось обработать изображение вопроса %s', question.id)
+            continue
+        # update() без сигналов: ключ ответов от изображения не зависит, а фрагмент сбрасывается явно.
+        # Если изображение успели заменить, копии нового файла построит следующая обработка
+        if not Question.objects.filter(pk=question.id, image=question.image.name).update(image_variants=variants):
+            continue
+        for test_id in TestQuestion.test_ids(question.id):
+            bump_content_version(test_id)
+        processed += 1
+    return processed
+
+
+class ImageWorker:
+    """Фоновый поток, который строит копии изображений после сохранения вопросов"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, question_ids):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='image-variants', daemon=True)
+                self._thread.start()
+        self._queue.put(list(question_ids))
+
+    def join(self):
+        """Ждёт обработки всего, что уже поставлено в очередь"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            question_ids = self._queue.get()
+            try:
+                close_old_connections()
+                process_questions(question_ids)
+            except Exception:
+                logger.exception('Ошибка обработки изображений вопросов %s', question_ids)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+image_worker = ImageWorker()
+
+
+def schedule_variants(questions):
+    """Ставит вопросы с изображениями в обработку после коммита текущей транзакции"""
+    question_ids = [question.pk for question in questions if question.image]
+    if not question_ids:
+        return
+    if getattr(settings, 'IMAGE_WORKER_ENABLED', True):
+        transaction.on_commit(lambda: image_worker.submit(question_ids))
+    else:
+        transaction.on_commit(lambda: process_questions(question_ids))
+
+
+def serve_variant(request, path):
+    """Отдаёт копию из MEDIA_ROOT с кэшированием навсегда; в продакшене то же делает веб-сервер"""
+    response = serve(request, f'{VARIANT_DIR}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = VARIANT_CACHE_CONTROL
+    return response
@@ -0,0 +1,508 @@
+# main/importers.py
+"""
+Импорт тестов из JSON, Moodle XML и GIFT.
+
+Парсеры превращают файл в словари того же вида, что и формат JSON:
+
+    {"title": ..., "description": ..., "time_limit": 30,
+     "grading": {"grading_type": "non_differentiated", "pass_threshold": 60, ...},
+     "questions": [{"text": ..., "is_text_answer": false, "is_multiple_choice": false,
+                    "correct_text_answer": "", "options": [{"text": ..., "is_correct": true}]}]}
+
+В JSON тест может задать пул ("pool": {"раздел": сколько вытянуть},
+вопросы указывают "section") и "shuffle_options", см. main/pools.py.
+Все принятые ответы текстовых и числовых вопросов Moodle и GIFT попадают
+в correct_text_answer через «|», а допуск числа - как «± допуск»
+(синтаксис эталона, см. main/matching.py).
+
+Сначала весь файл разбирается и проверяется, и только потом все тесты
+записываются в одной транзакции через TestBuilder.
+"""
+import html
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from django.utils.html import strip_tags
+
+from .builders import TestBuilder, content_hash
+from .matching import ALTERNATIVE_SEPARATOR
+from .models import GradingScheme, Option, Test
+
+FORMAT_CHOICES = [
+    ('json', 'JSON'),
+    ('moodle_xml', 'Moodle XML'),
+    ('gift', 'GIFT'),
+]
+EXTENSION_FORMATS = {'.json': 'json', '.xml': 'moodle_xml', '.gift': 'gift', '.txt': 'gift'}
+GRADING_FIELDS = ('grading_type', 'threshold_2', 'threshold_3', 'threshold_4', 'threshold_5', 'pass_threshold')
+GRADING_TYPES = tuple(choice for choice, _ in GradingScheme.GRADING_TYPE_CHOICES)
+OPTION_TEXT_MAX_LENGTH = Option._meta.get_field('text').max_length
+TRUE_FALSE_OPTIONS = ('Верно', 'Неверно')
+
+
+class TestImportError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def detect_format(filename):
+    return EXTENSION_FORMATS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def new_question(text, is_text_answer=False, is_multiple_choice=False, correct_text_answer='', options=None):
+    return {
+        'text': text,
+        'is_text_answer': is_text_answer,
+        'is_multiple_choice': is_multiple_choice,
+        'correct_text_answer': correct_text_answer,
+        'options': options or [],
+    }
+
+
+# --- JSON ---
+
+def _json_question(raw_question, where, errors):
+    """Словарь вопроса из JSON или None, если у вопроса неверная структура (ошибка - в errors)"""
+    if not isinstance(raw_question, dict):
+        errors.append(f'{where}: вопрос должен быть JSON-объектом.')
+        return None
+    raw_options = raw_question.get('options', [])
+    if not isinstance(raw_options, list) or not all(isinstance(option, dict) for option in raw_options):
+        errors.append(f'{where}: варианты ответа должны быть списком JSON-объектов.')
+        return None
+    question_type = raw_question.get('type')
+    flags = {
+        'is_text_answer': raw_question.get('is_text_answer', question_type == 'text'),
+        'is_multiple_choice': raw_question.get('is_multiple_choice', question_type == 'multiple'),
+    }
+    for name, value in flags.items():
+        if not isinstance(value, bool):
+            errors.append(f'{where}: "{name}" должно быть true или false.')
+    question = new_question(
+        text=str(raw_question.get('text', '')).strip(),
+        is_text_answer=bool(flags['is_text_answer']),
+        is_multiple_choice=bool(flags['is_multiple_choice']),
+        correct_text_answer=str(raw_question.get('correct_text_answer') or '').strip(),
+        options=[
+            {'text': str(option.get('text', '')).strip(), 'is_correct': bool(option.get('is_correct'))}
+            for option in raw_options
+        ],
+    )
+    question['section'] = str(raw_question.get('section') or '').strip()
+    return question
+
+
+def parse_json(fileobj, defaults):
+    data = json.load(fileobj)
+    raw_tests = data.get('tests', [data]) if isinstance(data, dict) else data
+    if not isinstance(raw_tests, list):
+        raise TestImportError(['Ожидался объект теста или список "tests".'])
+    tests = []
+    errors = []
+    for test_number, raw in enumerate(raw_tests, start=1):
+        if not isinstance(raw, dict):
+            raise TestImportError(['Каждый тест должен быть JSON-объектом.'])
+        prefix = f'Тест {test_number}'
+        raw_questions = raw.get('questions', [])
+        if not isinstance(raw_questions, list):
+            errors.append(f'{prefix}: вопросы должны быть списком.')
+            raw_questions = []
+        grading = raw.get('grading') or {}
+        if not isinstance(grading, dict):
+            errors.append(f'{prefix}: параметры оценивания должны быть JSON-объектом.')
+            grading = {}
+        questions = [
+            _json_question(raw_question, f'{prefix}, вопрос {number}', errors)
+            for number, raw_question in enumerate(raw_questions, start=1)
+        ]
+        tests.append({
+            'title': str(raw.get('title') or defaults.get('title') or '').strip(),
+            'description': str(raw.get('description') or defaults.get('description') or ''),
+            'time_limit': raw.get('time_limit', defaults.get('time_limit')),
+            'grading': grading,
+            'questions': questions,
+            'pool': raw.get('pool') or {},
+            'shuffle_options': bool(raw.get('shuffle_options')),
+        })
+    if errors:
+        raise TestImportError(errors)
+    return tests
+
+
+def accepted_answers(answers):
+    """Эталон текстового вопроса из нескольких принятых ответов"""
+    return f' {ALTERNATIVE_SEPARATOR} '.join(answer for answer in answers if answer)
+
+
+def number_with_tolerance(value, tolerance):
+    """Число с допуском в синтаксисе эталона; нулевой допуск не пишется"""
+    return f'{value} ± {tolerance}' if tolerance and float(tolerance) else value
+
+
+# --- Moodle XML ---
+
+def _moodle_text(element, path):
+    node = element.find(path)
+    if node is None:
+        return ''
+    text = node.findtext('text') if node.tag != 'text' else node.text
+    text = text or ''
+    if node.get('format', 'html') == 'html':
+        text = html.unescape(strip_tags(text))
+    return text.strip()
+
+
+def parse_moodle_xml(fileobj, defaults):
+    """Потоковый разбор: каждый <question> освобождается сразу после обработки"""
+    questions = []
+    errors = []
+    number = 0
+    context = ET.iterparse(fileobj, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event != 'end' or element.tag != 'question':
+            continue
+        question_type = element.get('type')
+        if question_type in ('category', 'description'):
+            root.clear()
+            continue
+        number += 1
+        text = _moodle_text(element, 'questiontext')
+        answers = [
+            (_moodle_text(answer, '.'), float(answer.get('fraction', 0)))
+            for answer in element.findall('answer')
+        ]
+        if question_type == 'multichoice':
+            single = (element.findtext('single') or 'true').strip().lower() in ('true', '1')
+            questions.append(new_question(text, is_multiple_choice=not single, options=[
+                {'text': answer_text, 'is_correct': fraction > 0} for answer_text, fraction in answers
+            ]))
+        elif question_type == 'truefalse':
+            correct = next((answer_text.lower() for answer_text, fraction in answers if fraction > 0), 'true')
+            questions.append(new_question(text, options=[
+                {'text': TRUE_FALSE_OPTIONS[0], 'is_correct': correct == 'true'},
+                {'text': TRUE_FALSE_OPTIONS[1], 'is_correct': correct != 'true'},
+            ]))
+        elif question_type == 'shortanswer':
+            correct = accepted_answers(answer_text for answer_text, fraction in answers if fraction >= 100)
+            questions.append(new_question(text, is_text_answer=True, correct_text_answer=correct))
+        elif question_type == 'numerical':
+            # «*» в Moodle принимает любой ответ, такой вариант не переносится
+            correct = accepted_answers(
+                number_with_tolerance(_moodle_text(answer, '.'), (answer.findtext('tolerance') or '').strip())
+                for answer in element.findall('answer')
+                if float(answer.get('fraction', 0)) >= 100 and _moodle_text(answer, '.') != '*'
+            )
+            questions.append(new_question(text, is_text_answer=True, correct_text_answer=correct))
+        else:
+            errors.append(f'Вопрос {number}: тип "{question_type}" не поддерживается.')
+        root.clear()
+    if errors:
+        raise TestImportError(errors)
+    return [{
+        'title': defaults.get('title') or '',
+        'description': defaults.get('description') or '',
+        'time_limit': defaults.get('time_limit'),
+        'grading': {},
+        'questions': questions,
+    }]
+
+
+# --- GIFT ---
+
+GIFT_ESCAPES = {'~': '~', '=': '=', '#': '#', '{': '{', '}': '}', ':': ':', 'n': '\n', '\\': '\\'}
+
+
+def _gift_unescape(text):
+    result = []
+    chars = iter(text)
+    for char in chars:
+        if char == '\\':
+            following = next(chars, '')
+            result.append(GIFT_ESCAPES.get(following, '\\' + following))
+        else:
+            result.append(char)
+    return ''.join(result).strip()
+
+
+def _gift_find(text, symbol, start=0):
+    """Позиция первого неэкранированного символа"""
+    index = start
+    while index < len(text):
+        if text[index] == '\\':
+            index += 2
+            continue
+        if text[index] == symbol:
+            return index
+        index += 1
+    return -1
+
+
+def _gift_answers(body):
+    """Разбивает блок ответов на (знак, вес, текст) по неэкранированным = и ~"""
+    tokens = []
+    current = None
+    index = 0
+    while index < len(body):
+        char = body[index]
+        if char == '\\':
+            if current is not None:
+                current[1] += body[index:index + 2]
+            index += 2
+            continue
+        if char in '=~':
+            current = [char, '']
+            tokens.append(current)
+        elif current is not None:
+            current[1] += char
+        index += 1
+
+    answers = []
+    for sign, raw in tokens:
+        feedback = _gift_find(raw, '#')
+        if feedback >= 0:
+            raw = raw[:feedback]
+        weight = None
+        raw = raw.strip()
+        if raw.startswith('%'):
+            end = raw.find('%', 1)
+            if end > 0:
+                weight = float(raw[1:end])
+                raw = raw[end + 1:]
+        answers.append((sign, weight, _gift_unescape(raw)))
+    return answers
+
+
+def _gift_number(value):
+    """Числовой ответ GIFT («3.14:0.01» или диапазон «1..5») в синтаксисе эталона"""
+    value = value.strip()
+    if '..' in value:
+        low, high = (float(part) for part in value.split('..', 1))
+        return number_with_tolerance(f'{(low + high) / 2:.10g}', f'{(high - low) / 2:.10g}')
+    number, _, tolerance = value.partition(':')
+    float(number)  # Не число - ValueError
+    return number_with_tolerance(number.strip(), tolerance.strip())
+
+
+def _gift_question(block, number):
+    if block.startswith('::'):
+        end = block.find('::', 2)
+        if end > 0:
+            block = block[end + 2:]
+    open_index = _gift_find(block, '{')
+    close_index = _gift_find(block, '}', open_index + 1) if open_index >= 0 else -1
+    if open_index < 0 or close_index < 0:
+        raise ValueError(f'Вопрос {number}: не найден блок ответов {{...}}.')
+
+    before = block[:open_index].strip()
+    after = block[close_index + 1:].strip()
+    text = _gift_unescape(f'{before} _____ {after}' if after else before)
+    if text.startswith('[') and ']' in text:
+        text = text[text.index(']') + 1:].strip()  # Пометка формата вроде [html]
+    body = block[open_index + 1:close_index].strip()
+
+    if not body:
+        raise ValueError(f'Вопрос {number}: вопросы-эссе не поддерживаются.')
+    if body.upper() in ('T', 'TRUE', 'F', 'FALSE'):
+        is_true = body.upper().startswith('T')
+        return new_question(text, options=[
+            {'text': TRUE_FALSE_OPTIONS[0], 'is_correct': is_true},
+            {'text': TRUE_FALSE_OPTIONS[1], 'is_correct': not is_true},
+        ])
+    if body.startswith('#'):
+        numbers = body[1:].strip()
+        if numbers.startswith('='):
+            # Несколько ответов: засчитываются только полные (без веса или с весом 100%)
+            values = [value for _, weight, value in _gift_answers(numbers) if weight is None or weight >= 100]
+        else:
+            feedback = _gift_find(numbers, '#')
+            values = [_gift_unescape(numbers[:feedback] if feedback >= 0 else numbers)]
+        try:
+            correct = accepted_answers(_gift_number(value) for value in values)
+        except ValueError:
+            raise ValueError(f'Вопрос {number}: неверный числовой ответ.')
+        return new_question(text, is_text_answer=True, correct_text_answer=correct)
+    if '->' in body:
+        raise ValueError(f'Вопрос {number}: вопросы на сопоставление не поддерживаются.')
+
+    answers = _gift_answers(body)
+    if all(sign == '=' for sign, _, _ in answers):
+        correct = accepted_answers(answer_text for _, weight, answer_text in answers if weight is None or weight >= 100)
+        return new_question(text, is_text_answer=True, correct_text_answer=correct)
+    options = [
+        {'text': answer_text, 'is_correct': sign == '=' or (weight is not None and weight > 0)}
+        for sign, weight, answer_text in answers
+    ]
+    return new_question(
+        text,
+        is_multiple_choice=sum(1 for option in options if option['is_correct']) > 1,
+        options=options,
+    )
+
+
+def _gift_blocks(lines):
+    block = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('//') or stripped.startswith('$CATEGORY'):
+            continue
+        if not stripped:
+            if block:
+                yield '\n'.join(block)
+                block = []
+            continue
+        block.append(line.rstrip('\n'))
+    if block:
+        yield '\n'.join(block)
+
+
+def _decoded_lines(fileobj):
+    for number, line in enumerate(fileobj):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        yield line.lstrip('\ufeff') if number == 0 else line
+
+
+def parse_gift(fileobj, defaults):
+    questions = []
+    errors = []
+    for number, block in enumerate(_gift_blocks(_decoded_lines(fileobj)), start=1):
+        try:
+            questions.append(_gift_question(block, number))
+        except ValueError as error:
+            errors.append(str(error))
+    if errors:
+        raise TestImportError(errors)
+    return [{
+        'title': defaults.get('title') or '',
+        'description': defaults.get('description') or '',
+        'time_limit': defaults.get('time_limit'),
+        'grading': {},
+        'questions': questions,
+    }]
+
+
+PARSERS = {
+    'json': parse_json,
+    'moodle_xml': parse_moodle_xml,
+    'gift': parse_gift,
+}
+
+
+# --- Проверка и запись ---
+
+def validate_tests(tests):
+    errors = []
+    if not tests:
+        errors.append('Файл не содержит тестов.')
+    for test_number, test in enumerate(tests, start=1):
+        prefix = f'Тест {test_number}'
+        if not test['title']:
+            errors.append(f'{prefix}: не указано название.')
+        try:
+            test['time_limit'] = int(test['time_limit'])
+            if test['time_limit'] <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f'{prefix}: время выполнения должно быть положительным целым числом.')
+        errors.extend(_grading_errors(prefix, test['grading']))
+        if not test['questions']:
+            errors.append(f'{prefix}: нет вопросов.')
+        errors.extend(_pool_errors(prefix, test))
+        # Одинаковые вопросы сохраняются один раз (main/bank.py), поэтому повтор - ошибка файла
+        seen = {}
+        for number, question in enumerate(test['questions'], start=1):
+            where = f'{prefix}, вопрос {number}'
+            if not question['text']:
+                errors.append(f'{where}: пустой текст вопроса.')
+            digest = content_hash(question)
+            if digest in seen:
+                errors.append(f'{where}: повторяет вопрос {seen[digest]}.')
+            seen.setdefault(digest, number)
+            if question['is_text_answer']:
+                if not question['correct_text_answer']:
+                    errors.append(f'{where}: не указан правильный ответ.')
+                continue
+            options = question['options']
+            correct_count = sum(1 for option in options if option['is_correct'])
+            if len(options) < 2:
+                errors.append(f'{where}: нужно не меньше двух вариантов ответа.')
+            if correct_count == 0:
+                errors.append(f'{where}: не отмечен правильный вариант.')
+            elif correct_count > 1 and not question['is_multiple_choice']:
+                errors.append(f'{where}: у вопроса с одиночным выбором несколько правильных вариантов.')
+            for option in options:
+                if not option['text']:
+                    errors.append(f'{where}: пустой вариант ответа.')
+                elif len(option['text']) > OPTION_TEXT_MAX_LENGTH:
+                    errors.append(f'{where}: вариант длиннее {OPTION_TEXT_MAX_LENGTH} символов.')
+    if errors:
+        raise TestImportError(errors)
+    return tests
+
+
+def _percent(value):
+    """Порог оценки: целое число процентов от 0 до 100 (можно строкой)"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError
+    value = int(value)
+    if not 0 <= value <= 100:
+        raise ValueError
+    return value
+
+
+def _grading_errors(prefix, grading):
+    """Проверяет параметры GradingScheme и приводит пороги к int"""
+    errors = []
+    unknown = set(grading) - set(GRADING_FIELDS)
+    if unknown:
+        errors.append(f'{prefix}: неизвестные параметры оценивания: {", ".join(sorted(unknown))}.')
+    if 'grading_type' in grading and grading['grading_type'] not in GRADING_TYPES:
+        errors.append(f'{prefix}: тип оценивания должен быть одним из: {", ".join(GRADING_TYPES)}.')
+    for name in GRADING_FIELDS[1:]:
+        if name not in grading:
+            continue
+        try:
+            grading[name] = _percent(grading[name])
+        except (TypeError, ValueError):
+            errors.append(f'{prefix}: параметр оценивания {name} должен быть целым числом от 0 до 100.')
+    return errors
+
+
+def _pool_errors(prefix, test):
+    pool = test.get('pool', {})
+    errors = [f'{prefix}: {error[0].lower()}{error[1:]}' for error in Test.pool_errors(pool)]
+    if isinstance(pool, dict):
+        sections = {question.get('section', '') for question in test['questions']}
+        errors.extend(f'{prefix}: в пуле указан раздел без вопросов: "{name}".' for name in pool if name not in sections)
+    return errors
+
+
+def save_tests(creator, tests):
+    """Записывает проверенные тесты одной транзакцией через TestBuilder"""
+    builder = TestBuilder(creator)
+    for test in tests:
+        builder.add_test(
+            title=test['title'],
+            description=test['description'],
+            time_limit=test['time_limit'],
+            grading=test['grading'],
+            questions=test['questions'],
+            pool=test.get('pool', {}),
+            shuffle_options=test.get('shuffle_options', False),
+        )
+    return builder.save()
+
+
+def import_tests(fileobj, file_format, creator, **defaults):
+    """Разбирает, проверяет и сохраняет тесты из файла. Возвращает созданные тесты."""
+    parser = PARSERS.get(file_format)
+    if parser is None:
+        raise TestImportError([f'Неизвестный формат файла: {file_format}.'])
+    try:
+        tests = parser(fileobj, defaults)
+    except (ValueError, ET.ParseError, UnicodeDecodeError) as error:
+        raise TestImportError([f'Не удалось разобрать файл: {error}'])
+    return save_tests(creator, validate_tests(tests))
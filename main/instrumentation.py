@@ -0,0 +1,326 @@
+# main/instrumentation.py
+"""
+Замеры каждого запроса: база, шаблоны, код представления.
+
+TimingMiddleware заводит для запроса RequestTimings в contextvar. Запросы
+к базе учитывает обёртка execute_wrapper, которую получает каждое новое
+подключение (connection_created), поэтому учитываются запросы из любого
+потока, где выполняется код запроса. Время отрисовки шаблонов считает
+бэкенд TimedTemplates. Результат уходит клиенту заголовком Server-Timing
+и копится в гистограммах по маршрутам, которые отдаёт /metrics в
+текстовом формате Prometheus вместе с метриками очереди записи попыток.
+
+Накладные расходы - несколько вызовов perf_counter и поиск корзины
+гистограммы под блокировкой на запрос; выборки не хранятся.
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template
+
+# Границы корзин в секундах
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUANTILES = (0.5, 0.95, 0.99)
+PHASES = ('total', 'view', 'db', 'template')
+
+
+def metrics_enabled():
+    return getattr(settings, 'PERFORMANCE_METRICS_ENABLED', True)
+
+
+class RequestTimings:
+    """Счётчики одного запроса"""
+    __slots__ = ('queries', 'db_seconds', 'template_seconds', 'template_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_seconds += time.perf_counter() - started
+        timings.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(context, request)
+        # Вложенная отрисовка уже входит во время внешней
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            if not timings.template_depth:
+                timings.template_seconds += time.perf_counter() - started
+
+
+class TimedTemplates(DjangoTemplates):
+    """Бэкенд шаблонов Django, который учитывает время отрисовки в RequestTimings"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как histogram в Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, share):
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)"""
+        if not self.count:
+            return 0.0
+        rank = share * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class RouteMetrics:
+    """Гистограммы времени и числа запросов к базе по маршрутам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}  # (маршрут, метод, фаза) -> Histogram
+        self.queries = {}  # (маршрут, метод) -> Histogram
+        self.responses = {}  # (маршрут, метод, код) -> число
+
+    def observe(self, route, method, status, seconds, timings):
+        view_seconds = max(seconds - timings.db_seconds - timings.template_seconds, 0.0)
+        values = {'total': seconds, 'view': view_seconds, 'db': timings.db_seconds, 'template': timings.template_seconds}
+        with self._lock:
+            for phase, value in values.items():
+                key = (route, method, phase)
+                if key not in self.durations:
+                    self.durations[key] = Histogram(DURATION_BUCKETS)
+                self.durations[key].observe(value)
+            if (route, method) not in self.queries:
+                self.queries[(route, method)] = Histogram(QUERY_BUCKETS)
+            self.queries[(route, method)].observe(timings.queries)
+            key = (route, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.durations.clear()
+            self.queries.clear()
+            self.responses.clear()
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP diplom_request_duration_seconds Время обработки запроса по фазам',
+                '# TYPE diplom_request_duration_seconds histogram',
+            ]
+            for (route, method, phase), histogram in sorted(self.durations.items()):
+                lines.extend(histogram_lines(
+                    'diplom_request_duration_seconds', histogram,
+                    {'route': route, 'method': method, 'phase': phase},
+                ))
+            lines.extend([
+                '# HELP diplom_request_duration_quantile_seconds Оценка квантилей времени по гистограмме',
+                '# TYPE diplom_request_duration_quantile_seconds gauge',
+            ])
+            for (route, method, phase), histogram in sorted(self.durations.items()):
+                for share in QUANTILES:
+                    labels = {'route': route, 'method': method, 'phase': phase, 'quantile': str(share)}
+                    lines.append(f'diplom_request_duration_quantile_seconds{format_labels(labels)} {histogram.quantile(share):.6f}')
+            lines.extend([
+                '# HELP diplom_request_db_queries Число запросов к базе на запрос',
+                '# TYPE diplom_request_db_queries histogram',
+            ])
+            for (route, method), histogram in sorted(self.queries.items()):
+                lines.extend(histogram_lines('diplom_request_db_queries', histogram, {'route': route, 'method': method}))
+            lines.extend([
+                '# HELP diplom_requests_total Число ответов по маршрутам и кодам',
+                '# TYPE diplom_requests_total counter',
+            ])
+            for (route, method, status), count in sorted(self.responses.items()):
+                labels = {'route': route, 'method': method, 'status': str(status)}
+                lines.append(f'diplom_requests_total{format_labels(labels)} {count}')
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{format_labels({**labels, "le": str(bound)})} {cumulative}')
+    lines.append(f'{name}_bucket{format_labels({**labels, "le": "+Inf"})} {histogram.count}')
+    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+    return lines
+
+
+route_metrics = RouteMetrics()
+
+
+def queue_metric_lines():
+    from .submissions import submission_queue
+
+    lines = []
+    for name, value in sorted(submission_queue.metrics().items()):
+        metric = f'diplom_submission_queue_{name}'
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {float(value):g}')
+    return lines
+
+
+def render_metrics():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return '\n'.join(route_metrics.render() + queue_metric_lines()) + '\n'
+
+
+def client_address(request):
+    """
+    Адрес клиента. У запроса от доверенного прокси (METRICS_TRUSTED_PROXIES)
+    REMOTE_ADDR - адрес самого прокси, поэтому клиентом считается ближайший
+    к серверу адрес из X-Forwarded-For, не принадлежащий доверенным прокси.
+    Левее него заголовок мог дописать сам клиент. Запрос доверенного прокси
+    без заголовка - от неизвестного клиента (None)
+    """
+    trusted = set(getattr(settings, 'METRICS_TRUSTED_PROXIES', ()))
+    address = request.META.get('REMOTE_ADDR')
+    forwarded = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    while address in trusted:
+        if not forwarded:
+            return None
+        address = forwarded.pop()
+    return address
+
+
+def metrics_allowed(request):
+    """/metrics доступен по токену METRICS_TOKEN, персоналу и с адресов METRICS_ALLOWED_IPS"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {token}'.encode(),
+    ):
+        return True
+    if request.user.is_staff:
+        return True
+    address = client_address(request)
+    return address is not None and address in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Не создаём метку на каждый несуществующий адрес
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def server_timing(seconds, timings):
+    view_seconds = max(seconds - timings.db_seconds - timings.template_seconds, 0.0)
+    return ', '.join([
+        f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.queries} queries"',
+        f'tpl;dur={timings.template_seconds * 1000:.1f}',
+        f'view;dur={view_seconds * 1000:.1f}',
+        f'total;dur={seconds * 1000:.1f}',
+    ])
+
+
+class TimingMiddleware:
+    """Замеряет запрос, добавляет заголовок Server-Timing и пополняет гистограммы маршрута"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, started, timings)
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+        timings = RequestTimings()
+        # sync_to_async копирует контекст, поэтому запросы ORM из потоков попадают в эти же счётчики
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, started, timings)
+
+    def finish(self, request, response, started, timings):
+        # Потоковые ответы читают базу уже после возврата - учитывается только подготовка ответа
+        seconds = time.perf_counter() - started
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = server_timing(seconds, timings)
+        route_metrics.observe(route_name(request), request.method, response.status_code, seconds, timings)
+        return response
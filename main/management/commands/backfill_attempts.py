@@ -0,0 +1,71 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+
+from main.answer_key import get_answer_key
+from main.grading import grade_batch, submission_from_answers
+from main.mastery import rebuild_mastery
+from main.models import Attempt, StudentAnswer, Test
+
+
+class Command(BaseCommand):
+    help = 'Создаёт записи Attempt для попыток, сохранённых только в виде StudentAnswer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Число попыток в одной транзакции')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # Пары (студент, тест) без записи Attempt в порядке прохождения,
+        # чтобы id новых попыток сохраняли хронологию
+        pairs = StudentAnswer.objects.filter(
+            ~Exists(Attempt.objects.filter(user=OuterRef('user'), test=OuterRef('test')))
+        ).values_list('user_id', 'test_id').annotate(last_id=Max('id')).order_by('last_id').iterator()
+
+        created = 0
+        while True:
+            chunk = [(user_id, test_id) for user_id, test_id, _ in islice(pairs, chunk_size)]
+            if not chunk:
+                break
+            created += self.backfill_chunk(chunk)
+            self.stdout.write(f'Создано попыток: {created}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, создано попыток: {created}'))
+
+    def backfill_chunk(self, chunk):
+        wanted = set(chunk)
+        user_ids = {user_id for user_id, _ in chunk}
+        test_ids = {test_id for _, test_id in chunk}
+        tests = Test.objects.select_related('grading_scheme').in_bulk(test_ids)
+
+        answers_by_pair = {}
+        for answer in StudentAnswer.objects.filter(user_id__in=user_ids, test_id__in=test_ids).only(
+            'user_id', 'test_id', 'question_id', 'selected_option_id', 'answer_text'
+        ):
+            pair = (answer.user_id, answer.test_id)
+            if pair in wanted:
+                answers_by_pair.setdefault(pair, []).append(answer)
+
+        # Попытки одного теста проверяются одной пачкой
+        pairs_by_test = {}
+        for user_id, test_id in chunk:
+            pairs_by_test.setdefault(test_id, []).append(user_id)
+
+        attempts = []
+        for test_id, user_ids in pairs_by_test.items():
+            answer_key = get_answer_key(test_id)
+            grades = grade_batch(answer_key, [
+                submission_from_answers(answers_by_pair.get((user_id, test_id), [])) for user_id in user_ids
+            ])
+            for user_id, total_score in zip(user_ids, grades.totals):
+                attempt = Attempt(user_id=user_id, test=tests[test_id], finished_at=None)
+                attempt.set_result(total_score, answer_key.total)
+                attempts.append(attempt)
+        with transaction.atomic():
+            Attempt.objects.bulk_create(attempts, ignore_conflicts=True)
+        # Миграция заполнила усвоение до появления этих попыток, а ответы без
+        # попытки в нём не учитываются. Пересчёт всей истории студентов пачки
+        # верен и тогда, когда их ответы попали в несколько пачек
+        rebuild_mastery(sorted({user_id for user_id, _ in chunk}))
+        return len(attempts)
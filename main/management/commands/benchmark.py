@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.benchmarks import ON_DISK, registry, temporary_database
+
+
+class Command(BaseCommand):
+    help = 'Запускает замер производительности на временной базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Название замера')
+        parser.add_argument('--sizes', help='Размеры данных через запятую')
+        parser.add_argument('--repeat', type=int, help='Число повторов')
+        parser.add_argument('--update-baseline', action='store_true', help='Сохранить результаты как базовые')
+        parser.add_argument('--threshold', type=float, help='Допустимый рост времени ответа, доля от базового')
+
+    def handle(self, *args, **options):
+        benchmarks = registry()
+        if options['name'] not in benchmarks:
+            raise CommandError(f'Неизвестный замер. Доступны: {", ".join(sorted(benchmarks))}')
+        kwargs = {}
+        if options['sizes']:
+            kwargs['sizes'] = [int(size) for size in options['sizes'].split(',')]
+        if options['repeat']:
+            kwargs['repeat'] = options['repeat']
+        if options['update_baseline']:
+            kwargs['update_baseline'] = True
+        if options['threshold'] is not None:
+            kwargs['threshold'] = options['threshold']
+        with temporary_database(on_disk=options['name'] in ON_DISK):
+            failures = benchmarks[options['name']](self.stdout, **kwargs)
+        if failures:
+            raise CommandError(f'Замер не пройден: {len(failures)} нарушений')
@@ -0,0 +1,39 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importers import FORMAT_CHOICES, TestImportError, detect_format, import_tests
+
+
+class Command(BaseCommand):
+    help = 'Импортирует тесты из файлов JSON, Moodle XML или GIFT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы для импорта')
+        parser.add_argument('--creator', required=True, help='Имя пользователя преподавателя')
+        parser.add_argument('--format', choices=[value for value, _ in FORMAT_CHOICES], help='Формат файлов')
+        parser.add_argument('--title', help='Название теста для Moodle XML и GIFT (по умолчанию имя файла)')
+        parser.add_argument('--time-limit', type=int, default=30, help='Время выполнения в минутах')
+
+    def handle(self, *args, **options):
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["creator"]} не найден.')
+
+        for path in options['paths']:
+            file_format = options['format'] or detect_format(path)
+            with open(path, 'rb') as fileobj:
+                try:
+                    tests = import_tests(
+                        fileobj,
+                        file_format,
+                        creator,
+                        title=options['title'] or os.path.splitext(os.path.basename(path))[0],
+                        time_limit=options['time_limit'],
+                    )
+                except TestImportError as error:
+                    raise CommandError(f'{path}:\n' + '\n'.join(error.errors))
+            for test in tests:
+                self.stdout.write(self.style.SUCCESS(f'{path}: создан тест "{test.title}" с кодом {test.code}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from main.bank import fill_hashes, merge_duplicates, prune_orphans
+
+
+class Command(BaseCommand):
+    help = 'Заполняет хэши банка вопросов и сливает одинаковые вопросы вместе с ответами студентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Групп дубликатов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать дубликаты')
+        parser.add_argument('--prune', action='store_true', help='Удалить вопросы удалённых тестов, на которые никто не ссылается')
+
+    def handle(self, *args, **options):
+        filled = fill_hashes()
+        self.stdout.write(f'Заполнено хэшей: {filled}')
+        removed = merge_duplicates(options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Найдено лишних копий: {removed}'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Готово, удалено копий: {removed}'))
+        if options['prune']:
+            self.stdout.write(self.style.SUCCESS(f'Удалено вопросов без тестов: {prune_orphans()}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from main.images import process_questions
+from main.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений вопросов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить копии всех изображений')
+        parser.add_argument('--batch-size', type=int, default=100, help='Число вопросов за один проход')
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            questions = questions.filter(image_variants={})
+        question_ids = list(questions.order_by('id').values_list('id', flat=True))
+        total = 0
+        for start in range(0, len(question_ids), options['batch_size']):
+            total += process_questions(question_ids[start:start + options['batch_size']])
+        self.stdout.write(self.style.SUCCESS(f'Готово, обработано вопросов: {total} из {len(question_ids)}'))
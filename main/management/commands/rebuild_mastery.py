@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.mastery import rebuild_mastery
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает усвоение вопросов (QuestionMastery) по сохранённым ответам завершённых попыток'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='id студента (можно несколько)')
+
+    def handle(self, *args, **options):
+        count = rebuild_mastery(options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Готово, записей усвоения: {count}'))
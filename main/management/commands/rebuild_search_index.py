@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Строит заново полнотекстовый индекс тестов и вопросов (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(self.style.WARNING('Индекса FTS5 нет: поиск работает через LIKE, перестраивать нечего'))
+            return
+        rows = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Готово, в индексе записей: {rows}'))
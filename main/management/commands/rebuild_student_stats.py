@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки студентов (StudentStats) по завершённым попыткам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='id студента (можно несколько)')
+
+    def handle(self, *args, **options):
+        changed = rebuild_stats(options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Готово, исправлено сводок: {changed}'))
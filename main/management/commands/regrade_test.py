@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Test
+from main.regrade import regrade_test
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает результаты всех завершённых попыток теста по текущему ключу ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_id', type=int, help='id теста')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Строк в одном UPDATE')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что изменится')
+
+    def handle(self, *args, **options):
+        try:
+            report = regrade_test(options['test_id'], options['chunk_size'], dry_run=options['dry_run'])
+        except Test.DoesNotExist:
+            raise CommandError(f'Тест {options["test_id"]} не найден')
+        if options['verbosity'] > 1:
+            for attempt, before in report.changed_attempts:
+                self.stdout.write(f'{attempt.user.username}: {before}% -> {attempt.percentage}% ({attempt.grade})')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Изменится" if options["dry_run"] else "Изменено"}: попыток {len(report.changed_attempts)} '
+            f'из {report.attempts} (выше {report.raised}, ниже {report.lowered}), ответов {report.changed_answers}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.stats import rebuild_test_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики тестов (вопросы, прохождения, сумма баллов) по вопросам и попыткам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', dest='tests', help='id теста (можно несколько)')
+
+    def handle(self, *args, **options):
+        changed = rebuild_test_counters(options['tests'])
+        self.stdout.write(self.style.SUCCESS(f'Готово, исправлено тестов: {changed}'))
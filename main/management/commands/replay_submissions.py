@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from main.submissions import journal_dir, orphaned_journals, replay_journal
+
+
+class Command(BaseCommand):
+    help = 'Дописывает в базу попытки из журналов очереди записи, оставшихся после падения процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Файлы журналов (по умолчанию - журналы завершившихся процессов)')
+        parser.add_argument('--dir', default=None, help='Каталог журналов (по умолчанию SUBMISSION_JOURNAL_DIR)')
+        parser.add_argument(
+            '--include-live', action='store_true',
+            help='Обработать и журналы работающих процессов (только при остановленном сервере)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Число попыток в одной транзакции')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or orphaned_journals(options['dir'] or journal_dir(), options['include_live'])
+        if not paths:
+            self.stdout.write('Журналов для восстановления нет')
+            return
+        total = 0
+        for path in paths:
+            found, finished = replay_journal(path, options['batch_size'])
+            total += finished
+            self.stdout.write(f'{path}: записей {found}, завершено попыток {finished}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, завершено попыток: {total}'))
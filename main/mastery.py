@@ -0,0 +1,242 @@
+# main/mastery.py
+"""
+Усвоение вопросов студентом и подбор персонализированного теста.
+
+QuestionMastery хранит по каждой паре студент-вопрос экспоненциальное
+среднее баллов за ответы (strength). Строки обновляются при завершении
+попыток одним upsert-запросом в той же транзакции.
+
+При подборе теста усвоение «забывается» со временем: после
+MASTERY_HALF_LIFE_DAYS без повторения оно считается вдвое меньшим. В тест
+попадают вопросы с усвоением ниже MASTERY_WEAK_LEVEL, чем слабее вопрос,
+тем вероятнее выбор, а отвеченные недавно (MASTERY_SPACING_HOURS)
+выбираются реже. Выбор без возвращения идёт по дереву Фенвика: O(log n)
+на вопрос после построения дерева за O(n).
+
+Персонализированный тест не копирует вопросы, а ссылается на них через
+TestQuestion, поэтому ответы в нём обновляют усвоение исходных вопросов.
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Attempt, QuestionMastery, StudentAnswer, Test, TestQuestion
+
+MASTERY_FIELDS = ['strength', 'answer_count', 'last_score', 'last_seen_at']
+
+
+def learning_rate():
+    return getattr(settings, 'MASTERY_LEARNING_RATE', 0.5)
+
+
+def half_life_days():
+    return getattr(settings, 'MASTERY_HALF_LIFE_DAYS', 14)
+
+
+def weak_level():
+    return getattr(settings, 'MASTERY_WEAK_LEVEL', 0.8)
+
+
+def spacing_hours():
+    return getattr(settings, 'MASTERY_SPACING_HOURS', 12)
+
+
+def update_strength(strength, answer_count, score):
+    """Новое среднее: первый ответ задаёт его целиком, следующие сдвигают на долю learning_rate()"""
+    if not answer_count:
+        return score
+    return strength + learning_rate() * (score - strength)
+
+
+def recall(strength, last_seen_at, now):
+    """Усвоение с поправкой на забывание с момента последнего ответа"""
+    days = max((now - last_seen_at).total_seconds(), 0) / 86400
+    return strength * 0.5 ** (days / half_life_days())
+
+
+def weakness(strength, last_seen_at, now):
+    """Вес вопроса при подборе: слабее и дольше без повторения - больше"""
+    hours = max((now - last_seen_at).total_seconds(), 0) / 3600
+    spacing = min(1, (hours + 1) / (spacing_hours() + 1))
+    return (1 - recall(strength, last_seen_at, now)) * spacing
+
+
+def record_mastery(results):
+    """
+    Учитывает ответы завершённых попыток: results - пары (попытка, оценки
+    вопросов). Вызывается внутри транзакции завершения.
+    """
+    results = sorted(results, key=lambda item: (item[0].finished_at, item[0].id))
+    pairs = {
+        (attempt.user_id, question_grade.question_id)
+        for attempt, grades in results for question_grade in grades
+    }
+    if not pairs:
+        return
+    existing = QuestionMastery.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, _ in pairs},
+        question_id__in={question_id for _, question_id in pairs},
+    )
+    rows = {(row.user_id, row.question_id): row for row in existing}
+    for attempt, grades in results:
+        for question_grade in grades:
+            key = (attempt.user_id, question_grade.question_id)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = QuestionMastery(
+                    user_id=attempt.user_id, question_id=question_grade.question_id,
+                )
+            row.strength = update_strength(row.strength, row.answer_count, question_grade.score)
+            row.answer_count += 1
+            row.last_score = question_grade.score
+            row.last_seen_at = attempt.finished_at
+    QuestionMastery.objects.bulk_create(
+        [rows[key] for key in pairs], batch_size=500,
+        update_conflicts=True, unique_fields=['user', 'question'], update_fields=MASTERY_FIELDS,
+    )
+
+
+def rebuild_mastery(user_ids=None, question_ids=None):
+    """
+    Пересчитывает усвоение по сохранённым ответам (StudentAnswer) в порядке
+    завершения попыток. Вопросы без ответа в истории не сохраняются,
+    поэтому не учитываются. Усвоение вопроса зависит только от ответов на
+    него, поэтому пересчёт можно ограничить вопросами question_ids.
+    """
+    answers = StudentAnswer.objects.all()
+    if user_ids is not None:
+        answers = answers.filter(user_id__in=user_ids)
+    if question_ids is not None:
+        answers = answers.filter(question_id__in=question_ids)
+    attempt = Attempt.objects.filter(
+        user_id=OuterRef('user_id'), test_id=OuterRef('test_id'), status=Attempt.FINISHED,
+    )
+    # Правильный вариант хранит балл за вопрос, неправильные - ноль
+    scores = answers.values('user_id', 'test_id', 'question_id').order_by().annotate(
+        score=Max('score'),
+        attempt_id=Subquery(attempt.values('id')[:1]),
+        finished_at=Subquery(attempt.values('finished_at')[:1]),
+    )
+    rows = {}
+    now = timezone.now()
+    # Восстановленные попытки без времени завершения - самые старые
+    for answer in sorted(
+        (answer for answer in scores if answer['attempt_id'] is not None),
+        key=lambda answer: (answer['finished_at'] is not None, answer['finished_at'] or now, answer['attempt_id']),
+    ):
+        key = (answer['user_id'], answer['question_id'])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = QuestionMastery(user_id=answer['user_id'], question_id=answer['question_id'])
+        row.strength = update_strength(row.strength, row.answer_count, answer['score'])
+        row.answer_count += 1
+        row.last_score = answer['score']
+        row.last_seen_at = answer['finished_at'] or now
+    with transaction.atomic():
+        current = QuestionMastery.objects.all()
+        if user_ids is not None:
+            current = current.filter(user_id__in=user_ids)
+        if question_ids is not None:
+            current = current.filter(question_id__in=question_ids)
+        current.delete()
+        QuestionMastery.objects.bulk_create(rows.values(), batch_size=500)
+    return len(rows)
+
+
+class WeightedSampler:
+    """
+    Выбор индексов без возвращения с вероятностью, пропорциональной весу.
+    Дерево Фенвика хранит префиксные суммы весов: выбор и удаление
+    выбранного - O(log n).
+    """
+
+    def __init__(self, weights):
+        self._weights = [float(weight) for weight in weights]
+        size = len(self._weights)
+        tree = [0.0] * (size + 1)
+        for index, weight in enumerate(self._weights, 1):
+            tree[index] += weight
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self._tree = tree
+        self._total = sum(self._weights)
+        self._remaining = sum(1 for weight in self._weights if weight > 0)
+        self._top = 1 << (size.bit_length() - 1) if size else 0
+
+    def __len__(self):
+        return self._remaining
+
+    def _add(self, index, delta):
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _find(self, value):
+        """Индекс, на вес которого приходится value в префиксных суммах"""
+        position = 0
+        step = self._top
+        while step:
+            following = position + step
+            if following < len(self._tree) and self._tree[following] <= value:
+                position = following
+                value -= self._tree[following]
+            step >>= 1
+        return position
+
+    def take(self, rng):
+        index = self._find(rng.random() * self._total)
+        if index >= len(self._weights) or self._weights[index] <= 0:
+            # Накопленная ошибка округления вывела за последний вес
+            index = max(range(len(self._weights)), key=self._weights.__getitem__)
+        weight = self._weights[index]
+        self._weights[index] = 0.0
+        self._add(index, -weight)
+        self._total -= weight
+        self._remaining -= 1
+        return index
+
+    def sample(self, count, rng):
+        return [self.take(rng) for _ in range(min(count, self._remaining))]
+
+
+def weak_questions(user, now=None):
+    """Вопросы для повторения: [(id вопроса, вес)] с усвоением ниже weak_level()"""
+    now = now or timezone.now()
+    candidates = []
+    rows = QuestionMastery.objects.filter(user=user).values_list('question_id', 'strength', 'last_seen_at')
+    for question_id, strength, last_seen_at in rows.iterator():
+        if recall(strength, last_seen_at, now) < weak_level():
+            candidates.append((question_id, weakness(strength, last_seen_at, now)))
+    return candidates
+
+
+def pick_weak_questions(candidates, count, rng=None):
+    """Выбирает count вопросов из weak_questions() с вероятностью по весу"""
+    # Вопрос, отвеченный сию минуту, не должен выпадать из выбора совсем
+    sampler = WeightedSampler(max(weight, 1e-6) for _, weight in candidates)
+    return [candidates[index][0] for index in sampler.sample(count, rng or random.Random())]
+
+
+def create_personalized_test(user, question_ids):
+    """Тест студента из ссылок на выбранные вопросы"""
+    with transaction.atomic():
+        test = Test.objects.create(
+            title=f"Персонализированный тест для {user.username}",
+            description="Этот тест создан на основе ваших слабых мест: вопросов, на которые вы отвечали неверно или давно не повторяли.",
+            creator=user,
+            time_limit=10,
+            is_active=True,
+            is_personalized=True,
+            # bulk_create ссылок не вызывает сигналы, поэтому счётчик заполняется сразу
+            question_count=len(question_ids),
+        )
+        TestQuestion.objects.bulk_create([
+            TestQuestion(test=test, question_id=question_id, position=position)
+            for position, question_id in enumerate(question_ids)
+        ])
+    return test
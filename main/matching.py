@@ -0,0 +1,135 @@
+# main/matching.py
+"""
+Проверка текстовых ответов.
+
+В поле correct_text_answer можно перечислить несколько принятых ответов
+через «|». Каждый из них - это
+- число с необязательным допуском: «3.14 ± 0.01», «3,14 +- 0,01»;
+- текст, с которым ответ сравнивается после нормализации: NFKC, регистр,
+  «ё» как «е», лишние пробелы и знаки препинания по краям не учитываются.
+  В тексте не короче TEXT_ANSWER_FUZZY_MIN_LENGTH символов допускается
+  TEXT_ANSWER_MAX_TYPOS опечаток (расстояние Левенштейна), кроме текста
+  с цифрами или римскими числами («1999 год», «Пётр I»): в нём одна
+  «опечатка» меняет смысл. «=» в начале ответа требует точного совпадения.
+
+compile_matcher() разбирает эталон один раз (с кэшем по строке эталона)
+в TextMatcher с заранее нормализованными формами: точное совпадение -
+поиск в множестве, опечатки - расстояние в полосе шириной в допуск с
+выходом, как только оно превысило допуск.
+"""
+import re
+import string
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+
+ALTERNATIVE_SEPARATOR = '|'
+EXACT_PREFIX = '='
+TOLERANCE = re.compile(r'\s*(?:±|\+/-|\+-)\s*')
+NUMBER = re.compile(r'[+-]?\d+(?:\.\d+)?')
+# Знаки препинания по краям ответа; «+», «-», «#» и т. п. значимы (−5, C++, C#)
+EDGE_CHARACTERS = string.whitespace + '.,;:!?\'"()«»„“”‘’…'
+# «ё» читается как «е», типографский минус - как дефис
+FOLD = str.maketrans({'ё': 'е', '\u2212': '-'})
+# Погрешность представления дробей при сравнении чисел без допуска
+NUMBER_EPSILON = 1e-9
+# Цифра или отдельное римское число: такие ответы сравниваются без опечаток.
+# Просмотр вперёд требует целого слова из римских цифр, иначе пустое совпадение
+# находилось бы в начале любого слова на c, d, i, l, m, v, x
+NUMERAL = re.compile(r'\d|\b(?=[mdclxvi]+\b)m*(?:c[md]|d?c{0,3})(?:x[cl]|l?x{0,3})(?:i[xv]|v?i{0,3})\b')
+
+
+def max_typos():
+    return getattr(settings, 'TEXT_ANSWER_MAX_TYPOS', 1)
+
+
+def fuzzy_min_length():
+    return getattr(settings, 'TEXT_ANSWER_FUZZY_MIN_LENGTH', 5)
+
+
+def normalize(value):
+    text = unicodedata.normalize('NFKC', value or '').casefold().translate(FOLD)
+    return ' '.join(text.split()).strip(EDGE_CHARACTERS)
+
+
+def parse_number(text):
+    """Число из нормализованного текста («1 000,5» -> 1000.5) или None"""
+    text = text.replace(' ', '').replace(',', '.')
+    return float(text) if NUMBER.fullmatch(text) else None
+
+
+def within_distance(a, b, limit):
+    """Расстояние Левенштейна между a и b не больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    if limit == 0:
+        return a == b
+    over = limit + 1
+    # Клетки дальше limit от диагонали заведомо больше limit
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        char = a[i - 1]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != b[j - 1]))
+            current[j] = value if value < over else over
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+
+class TextMatcher:
+    """Скомпилированный эталон текстового вопроса"""
+    __slots__ = ('exact', 'fuzzy', 'numbers', 'sample')
+
+    def __init__(self, exact, fuzzy, numbers, sample):
+        self.exact = exact  # frozenset нормализованных ответов
+        self.fuzzy = fuzzy  # ((нормализованный ответ, допуск опечаток), ...)
+        self.numbers = numbers  # ((значение, допуск), ...)
+        self.sample = sample  # Первый принятый ответ как есть
+
+    def matches(self, answer):
+        text = normalize(answer)
+        if not text:
+            return False
+        if text in self.exact:
+            return True
+        if self.numbers:
+            value = parse_number(text)
+            if value is not None and any(abs(value - number) <= tolerance for number, tolerance in self.numbers):
+                return True
+        return any(within_distance(text, form, limit) for form, limit in self.fuzzy)
+
+
+def compile_matcher(correct_text_answer):
+    return _compile(correct_text_answer or '', max_typos(), fuzzy_min_length())
+
+
+@lru_cache(maxsize=4096)
+def _compile(correct_text_answer, typos, min_length):
+    exact, fuzzy, numbers, sample = set(), [], [], ''
+    for alternative in correct_text_answer.split(ALTERNATIVE_SEPARATOR):
+        alternative = alternative.strip()
+        strict = alternative.startswith(EXACT_PREFIX)
+        if strict:
+            alternative = alternative[len(EXACT_PREFIX):].strip()
+        if not alternative:
+            continue
+        sample = sample or alternative
+        value, *tolerance = TOLERANCE.split(normalize(alternative), maxsplit=1)
+        number = parse_number(value)
+        if number is not None:
+            spread = parse_number(tolerance[0]) if tolerance else 0.0
+            if spread is not None:
+                numbers.append((number, abs(spread) + NUMBER_EPSILON * max(1.0, abs(number))))
+                continue
+        form = normalize(alternative)
+        exact.add(form)
+        if not strict and typos and len(form) >= min_length and not NUMERAL.search(form):
+            fuzzy.append((form, typos))
+    return TextMatcher(frozenset(exact), tuple(fuzzy), tuple(numbers), sample)
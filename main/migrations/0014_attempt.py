@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_gradingscheme_test_grading_scheme'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('score', models.FloatField(default=0)),
+                ('total', models.IntegerField(default=0)),
+                ('percentage', models.IntegerField(default=0)),
+                ('grade', models.CharField(blank=True, max_length=20)),
+                ('passed', models.BooleanField(default=False)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='main.test')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-id'], name='attempt_user_recent_idx'), models.Index(fields=['test', '-id'], name='attempt_test_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'test'), name='unique_attempt_per_user_test')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    apps.get_model('main', 'TestCodeSequence').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_attempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
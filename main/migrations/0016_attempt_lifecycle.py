@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_testcodesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='status',
+            field=models.CharField(choices=[('in_progress', 'В процессе'), ('finished', 'Завершена')], default='finished', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='AttemptAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_options', models.JSONField(blank=True, default=list)),
+                ('answer_text', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='main.attempt')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.question')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('attempt', 'question'), name='unique_answer_per_attempt_question')],
+            },
+        ),
+    ]
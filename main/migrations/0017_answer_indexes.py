@@ -0,0 +1,71 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_answers(apps, schema_editor):
+    """Оставляет по одной (первой) строке на вопрос и вариант в попытке перед созданием ограничений"""
+    StudentAnswer = apps.get_model('main', 'StudentAnswer')
+    duplicates = StudentAnswer.objects.values(
+        'user_id', 'test_id', 'question_id', 'selected_option_id'
+    ).annotate(keep_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for group in duplicates.iterator():
+        StudentAnswer.objects.filter(
+            user_id=group['user_id'],
+            test_id=group['test_id'],
+            question_id=group['question_id'],
+            selected_option_id=group['selected_option_id'],
+        ).exclude(id=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_attempt_lifecycle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_answers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='studentanswer',
+            name='test',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='main.test'),
+        ),
+        migrations.AlterField(
+            model_name='studentanswer',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['test', 'question'], name='answer_test_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['test', 'user'], name='answer_test_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['user', '-id'], name='answer_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['creator'], name='test_creator_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='test',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-id'], name='test_active_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentanswer',
+            constraint=models.UniqueConstraint(fields=('user', 'test', 'question', 'selected_option'), name='unique_answer_option'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentanswer',
+            constraint=models.UniqueConstraint(condition=models.Q(('selected_option__isnull', True)), fields=('user', 'test', 'question'), name='unique_text_answer'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+
+
+def fill_student_stats(apps, schema_editor):
+    """Сводки по уже завершённым попыткам (то же, что rebuild_student_stats)"""
+    Attempt = apps.get_model('main', 'Attempt')
+    StudentStats = apps.get_model('main', 'StudentStats')
+    latest = Attempt.objects.filter(user_id=OuterRef('user_id'), status='finished').order_by(
+        F('finished_at').desc(nulls_last=True), '-id'
+    )
+    totals = Attempt.objects.filter(status='finished').values('user_id').order_by('user_id').annotate(
+        tests_taken=Count('id'),
+        percentage_sum=Sum('percentage'),
+        pass_count=Count('id', filter=Q(passed=True)),
+        last_attempt_at=Max('finished_at'),
+        last_attempt_id=Subquery(latest.values('id')[:1]),
+    )
+    StudentStats.objects.bulk_create([StudentStats(**row) for row in totals.iterator()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('main', '0018_question_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('tests_taken', models.IntegerField(default=0)),
+                ('percentage_sum', models.BigIntegerField(default=0)),
+                ('pass_count', models.IntegerField(default=0)),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('last_attempt', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.attempt')),
+            ],
+        ),
+        migrations.RunPython(fill_student_stats, migrations.RunPython.noop),
+    ]
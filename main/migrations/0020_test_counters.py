@@ -0,0 +1,57 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:53
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_test_counters(apps, schema_editor):
+    """Счётчики по существующим вопросам и попыткам (то же, что repair_test_counters)"""
+    Test = apps.get_model('main', 'Test')
+    Question = apps.get_model('main', 'Question')
+    Attempt = apps.get_model('main', 'Attempt')
+    questions = Question.objects.filter(test=OuterRef('pk')).order_by().values('test')
+    finished = Attempt.objects.filter(test=OuterRef('pk'), status='finished').order_by().values('test')
+    Test.objects.update(
+        question_count=Coalesce(Subquery(questions.annotate(value=Count('id')).values('value')), 0),
+        attempt_count=Coalesce(Subquery(finished.annotate(value=Count('id')).values('value')), 0),
+        score_sum=Coalesce(Subquery(finished.annotate(value=Sum('percentage')).values('value')), 0),
+        score_sq_sum=Coalesce(Subquery(finished.annotate(value=Sum(F('percentage') * F('percentage'))).values('value')), 0),
+        last_attempt_at=Subquery(finished.annotate(value=Max('finished_at')).values('value')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_student_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='attempt_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='score_sq_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='score_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_test_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+
+def link_owned_questions(apps, schema_editor):
+    """Каждый существующий вопрос входит в свой тест"""
+    Question = apps.get_model('main', 'Question')
+    TestQuestion = apps.get_model('main', 'TestQuestion')
+    links = (TestQuestion(test_id=test_id, question_id=question_id)
+             for question_id, test_id in Question.objects.values_list('id', 'test_id').iterator())
+    TestQuestion.objects.bulk_create(links, batch_size=500)
+
+
+def fill_mastery(apps, schema_editor):
+    """Усвоение по истории ответов (то же, что main.mastery.rebuild_mastery)"""
+    Attempt = apps.get_model('main', 'Attempt')
+    StudentAnswer = apps.get_model('main', 'StudentAnswer')
+    QuestionMastery = apps.get_model('main', 'QuestionMastery')
+    rate = getattr(settings, 'MASTERY_LEARNING_RATE', 0.5)
+    attempt = Attempt.objects.filter(
+        user_id=OuterRef('user_id'), test_id=OuterRef('test_id'), status='finished',
+    )
+    scores = StudentAnswer.objects.values('user_id', 'test_id', 'question_id').order_by().annotate(
+        score=Max('score'),
+        attempt_id=Subquery(attempt.values('id')[:1]),
+        finished_at=Subquery(attempt.values('finished_at')[:1]),
+    )
+    rows = {}
+    now = timezone.now()
+    # Восстановленные попытки без времени завершения - самые старые
+    for answer in sorted(
+        (answer for answer in scores if answer['attempt_id'] is not None),
+        key=lambda answer: (answer['finished_at'] is not None, answer['finished_at'] or now, answer['attempt_id']),
+    ):
+        key = (answer['user_id'], answer['question_id'])
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = QuestionMastery(user_id=key[0], question_id=key[1], strength=answer['score'])
+        else:
+            row.strength += rate * (answer['score'] - row.strength)
+        row.answer_count += 1
+        row.last_score = answer['score']
+        row.last_seen_at = answer['finished_at'] or now
+    QuestionMastery.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_test_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='test',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_questions', to='main.test'),
+        ),
+        migrations.CreateModel(
+            name='TestQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_links', to='main.question')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_links', to='main.test')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='questions',
+            field=models.ManyToManyField(related_name='linked_tests', through='main.TestQuestion', to='main.question'),
+        ),
+        migrations.CreateModel(
+            name='QuestionMastery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strength', models.FloatField(default=0)),
+                ('answer_count', models.IntegerField(default=0)),
+                ('last_score', models.FloatField(default=0)),
+                ('last_seen_at', models.DateTimeField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mastery', to='main.question')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'question'), name='unique_mastery_user_question')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='testquestion',
+            constraint=models.UniqueConstraint(fields=('test', 'question'), name='unique_test_question'),
+        ),
+        migrations.RunPython(link_owned_questions, migrations.RunPython.noop),
+        migrations.RunPython(fill_mastery, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_question_bank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='pool',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='test',
+            name='shuffle_options',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='testquestion',
+            name='section',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# Копия запросов main/search.py на момент миграции
+FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+OPTIONS_SQL = "coalesce((SELECT group_concat(o.text, ' ') FROM main_option o WHERE o.question_id = q.id), '')"
+
+
+def create_search_index(apps, schema_editor):
+    """Индекс FTS5 только на SQLite, где модуль fts5 есть; иначе поиск работает через LIKE"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE main_search USING fts5("
+                    "title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+        except OperationalError:
+            return
+        cursor.execute(
+            'INSERT INTO main_search(rowid, title, body) '
+            f"SELECT 2 * id, {FOLD_SQL.format('title')}, {FOLD_SQL.format('description')} FROM main_test"
+        )
+        cursor.execute(
+            'INSERT INTO main_search(rowid, title, body) '
+            f"SELECT 2 * q.id + 1, {FOLD_SQL.format('q.text')}, {FOLD_SQL.format(OPTIONS_SQL)} FROM main_question q"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS main_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_question_pools'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:44
+
+import hashlib
+import random
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def freeze_draws(apps, schema_editor):
+    """
+    Сохраняет в существующие попытки тестов с пулом выборку, которую они
+    получали до сих пор (копия main.pools.draw_questions на момент миграции)
+    """
+    Test = apps.get_model('main', 'Test')
+    TestQuestion = apps.get_model('main', 'TestQuestion')
+    Option = apps.get_model('main', 'Option')
+    Attempt = apps.get_model('main', 'Attempt')
+    for test in Test.objects.exclude(pool={}, shuffle_options=False):
+        links = TestQuestion.objects.filter(test=test).select_related('question').order_by('question_id')
+        sections = {}
+        text_answers = set()
+        for link in links:
+            sections.setdefault(link.section, []).append(link.question_id)
+            if link.question.is_text_answer:
+                text_answers.add(link.question_id)
+        options = {}
+        for question_id, option_id in Option.objects.filter(question__test_links__test=test).values_list('question_id', 'id'):
+            options.setdefault(question_id, []).append(option_id)
+
+        attempts = list(Attempt.objects.filter(test=test, draw__isnull=True))
+        for attempt in attempts:
+            digest = hashlib.sha256(f'{settings.SECRET_KEY}:pool:{test.pk}:{attempt.user_id}'.encode()).digest()
+            rng = random.Random(int.from_bytes(digest[:8], 'big'))
+            question_ids = []
+            for name, ids in sorted(sections.items()):
+                if test.pool and name not in test.pool:
+                    continue
+                count = min(int(test.pool[name]), len(ids)) if test.pool else len(ids)
+                question_ids.extend(rng.sample(ids, count) if count < len(ids) else ids)
+            option_orders = {}
+            if test.shuffle_options:
+                for question_id in question_ids:
+                    if question_id not in text_answers:
+                        option_ids = sorted(options.get(question_id, []))
+                        option_orders[str(question_id)] = rng.sample(option_ids, len(option_ids))
+            attempt.draw = {'questions': question_ids, 'options': option_orders}
+        Attempt.objects.bulk_update(attempts, ['draw'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='draw',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(freeze_draws, migrations.RunPython.noop),
+    ]
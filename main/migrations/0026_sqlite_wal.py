@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    """
+    Журнал WAL: читатели не ждут писателя. Режим запоминается в файле базы,
+    поэтому достаточно включить его один раз; в памяти режим не меняется
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = WAL')
+
+
+def disable_wal(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode = DELETE')
+
+
+class Migration(migrations.Migration):
+    # Режим журнала нельзя сменить внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('main', '0025_attempt_draw'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal),
+    ]
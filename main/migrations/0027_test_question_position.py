@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+def number_links(apps, schema_editor):
+    """Порядок, в котором вопросы показывались до сих пор: по id вопроса"""
+    TestQuestion = apps.get_model('main', 'TestQuestion')
+    links = []
+    positions = {}
+    for link in TestQuestion.objects.order_by('test_id', 'question_id').only('id', 'test_id').iterator():
+        link.position = positions.get(link.test_id, 0)
+        positions[link.test_id] = link.position + 1
+        links.append(link)
+    TestQuestion.objects.bulk_update(links, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_sqlite_wal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testquestion',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(number_links, migrations.RunPython.noop),
+    ]
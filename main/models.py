@@ -1,8 +1,13 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 from .utils import generate_unique_code
 
+# Порядок вопросов теста, заданный автором; ссылки с одинаковой позицией - по id вопроса
+QUESTION_ORDER = ('test_links__position', 'id')
+
 
 class GradingScheme(models.Model):
     GRADING_TYPE_CHOICES = [
@@ -22,6 +27,11 @@ class GradingScheme(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_grading_type_display()})"
 
+class TestCodeSequence(models.Model):
+    """Счётчик выданных кодов тестов (единственная строка, см. main/utils.py)"""
+    value = models.BigIntegerField(default=0)
+
+
 class Test(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
@@ -31,27 +41,158 @@ class Test(models.Model):
     is_active = models.BooleanField(default=True)
     is_personalized = models.BooleanField(default=False)
     grading_scheme = models.ForeignKey(GradingScheme, on_delete=models.SET_NULL, null=True, blank=True)
+    # Счётчики для кабинетов, обновляются при завершении попыток (main/stats.py)
+    question_count = models.IntegerField(default=0)
+    attempt_count = models.IntegerField(default=0)  # Завершённые попытки, по одной на студента
+    score_sum = models.BigIntegerField(default=0)  # Сумма процентов попыток
+    score_sq_sum = models.BigIntegerField(default=0)  # Сумма квадратов процентов - для разброса
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    # Вопросы теста: свои (Question.test) и, у персонализированных тестов, взятые из других тестов
+    questions = models.ManyToManyField('Question', through='TestQuestion', related_name='linked_tests')
+    # Пул: {раздел: сколько вопросов вытянуть}; пустой - все вопросы всем студентам (main/pools.py)
+    pool = models.JSONField(default=dict, blank=True)
+    shuffle_options = models.BooleanField(default=False)  # Свой порядок вариантов у каждого студента
+
+    class Meta:
+        # Django сравнивает булево поле без "= 1" (WHERE "is_active"), такое условие SQLite
+        # не ищет по составному индексу, поэтому активные тесты индексируются частичными индексами
+        indexes = [
+            models.Index(fields=['creator'], condition=models.Q(is_active=True), name='test_creator_active_idx'),
+            models.Index(fields=['-id'], condition=models.Q(is_active=True), name='test_active_recent_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = generate_unique_code()
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def pool_errors(pool):
+        """Ошибки формата пула {раздел: положительное целое}"""
+        if not isinstance(pool, dict):
+            return ['Пул должен быть объектом {"раздел": число вопросов}.']
+        return [
+            f'Число вопросов раздела "{name}" должно быть положительным целым.'
+            for name, count in pool.items()
+            if not isinstance(count, int) or isinstance(count, bool) or count <= 0
+        ]
+
+    @staticmethod
+    def prefetch_questions(*lookups):
+        """
+        Prefetch вопросов тестов в порядке QUESTION_ORDER; lookups
+        предзагружаются у самих вопросов, например 'options'
+        """
+        return models.Prefetch('questions', queryset=Question.objects.order_by(*QUESTION_ORDER).prefetch_related(*lookups))
+
+    def ordered_questions(self):
+        return self.questions.order_by(*QUESTION_ORDER)
+
+    def clean(self):
+        errors = self.pool_errors(self.pool)
+        if errors:
+            raise ValidationError({'pool': errors})
+
+    def get_grade(self, percentage):
+        """Оценка за процент правильных ответов по схеме оценивания теста"""
+        scheme = self.grading_scheme
+        if not scheme:
+            return 'Зачёт' if percentage >= 60 else 'Незачёт'
+        if scheme.grading_type == 'differentiated':
+            if percentage >= scheme.threshold_5:
+                return "5"
+            elif percentage >= scheme.threshold_4:
+                return "4"
+            elif percentage >= scheme.threshold_3:
+                return "3"
+            elif percentage >= scheme.threshold_2:
+                return "2"
+            return "Незачёт"
+        return "Зачёт" if percentage >= scheme.pass_threshold else "Незачёт"
+
+    @property
+    def is_drawn(self):
+        """Вопросы или варианты у каждого студента свои"""
+        return bool(self.pool) or self.shuffle_options
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.attempt_count if self.attempt_count else 0
+
+    @property
+    def score_stddev(self):
+        if not self.attempt_count:
+            return 0
+        mean = self.avg_score
+        return max(self.score_sq_sum / self.attempt_count - mean * mean, 0) ** 0.5
+
     def __str__(self):
         return self.title
 
 
 class Question(models.Model):
-    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='questions')
+    # Тест, в котором вопрос создан; состав тестов - в TestQuestion. Вопрос банка
+    # переживает этот тест, если на него ссылаются другие (main/bank.py)
+    test = models.ForeignKey(Test, on_delete=models.SET_NULL, null=True, blank=True, related_name='owned_questions')
     text = models.TextField()
     is_text_answer = models.BooleanField(default=False)
     is_multiple_choice = models.BooleanField(default=False)
     correct_text_answer = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='question_images/', null=True, blank=True)  # Новое поле
+    # Уменьшенные копии изображения в WebP: {ширина: путь в хранилище} (см. main/images.py)
+    image_variants = models.JSONField(default=dict, blank=True)
+    # SHA-256 нормализованного содержимого: по нему новые тесты находят уже сохранённый вопрос
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
 
     def __str__(self):
         return self.text
 
+    def _variant_urls(self):
+        from django.core.files.storage import default_storage
+        return sorted((int(width), default_storage.url(name)) for width, name in self.image_variants.items())
+
+    @property
+    def image_srcset(self):
+        return ', '.join(f'{url} {width}w' for width, url in self._variant_urls())
+
+    @property
+    def image_src(self):
+        """Копия для браузеров без srcset: первая не уже области вопроса, иначе оригинал"""
+        for width, url in self._variant_urls():
+            if width >= 600:
+                return url
+        return self.image.url
+
+
+class TestQuestion(models.Model):
+    """
+    Вопрос в составе теста. Каждый вопрос входит в свой тест, а
+    персонализированные тесты ссылаются на вопросы других тестов, не копируя их.
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='question_links')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='test_links')
+    section = models.CharField(max_length=100, blank=True)  # Раздел пула теста
+    position = models.PositiveIntegerField(default=0)  # Место вопроса в тесте
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'question'], name='unique_test_question'),
+        ]
+
+    @staticmethod
+    def next_position(test_id):
+        """Позиция для вопроса, добавленного в конец теста"""
+        last = TestQuestion.objects.filter(test_id=test_id).aggregate(last=models.Max('position'))['last']
+        return 0 if last is None else last + 1
+
+    @staticmethod
+    def test_ids(question_id):
+        """Тесты, в которые входит вопрос"""
+        return list(TestQuestion.objects.filter(question_id=question_id).values_list('test_id', flat=True))
+
+    def __str__(self):
+        return f"Вопрос {self.question_id} в тесте {self.test_id}"
+
 
 class Option(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='options')
@@ -63,20 +204,166 @@ class Option(models.Model):
             Option.objects.filter(question=self.question).exclude(pk=self.pk).update(is_correct=False)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def normalize_correct(options, is_multiple_choice):
+        """
+        То же правило, что в save(), для ещё не сохранённых вариантов перед bulk_create:
+        при одиночном выборе остаётся только первый правильный вариант,
+        а если правильных нет, правильным становится первый.
+        """
+        if not options:
+            return options
+        if not is_multiple_choice:
+            found = False
+            for option in options:
+                if option.is_correct and found:
+                    option.is_correct = False
+                found = found or option.is_correct
+        if not any(option.is_correct for option in options):
+            options[0].is_correct = True
+        return options
+
 
 class StudentAnswer(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    test = models.ForeignKey(Test, on_delete=models.CASCADE)
+    # user и test ищутся по составным индексам из Meta, одиночные индексы внешних ключей не создаются
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, db_index=False)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     selected_option = models.ForeignKey(Option, on_delete=models.CASCADE, null=True, blank=True)
     answer_text = models.TextField(null=True, blank=True)
     is_correct = models.BooleanField(default=False)
     score = models.FloatField(default=0)
 
+    class Meta:
+        constraints = [
+            # Один выбранный вариант на вопрос в попытке; NULL в selected_option не сравнивается,
+            # поэтому текстовые ответы ограничены отдельным условным ограничением
+            models.UniqueConstraint(
+                fields=['user', 'test', 'question', 'selected_option'],
+                name='unique_answer_option',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'test', 'question'],
+                condition=models.Q(selected_option__isnull=True),
+                name='unique_text_answer',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['test', 'question'], name='answer_test_question_idx'),
+            models.Index(fields=['test', 'user'], name='answer_test_user_idx'),
+            models.Index(fields=['user', '-id'], name='answer_user_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Ответ студента {self.user.username} на вопрос {self.question.text}"
 
 
+class Attempt(models.Model):
+    FAILING_GRADES = ('Незачёт', '2')
+    IN_PROGRESS = 'in_progress'
+    FINISHED = 'finished'
+    STATUS_CHOICES = [
+        (IN_PROGRESS, 'В процессе'),
+        (FINISHED, 'Завершена'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attempts')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='attempts')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=FINISHED)
+    started_at = models.DateTimeField(null=True, blank=True)
+    deadline = models.DateTimeField(null=True, blank=True)  # Время, после которого ответы не принимаются
+    finished_at = models.DateTimeField(null=True, blank=True, default=timezone.now)  # Пусто у восстановленных и незавершённых попыток
+    score = models.FloatField(default=0)  # Сумма баллов за вопросы
+    total = models.IntegerField(default=0)  # Число вопросов
+    # Выборка студента из пула, зафиксированная при создании попытки (main/pools.py):
+    # {"questions": [id вопросов], "options": {"id вопроса": [id вариантов]}}; пусто, если тест у всех одинаковый
+    draw = models.JSONField(null=True, blank=True)
+    percentage = models.IntegerField(default=0)
+    grade = models.CharField(max_length=20, blank=True)
+    passed = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'test'], name='unique_attempt_per_user_test'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='attempt_user_recent_idx'),
+            models.Index(fields=['test', '-id'], name='attempt_test_recent_idx'),
+        ]
+
+    def set_result(self, score, total):
+        """Заполняет баллы, процент и оценку по схеме оценивания теста"""
+        self.score = score
+        self.total = total
+        self.percentage = round((score / total) * 100) if total > 0 else 0
+        self.grade = self.test.get_grade(self.percentage)
+        self.passed = self.grade not in self.FAILING_GRADES
+
+    def __str__(self):
+        return f"Попытка {self.user.username} по тесту {self.test.title}"
+
+
+class StudentStats(models.Model):
+    """
+    Сводка по завершённым попыткам студента для шапки кабинета.
+    Обновляется F-выражениями при завершении и удалении попытки (main/stats.py),
+    пересчитывается командой rebuild_student_stats.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    tests_taken = models.IntegerField(default=0)
+    percentage_sum = models.BigIntegerField(default=0)  # Сумма процентов: среднее без накопления ошибки округления
+    pass_count = models.IntegerField(default=0)
+    last_attempt = models.ForeignKey(Attempt, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def average_score(self):
+        return round(self.percentage_sum / self.tests_taken, 2) if self.tests_taken else 0
+
+    def __str__(self):
+        return f"Статистика {self.user_id}: {self.tests_taken} тестов"
+
+
+class QuestionMastery(models.Model):
+    """
+    Насколько студент усвоил вопрос: экспоненциальное среднее баллов за
+    ответы на него. Обновляется при завершении попыток (main/mastery.py),
+    по нему подбираются вопросы персонализированного теста.
+    """
+    # user ищется по ограничению уникальности, одиночный индекс не нужен
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='mastery')
+    strength = models.FloatField(default=0)  # От 0 (не усвоен) до 1
+    answer_count = models.IntegerField(default=0)
+    last_score = models.FloatField(default=0)
+    last_seen_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_mastery_user_question'),
+        ]
+
+    def __str__(self):
+        return f"Усвоение вопроса {self.question_id} студентом {self.user_id}: {self.strength:.2f}"
+
+
+class AttemptAnswer(models.Model):
+    """Ответ на вопрос, сохранённый во время прохождения (до завершения попытки)"""
+    attempt = models.ForeignKey(Attempt, on_delete=models.CASCADE, related_name='answers')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    selected_options = models.JSONField(default=list, blank=True)  # id выбранных вариантов
+    answer_text = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['attempt', 'question'], name='unique_answer_per_attempt_question'),
+        ]
+
+    def __str__(self):
+        return f"Ответ на вопрос {self.question_id} в попытке {self.attempt_id}"
+
+
 class Profile(models.Model):
     ROLE_CHOICES = [
         ('student', 'Студент'),
@@ -0,0 +1,99 @@
+# main/pools.py
+"""
+Пулы вопросов и перемешивание вариантов без отдельных копий теста.
+
+Test.pool задаёт, сколько вопросов вытянуть из каждого раздела
+({"Алгебра": 5, "Геометрия": 5}), раздел вопроса хранится в ссылке
+TestQuestion.section. Набор вопросов и порядок вариантов вытягиваются
+при создании попытки из зерна, которое зависит от теста, студента и
+SECRET_KEY, и сохраняются в Attempt.draw: правка теста или смена ключа
+потом не меняют того, что студент видел. Разделы с id вопросов уже
+лежат в скомпилированном ключе ответов, поэтому вытягивание стоит O(k)
+от числа вытянутых вопросов.
+
+Сохранённая выборка используется при отрисовке страницы (кэшированные
+фрагменты отдельных вопросов собираются в нужном порядке, см.
+main/fragments.py), при автосохранении, проверке, пересчёте и анализе
+вопросов: ответы на невытянутые вопросы отбрасываются, а процент
+считается от вытянутых.
+"""
+import hashlib
+import random
+from typing import NamedTuple
+
+from django.conf import settings
+
+from .answer_key import get_answer_key
+
+
+class Draw(NamedTuple):
+    question_ids: tuple  # В порядке показа
+    option_orders: dict  # {id вопроса: (id вариантов, ...)}, если варианты перемешиваются
+
+
+def attempt_seed(test_id, user_id):
+    digest = hashlib.sha256(f'{settings.SECRET_KEY}:pool:{test_id}:{user_id}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def draw_questions(test, answer_key, user_id):
+    """Выборка студента или None, если тест у всех одинаковый"""
+    if not test.is_drawn:
+        return None
+    rng = random.Random(attempt_seed(test.pk, user_id))
+    question_ids = []
+    for name, ids in answer_key.sections:
+        if test.pool and name not in test.pool:
+            continue
+        count = min(int(test.pool[name]), len(ids)) if test.pool else len(ids)
+        # sample по числу вытянутых, а не по размеру раздела
+        question_ids.extend(rng.sample(ids, count) if count < len(ids) else ids)
+    option_orders = {}
+    if test.shuffle_options:
+        for question_id in question_ids:
+            question_key = answer_key.question(question_id)
+            if not question_key.is_text_answer:
+                option_ids = sorted(question_key.option_ids)
+                option_orders[question_id] = tuple(rng.sample(option_ids, len(option_ids)))
+    return Draw(question_ids=tuple(question_ids), option_orders=option_orders)
+
+
+def new_draw(test, user_id):
+    """Выборка для новой попытки в виде Attempt.draw или None, если тест у всех одинаковый"""
+    draw = draw_questions(test, get_answer_key(test), user_id)
+    if draw is None:
+        return None
+    return {
+        'questions': list(draw.question_ids),
+        'options': {str(question_id): list(order) for question_id, order in draw.option_orders.items()},
+    }
+
+
+def attempt_draw(attempt):
+    """Выборка, сохранённая в попытке, или None"""
+    if attempt is None or attempt.draw is None:
+        return None
+    return Draw(
+        question_ids=tuple(attempt.draw['questions']),
+        option_orders={int(question_id): tuple(order) for question_id, order in attempt.draw['options'].items()},
+    )
+
+
+def student_answer_key(test, attempt, questions=None):
+    """
+    Ключ ответов и выборка попытки: если выборка есть, ключ содержит только
+    вытянутые вопросы. questions передаются в get_answer_key.
+    """
+    answer_key = get_answer_key(test, questions)
+    draw = attempt_draw(attempt)
+    if draw is not None:
+        answer_key = answer_key.restrict(draw.question_ids)
+    return answer_key, draw
+
+
+def drawn_questions(questions, draw):
+    """Вопросы (объекты Question) в порядке выборки"""
+    if draw is None:
+        return list(questions)
+    by_id = {question.id: question for question in questions}
+    return [by_id[question_id] for question_id in draw.question_ids if question_id in by_id]
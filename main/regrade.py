@@ -0,0 +1,156 @@
+# main/regrade.py
+"""
+Пересчёт результатов теста после исправления ключа ответов.
+
+Сохранённые ответы (StudentAnswer) всех завершённых попыток читаются
+одним запросом, собираются в Submission и проверяются заново тем же
+движком, что и при отправке (grade_batch, у попытки с выборкой из пула -
+по ключу выборки, сохранённой в попытке). В базу пишутся только изменившиеся значения:
+ответы группируются по новой паре (is_correct, score), попытки - по
+новому результату, и каждая группа обновляется одним
+UPDATE ... WHERE id IN (...) пачками по chunk_size. После этого
+пересчитываются сводки студентов, счётчики теста и усвоение изменённых
+вопросов у затронутых студентов. Всё выполняется в одной транзакции.
+"""
+from typing import NamedTuple
+
+from django.db import transaction
+
+from .analytics import invalidate_item_stats
+from .answer_key import get_answer_key
+from .grading import Submission, grade_batch
+from .mastery import rebuild_mastery
+from .models import Attempt, StudentAnswer, Test
+from .pools import student_answer_key
+from .stats import rebuild_stats, rebuild_test_counters
+
+REGRADE_FIELDS = ['score', 'total', 'percentage', 'grade', 'passed']
+# NumPy считает баллы в float32, цикл на Python - в float64: такие расхождения изменением не считаются
+SCORE_EPSILON = 1e-6
+
+
+class RegradeReport(NamedTuple):
+    attempts: int  # Пересчитано попыток
+    changed_answers: int
+    # [(попытка, процент до пересчёта)] у попыток, результат которых изменился
+    changed_attempts: list
+
+    @property
+    def raised(self):
+        return sum(1 for attempt, before in self.changed_attempts if attempt.percentage > before)
+
+    @property
+    def lowered(self):
+        return sum(1 for attempt, before in self.changed_attempts if attempt.percentage < before)
+
+
+def _submissions(answers):
+    """{id пользователя: Submission} по строкам (id, user_id, question_id, selected_option_id, answer_text, ...)"""
+    submissions = {}
+    for _, user_id, question_id, option_id, answer_text, *_ in answers:
+        submission = submissions.setdefault(user_id, Submission(selected={}, texts={}))
+        if option_id is None:
+            submission.texts[question_id] = answer_text
+        else:
+            submission.selected.setdefault(question_id, []).append(option_id)
+    return submissions
+
+
+def _grade(test, attempts, submissions):
+    """{id пользователя: (ключ ответов, {id вопроса: QuestionGrade})}"""
+    empty = Submission(selected={}, texts={})
+    rows = {}
+    # Попытки с выборкой из пула проверяются каждая своим ключом, остальные - одним вызовом
+    for attempt in attempts:
+        if attempt.draw is not None:
+            answer_key = student_answer_key(test, attempt)[0]
+            rows[attempt.user_id] = answer_key, grade_batch(answer_key, [submissions.get(attempt.user_id, empty)]).row(0)
+    shared = [attempt for attempt in attempts if attempt.draw is None]
+    if shared:
+        answer_key = get_answer_key(test.pk)
+        batch = grade_batch(answer_key, [submissions.get(attempt.user_id, empty) for attempt in shared])
+        rows.update((attempt.user_id, (answer_key, batch.row(index))) for index, attempt in enumerate(shared))
+    return {
+        user_id: (answer_key, {question_grade.question_id: question_grade for question_grade in grades})
+        for user_id, (answer_key, grades) in rows.items()
+    }
+
+
+def _answer_result(answer_key, grades, question_id, option_id):
+    """Новые (is_correct, score) строки ответа или None, если вопроса больше нет в ключе"""
+    question_grade = grades.get(question_id)
+    if question_grade is None:
+        return None
+    if option_id is None:
+        return question_grade.score == 1, question_grade.score
+    is_correct = option_id in answer_key.question(question_id).correct_option_ids
+    return is_correct, question_grade.score if is_correct else 0
+
+
+def regrade_test(test_id, chunk_size=1000, dry_run=False):
+    """
+    Проверяет заново все завершённые попытки теста по текущему ключу
+    ответов и возвращает RegradeReport. При dry_run ничего не записывает.
+    """
+    test = Test.objects.select_related('grading_scheme').get(pk=test_id)
+    with transaction.atomic():
+        attempts = list(
+            Attempt.objects.select_for_update().select_related('user')
+            .filter(test=test, status=Attempt.FINISHED).order_by('id')
+        )
+        answers = list(StudentAnswer.objects.filter(test=test).values_list(
+            'id', 'user_id', 'question_id', 'selected_option_id', 'answer_text', 'is_correct', 'score',
+        ))
+        graded = _grade(test, attempts, _submissions(answers))
+
+        changed_answers = {}
+        changed_users = set()
+        changed_questions = set()
+        for answer_id, user_id, question_id, option_id, _, is_correct, score in answers:
+            if user_id not in graded:
+                continue
+            result = _answer_result(*graded[user_id], question_id, option_id)
+            if result is not None and (result[0] != is_correct or abs(result[1] - score) > SCORE_EPSILON):
+                changed_answers.setdefault(result, []).append(answer_id)
+                changed_users.add(user_id)
+                changed_questions.add(question_id)
+
+        changed_attempts = []
+        attempt_results = {}
+        for attempt in attempts:
+            answer_key, grades = graded[attempt.user_id]
+            before = {field: getattr(attempt, field) for field in REGRADE_FIELDS}
+            attempt.test = test
+            attempt.set_result(sum(question_grade.score for question_grade in grades.values()), answer_key.total)
+            if abs(attempt.score - before.pop('score')) > SCORE_EPSILON or any(
+                getattr(attempt, field) != value for field, value in before.items()
+            ):
+                changed_attempts.append((attempt, before['percentage']))
+                result = tuple(getattr(attempt, field) for field in REGRADE_FIELDS)
+                attempt_results.setdefault(result, []).append(attempt.pk)
+
+        report = RegradeReport(
+            attempts=len(attempts),
+            changed_answers=sum(len(ids) for ids in changed_answers.values()),
+            changed_attempts=changed_attempts,
+        )
+        if dry_run:
+            return report
+
+        # Различных результатов немного: по одному UPDATE на результат и пачку
+        for (is_correct, score), ids in changed_answers.items():
+            for start in range(0, len(ids), chunk_size):
+                StudentAnswer.objects.filter(pk__in=ids[start:start + chunk_size]).update(
+                    is_correct=is_correct, score=score,
+                )
+        for result, ids in attempt_results.items():
+            for start in range(0, len(ids), chunk_size):
+                Attempt.objects.filter(pk__in=ids[start:start + chunk_size]).update(**dict(zip(REGRADE_FIELDS, result)))
+
+        if changed_attempts:
+            rebuild_stats([attempt.user_id for attempt, _ in changed_attempts])
+            rebuild_test_counters([test.pk])
+        if changed_users:
+            rebuild_mastery(sorted(changed_users), sorted(changed_questions))
+    invalidate_item_stats(test.pk)
+    return report
@@ -0,0 +1,189 @@
+# main/search.py
+"""
+Полнотекстовый поиск преподавателя по своим тестам и вопросам.
+
+На SQLite индекс - виртуальная таблица FTS5 main_search (создаётся
+миграцией 0024): у теста индексируются название и описание, у вопроса -
+текст и тексты вариантов. Строка индекса адресуется rowid: 2 * id у
+теста и 2 * id + 1 у вопроса, поэтому точечное обновление при изменении
+объекта - одна запись по rowid без просмотра индекса. Изменения приходят
+сигналами (main/signals.py) и из TestBuilder, rebuild_index() строит
+индекс заново. Результаты ранжируются bm25 с большим весом названия и
+текста вопроса и отдаются страницами без подсчёта общего числа.
+
+На других базах (или SQLite без FTS5) поиск идёт запросами LIKE.
+"""
+import re
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q
+
+from .models import Question, Test
+
+TABLE = 'main_search'
+# Вес совпадения в названии теста или тексте вопроса относительно описания и вариантов
+TITLE_WEIGHT = 10.0
+WORD = re.compile(r'\w+')
+# unicode61 не считает «ё» и «е» одной буквой
+FOLD = str.maketrans('ёЁ', 'еЕ')
+FOLD_SQL = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+OPTIONS_SQL = "coalesce((SELECT group_concat(o.text, ' ') FROM main_option o WHERE o.question_id = q.id), '')"
+
+_available = {}
+
+
+class SearchHit(NamedTuple):
+    kind: str  # 'test' или 'question'
+    object: object  # Test или Question (linked_tests - тесты преподавателя с вопросом)
+
+
+def page_size():
+    return getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+
+
+def fts_available():
+    """Есть ли индекс FTS5 в текущей базе; проверяется один раз на базу"""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _available:
+        _available[name] = TABLE in connection.introspection.table_names()
+    return _available[name]
+
+
+def fold(text):
+    return (text or '').translate(FOLD)
+
+
+def search_words(query):
+    return WORD.findall(fold(query))[:10]
+
+
+def match_expression(words):
+    """
+    Все слова запроса, последнее - как префикс: "квадратные" "урав"*.
+    Префикс раскрывается во все слова индекса с этим началом, поэтому
+    только у последнего, ещё не дописанного слова.
+    """
+    *complete, last = words
+    return ' '.join([*(f'"{word}"' for word in complete), f'"{last}"*'])
+
+
+def _rowid(kind, pk):
+    return 2 * pk + (kind == 'question')
+
+
+def index_tests(tests):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {TABLE}(rowid, title, body) VALUES (%s, %s, %s)',
+            [(_rowid('test', test.pk), fold(test.title), fold(test.description)) for test in tests],
+        )
+
+
+def index_questions(questions, options_by_question=None):
+    """
+    Индексирует вопросы. Варианты берутся из options_by_question (списки в
+    порядке вопросов) или из question.options - их лучше предзагрузить.
+    """
+    if not fts_available():
+        return
+    if options_by_question is None:
+        options_by_question = [question.options.all() for question in questions]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {TABLE}(rowid, title, body) VALUES (%s, %s, %s)',
+            [
+                (_rowid('question', question.pk), fold(question.text),
+                 fold(' '.join(option.text for option in options)))
+                for question, options in zip(questions, options_by_question)
+            ],
+        )
+
+
+def unindex(kind, pks):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(_rowid(kind, pk),) for pk in pks])
+
+
+def rebuild_index():
+    """Строит индекс заново двумя INSERT ... SELECT; возвращает число строк"""
+    if not fts_available():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE}(rowid, title, body) '
+            f"SELECT 2 * id, {FOLD_SQL.format('title')}, {FOLD_SQL.format('description')} FROM main_test"
+        )
+        cursor.execute(
+            f'INSERT INTO {TABLE}(rowid, title, body) '
+            f"SELECT 2 * q.id + 1, {FOLD_SQL.format('q.text')}, "
+            f'{FOLD_SQL.format(OPTIONS_SQL)} FROM main_question q'
+        )
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _fts_rowids(user, words, offset, limit):
+    # Область поиска - тесты преподавателя и вопросы, входящие в них
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s AND ('
+            f'  (rowid %% 2 = 0 AND rowid / 2 IN (SELECT id FROM main_test WHERE creator_id = %s))'
+            f'  OR (rowid %% 2 = 1 AND rowid / 2 IN ('
+            f'    SELECT l.question_id FROM main_testquestion l'
+            f'    JOIN main_test t ON t.id = l.test_id WHERE t.creator_id = %s))'
+            f') ORDER BY bm25({TABLE}, {TITLE_WEIGHT}, 1.0), rowid LIMIT %s OFFSET %s',
+            [match_expression(words), user.pk, user.pk, limit, offset],
+        )
+        return [('question' if rowid % 2 else 'test', rowid // 2) for rowid, in cursor.fetchall()]
+
+
+def _like_ids(user, words, offset, limit):
+    tests = Test.objects.filter(creator=user)
+    questions = Question.objects.filter(linked_tests__creator=user)
+    for word in words:
+        tests = tests.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        questions = questions.filter(
+            pk__in=Question.objects.filter(Q(text__icontains=word) | Q(options__text__icontains=word)).values('pk')
+        )
+    # Без ранжирования: сначала тесты, затем вопросы
+    ids = [('test', pk) for pk in tests.order_by('pk').values_list('pk', flat=True)[offset:offset + limit]]
+    if len(ids) < limit:
+        start = max(offset - tests.count(), 0)
+        question_ids = questions.distinct().order_by('pk').values_list('pk', flat=True)
+        ids += [('question', pk) for pk in question_ids[start:start + limit - len(ids)]]
+    return ids
+
+
+def search(user, query, page=1):
+    """
+    Страница результатов поиска: (список SearchHit по убыванию
+    релевантности, есть ли следующая страница).
+    """
+    words = search_words(query)
+    if not words:
+        return [], False
+    size = page_size()
+    offset = (max(page, 1) - 1) * size
+    find = _fts_rowids if fts_available() else _like_ids
+    # Лишняя строка показывает, есть ли следующая страница
+    ids = find(user, words, offset, size + 1)
+    has_next = len(ids) > size
+    ids = ids[:size]
+
+    tests = Test.objects.in_bulk([pk for kind, pk in ids if kind == 'test'])
+    questions = Question.objects.prefetch_related(
+        Prefetch('linked_tests', queryset=Test.objects.filter(creator=user).order_by('pk'))
+    ).in_bulk([pk for kind, pk in ids if kind == 'question'])
+    objects = {'test': tests, 'question': questions}
+    hits = [SearchHit(kind, objects[kind][pk]) for kind, pk in ids if pk in objects[kind]]
+    return hits, has_next
@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.contrib.auth.models import User
+from django.db.models import F
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, Test, Question, TestQuestion, Option, Attempt
+from .answer_key import invalidate_answer_key
+from .analytics import invalidate_item_stats
+from .bank import prune_orphans, stored_question_hash
+from .fragments import bump_content_version
+from .images import schedule_variants
+from .search import index_questions, index_tests, unindex
+from .stats import forget_finished
 
 
 @receiver(post_save, sender=User)
@@ -10,3 +18,130 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     else:
         instance.profile.save()
+
+
+# Сброс скомпилированного ключа ответов и фрагментов страницы при изменении содержимого теста
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def invalidate_test_answer_key(sender, instance, **kwargs):
+    invalidate_answer_key(instance.pk)
+    bump_content_version(instance.pk)
+
+
+# Поисковый индекс (main/search.py); TestBuilder индексирует созданное сам
+@receiver(post_save, sender=Test)
+def index_saved_test(sender, instance, **kwargs):
+    index_tests([instance])
+
+
+@receiver(post_delete, sender=Test)
+def unindex_deleted_test(sender, instance, **kwargs):
+    unindex('test', [instance.pk])
+
+
+# Вопросы удалённого теста, на которые не ссылаются другие тесты, удаляются вместе с ним
+@receiver(pre_delete, sender=Test)
+def remember_owned_questions(sender, instance, **kwargs):
+    instance._owned_question_ids = list(instance.owned_questions.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Test)
+def delete_orphaned_questions(sender, instance, **kwargs):
+    question_ids = getattr(instance, '_owned_question_ids', None)
+    if question_ids:
+        prune_orphans(question_ids)
+
+
+def invalidate_tests(test_ids):
+    for test_id in test_ids:
+        if test_id is None:
+            continue
+        invalidate_answer_key(test_id)
+        bump_content_version(test_id)
+
+
+def refresh_question(question_id):
+    """
+    Хэш банка и поисковый индекс вслед за изменённым содержимым, чтобы новые
+    тесты не ссылались на другой вопрос, а поиск находил новый текст
+    """
+    question = Question.objects.prefetch_related('options').filter(pk=question_id).first()
+    if question is not None:
+        Question.objects.filter(pk=question_id).update(content_hash=stored_question_hash(question))
+        index_questions([question])
+
+
+# Вопрос входит в свой тест и в тесты, которые ссылаются на него (банк, персонализированные)
+@receiver(post_save, sender=Question)
+def invalidate_question_answer_key(sender, instance, created, **kwargs):
+    if created and instance.test_id is not None:
+        # Вопрос, созданный по одному, входит в свой тест; TestBuilder создаёт ссылки сам
+        TestQuestion.objects.get_or_create(
+            test_id=instance.test_id, question=instance,
+            defaults={'position': TestQuestion.next_position(instance.test_id)},
+        )
+    elif not created:
+        invalidate_tests({instance.test_id, *TestQuestion.test_ids(instance.pk)})
+    refresh_question(instance.pk)
+
+
+# Копии изображения (main/images.py) строятся заново для нового файла, а старые
+# сразу забываются, чтобы страница не показала прежнюю картинку через srcset.
+# TestBuilder создаёт вопросы bulk_create и ставит копии в обработку сам
+@receiver(pre_save, sender=Question)
+def detect_image_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        instance._image_changed = False
+    elif instance._state.adding:
+        instance._image_changed = bool(instance.image)
+    else:
+        previous = Question.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+        instance._image_changed = (previous or '') != (instance.image.name or '')
+
+
+@receiver(post_save, sender=Question)
+def rebuild_image_variants(sender, instance, created, **kwargs):
+    if not getattr(instance, '_image_changed', False):
+        return
+    instance._image_changed = False
+    if not created and instance.image_variants:
+        instance.image_variants = {}
+        Question.objects.filter(pk=instance.pk).update(image_variants={})
+    schedule_variants([instance])
+
+
+@receiver(post_delete, sender=Question)
+def invalidate_deleted_question_answer_key(sender, instance, **kwargs):
+    # Ссылки на вопрос удалены каскадом раньше и уже сбросили свои тесты
+    invalidate_tests([instance.test_id])
+    unindex('question', [instance.pk])
+
+
+# Ссылки, добавленные или удалённые по одной, меняют счётчик вопросов теста;
+# TestBuilder и персонализированные тесты пишут ссылки bulk_create и заполняют счётчик сами
+@receiver(post_save, sender=TestQuestion)
+def count_linked_question(sender, instance, created, **kwargs):
+    if created:
+        Test.objects.filter(pk=instance.test_id).update(question_count=F('question_count') + 1)
+    invalidate_tests([instance.test_id])
+
+
+@receiver(post_delete, sender=TestQuestion)
+def count_unlinked_question(sender, instance, **kwargs):
+    Test.objects.filter(pk=instance.test_id).update(question_count=F('question_count') - 1)
+    invalidate_tests([instance.test_id])
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def invalidate_option_answer_key(sender, instance, **kwargs):
+    invalidate_tests(TestQuestion.test_ids(instance.question_id))
+    refresh_question(instance.question_id)
+
+
+# Накопленные статистики анализа вопросов нельзя уменьшить, поэтому при удалении попытки они пересчитываются
+@receiver(post_delete, sender=Attempt)
+def invalidate_attempt_item_stats(sender, instance, **kwargs):
+    invalidate_item_stats(instance.test_id)
+    if instance.status == Attempt.FINISHED:
+        forget_finished(instance)
@@ -199,6 +199,7 @@ document.addEventListener('DOMContentLoaded', function() {
                             <label class="form-label">Правильный текстовый ответ:</label>
                             <input type="text" name="question_${questionCount}_correct_text_answer"
                                    class="form-control correct-text-answer-input">
+                            <div class="form-text">Несколько ответов - через «|», число с допуском - «3.14 ± 0.01», «=» в начале - без опечаток.</div>
                         </div>
                         <div class="form-check mb-3">
                             <input type="checkbox" name="question_${questionCount}_is_multiple_choice"
@@ -0,0 +1,202 @@
+# main/stats.py
+"""
+Сводки по завершённым попыткам: StudentStats для кабинета студента и
+счётчики Test (число попыток, сумма и сумма квадратов процентов, время
+последней попытки) для главной страницы и кабинета преподавателя.
+
+При завершении попыток сводки увеличиваются UPDATE с F-выражениями в той
+же транзакции, поэтому параллельные завершения не теряют друг друга, а
+страницы читают готовые числа без агрегации по ответам. При удалении
+завершённой попытки её вклад вычитается. rebuild_stats() и
+rebuild_test_counters() пересчитывают всё по попыткам целиком.
+"""
+from django.db import transaction
+from django.db.models import (
+    BigIntegerField, Case, Count, DateTimeField, F, Max, OuterRef, Q, Subquery, Sum, Value, When,
+)
+
+from .models import Attempt, StudentStats, Test, TestQuestion
+
+STATS_FIELDS = ['tests_taken', 'percentage_sum', 'pass_count', 'last_attempt', 'last_attempt_at']
+
+
+def _is_later(attempt, other):
+    return (attempt.finished_at, attempt.id) > (other.finished_at, other.id)
+
+
+def _per_key(key, values):
+    return Case(
+        *[When(**{key: pk}, then=Value(value)) for pk, value in values.items()],
+        default=Value(0), output_field=BigIntegerField(),
+    )
+
+
+def record_finished(attempts):
+    """Добавляет завершённые попытки в сводки студентов и счётчики тестов; вызывается внутри транзакции завершения"""
+    record_test_results(attempts)
+    counts = {}
+    sums = {}
+    passes = {}
+    latest = {}
+    for attempt in attempts:
+        user_id = attempt.user_id
+        counts[user_id] = counts.get(user_id, 0) + 1
+        sums[user_id] = sums.get(user_id, 0) + attempt.percentage
+        passes[user_id] = passes.get(user_id, 0) + int(attempt.passed)
+        if user_id not in latest or _is_later(attempt, latest[user_id]):
+            latest[user_id] = attempt
+    if not counts:
+        return
+    StudentStats.objects.bulk_create([StudentStats(user_id=user_id) for user_id in counts], ignore_conflicts=True)
+    # Последняя попытка меняется, только если новая завершена не раньше записанной
+    newer = {
+        user_id: Q(user_id=user_id) & (Q(last_attempt_at__isnull=True) | Q(last_attempt_at__lte=attempt.finished_at))
+        for user_id, attempt in latest.items()
+    }
+    StudentStats.objects.filter(user_id__in=list(counts)).update(
+        tests_taken=F('tests_taken') + _per_key('user_id', counts),
+        percentage_sum=F('percentage_sum') + _per_key('user_id', sums),
+        pass_count=F('pass_count') + _per_key('user_id', passes),
+        last_attempt_id=Case(
+            *[When(condition, then=Value(latest[user_id].id)) for user_id, condition in newer.items()],
+            default=F('last_attempt_id'), output_field=BigIntegerField(),
+        ),
+        last_attempt_at=Case(
+            *[When(condition, then=Value(latest[user_id].finished_at)) for user_id, condition in newer.items()],
+            default=F('last_attempt_at'), output_field=DateTimeField(),
+        ),
+    )
+
+
+def record_test_results(attempts):
+    counts = {}
+    sums = {}
+    squares = {}
+    latest = {}
+    for attempt in attempts:
+        test_id = attempt.test_id
+        counts[test_id] = counts.get(test_id, 0) + 1
+        sums[test_id] = sums.get(test_id, 0) + attempt.percentage
+        squares[test_id] = squares.get(test_id, 0) + attempt.percentage ** 2
+        latest[test_id] = max(latest.get(test_id, attempt.finished_at), attempt.finished_at)
+    if not counts:
+        return
+    Test.objects.filter(pk__in=list(counts)).update(
+        attempt_count=F('attempt_count') + _per_key('pk', counts),
+        score_sum=F('score_sum') + _per_key('pk', sums),
+        score_sq_sum=F('score_sq_sum') + _per_key('pk', squares),
+        last_attempt_at=Case(
+            *[
+                When(Q(pk=test_id) & (Q(last_attempt_at__isnull=True) | Q(last_attempt_at__lt=finished_at)),
+                     then=Value(finished_at))
+                for test_id, finished_at in latest.items()
+            ],
+            default=F('last_attempt_at'), output_field=DateTimeField(),
+        ),
+    )
+
+
+def _latest_finished(user_ref):
+    return Attempt.objects.filter(user_id=user_ref, status=Attempt.FINISHED).order_by(
+        F('finished_at').desc(nulls_last=True), '-id'
+    )
+
+
+def forget_finished(attempt):
+    """Вычитает удалённую завершённую попытку из сводки студента"""
+    stats = StudentStats.objects.filter(user_id=attempt.user_id)
+    stats.update(
+        tests_taken=F('tests_taken') - 1,
+        percentage_sum=F('percentage_sum') - attempt.percentage,
+        pass_count=F('pass_count') - int(attempt.passed),
+    )
+    # Ссылку на удалённую попытку база уже обнулила (SET_NULL): берём предыдущую
+    latest = _latest_finished(OuterRef('user_id'))
+    stats.filter(last_attempt__isnull=True).update(
+        last_attempt_id=Subquery(latest.values('id')[:1]),
+        last_attempt_at=Subquery(latest.values('finished_at')[:1]),
+    )
+    Test.objects.filter(pk=attempt.test_id).update(
+        attempt_count=F('attempt_count') - 1,
+        score_sum=F('score_sum') - attempt.percentage,
+        score_sq_sum=F('score_sq_sum') - attempt.percentage ** 2,
+        last_attempt_at=Subquery(
+            Attempt.objects.filter(test_id=attempt.test_id, status=Attempt.FINISHED)
+            .order_by().values('test_id').annotate(last=Max('finished_at')).values('last')
+        ),
+    )
+
+
+def compute_stats(user_ids=None):
+    """Сводки по завершённым попыткам, посчитанные заново: {id пользователя: StudentStats}"""
+    finished = Attempt.objects.filter(status=Attempt.FINISHED)
+    if user_ids is not None:
+        finished = finished.filter(user_id__in=user_ids)
+    latest = _latest_finished(OuterRef('user_id'))
+    totals = finished.values('user_id').order_by('user_id').annotate(
+        tests_taken=Count('id'),
+        percentage_sum=Sum('percentage'),
+        pass_count=Count('id', filter=Q(passed=True)),
+        last_attempt_at=Max('finished_at'),
+        last_attempt_id=Subquery(latest.values('id')[:1]),
+    )
+    return {row['user_id']: StudentStats(**row) for row in totals}
+
+
+def rebuild_stats(user_ids=None):
+    """
+    Пересчитывает сводки и возвращает число строк, которые расходились
+    с попытками (включая лишние и недостающие).
+    """
+    expected = compute_stats(user_ids)
+    with transaction.atomic():
+        current = StudentStats.objects.select_for_update()
+        if user_ids is not None:
+            current = current.filter(user_id__in=user_ids)
+        current = {stats.user_id: stats for stats in current}
+        changed = [
+            stats for user_id, stats in expected.items()
+            if user_id not in current or any(
+                getattr(current[user_id], field) != getattr(stats, field)
+                for field in ('tests_taken', 'percentage_sum', 'pass_count', 'last_attempt_id', 'last_attempt_at')
+            )
+        ]
+        stale = [user_id for user_id in current if user_id not in expected]
+        StudentStats.objects.bulk_create(
+            changed, batch_size=500,
+            update_conflicts=True, unique_fields=['user'], update_fields=STATS_FIELDS,
+        )
+        StudentStats.objects.filter(user_id__in=stale).delete()
+    return len(changed) + len(stale)
+
+
+TEST_COUNTER_FIELDS = ['question_count', 'attempt_count', 'score_sum', 'score_sq_sum', 'last_attempt_at']
+
+
+def rebuild_test_counters(test_ids=None):
+    """Пересчитывает счётчики тестов по вопросам и попыткам; возвращает число исправленных тестов"""
+    tests = Test.objects.all()
+    if test_ids is not None:
+        tests = tests.filter(pk__in=test_ids)
+    questions = TestQuestion.objects.filter(test=OuterRef('pk')).order_by().values('test')
+    finished = Attempt.objects.filter(test=OuterRef('pk'), status=Attempt.FINISHED).order_by().values('test')
+    expected = tests.annotate(
+        expected_question_count=Subquery(questions.annotate(value=Count('id')).values('value')),
+        expected_attempt_count=Subquery(finished.annotate(value=Count('id')).values('value')),
+        expected_score_sum=Subquery(finished.annotate(value=Sum('percentage')).values('value')),
+        expected_score_sq_sum=Subquery(finished.annotate(value=Sum(F('percentage') * F('percentage'))).values('value')),
+        expected_last_attempt_at=Subquery(finished.annotate(value=Max('finished_at')).values('value')),
+    ).only('pk', *TEST_COUNTER_FIELDS)
+    changed = []
+    with transaction.atomic():
+        for test in expected.select_for_update(of=('self',)):
+            values = {field: getattr(test, f'expected_{field}') for field in TEST_COUNTER_FIELDS}
+            # Подзапрос по пустой группе возвращает NULL
+            values = {field: value if value is not None or field == 'last_attempt_at' else 0 for field, value in values.items()}
+            if any(getattr(test, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(test, field, value)
+                changed.append(test)
+        # bulk_update не вызывает сигналы: версия содержимого теста не меняется
+        Test.objects.bulk_update(changed, TEST_COUNTER_FIELDS, batch_size=500)
+    return len(changed)
@@ -0,0 +1,448 @@
+# main/submissions.py
+"""
+Очередь отложенной записи завершённых попыток.
+
+submit_answers проверяет ответы, дописывает их в журнал на диске и сразу
+отвечает студенту. Поток-писатель забирает попытки из очереди и
+завершает их пачками (main.attempts.finalize_attempts): одна транзакция
+на много попыток, поэтому всплеск отправок в конце экзамена не упирается
+в единственную блокировку записи SQLite.
+
+У каждого процесса свой журнал. Запись попадает в журнал до ответа
+студенту и отмечается записанной после коммита, поэтому после падения
+процесса неотмеченные записи повторно обрабатываются - при старте
+писателя в другом процессе (или в процессе, получившем тот же PID) или
+командой replay_submissions. Повторная обработка безопасна: завершённая
+попытка второй раз не завершается. Если пачка не записывается, она
+делится пополам, пока испорченная запись не останется одна; такая запись
+остаётся в журнале, а остальные попытки пачки записываются.
+
+Сервер запускает писателя при старте (start_submission_writer в
+diplom/wsgi.py и diplom/asgi.py), поэтому журналы упавших процессов
+дописываются сразу, а не при первой отправке. Пока попытка лежит в
+каком-либо журнале неотмеченной, её не завершают по автосохранению
+(unwritten_attempt_ids).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .attempts import finalize_attempts
+from .grading import Submission
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PREFIX = 'submissions-'
+JOURNAL_SUFFIX = '.jsonl'
+# Сколько раз писатель повторяет пачку, прежде чем оставить её журналу
+MAX_RETRIES = 5
+
+
+def queue_enabled():
+    return getattr(settings, 'SUBMISSION_QUEUE_ENABLED', True)
+
+
+def journal_dir():
+    return str(getattr(settings, 'SUBMISSION_JOURNAL_DIR', os.path.join(settings.BASE_DIR, 'journal')))
+
+
+def make_record(attempt, submission, submitted_at):
+    return {
+        'op': 'submit',
+        'id': uuid.uuid4().hex,
+        'attempt': attempt.id,
+        'test': attempt.test_id,
+        'selected': {str(question_id): option_ids for question_id, option_ids in submission.selected.items()},
+        'texts': {str(question_id): text for question_id, text in submission.texts.items()},
+        'at': submitted_at.isoformat(),
+    }
+
+
+def record_item(record):
+    """Тройка для finalize_attempts из записи журнала"""
+    submission = Submission(
+        selected={int(question_id): option_ids for question_id, option_ids in record['selected'].items()},
+        texts={int(question_id): text for question_id, text in record['texts'].items()},
+    )
+    return record['attempt'], submission, datetime.fromisoformat(record['at'])
+
+
+def finalize_records(records):
+    """
+    Завершает попытки из записей журнала одной транзакцией, а если она не
+    прошла - по половинам, чтобы испорченная запись не мешала остальным.
+    Возвращает (завершённые попытки, записи, которые не удалось записать).
+    """
+    try:
+        return finalize_attempts(record_item(record) for record in records), []
+    except Exception:
+        if len(records) == 1:
+            logger.exception('Не удалось записать попытку %s', records[0]['attempt'])
+            return [], records
+    middle = len(records) // 2
+    finished, failed = finalize_records(records[:middle])
+    more_finished, more_failed = finalize_records(records[middle:])
+    return finished + more_finished, failed + more_failed
+
+
+class Journal:
+    """Журнал только на дозапись: строки JSON с попытками и отметками о записи"""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def truncate(self):
+        """Очищает журнал, когда все записи в нём отмечены записанными"""
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+
+    def size(self):
+        with self._lock:
+            return self._file.tell()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_journal(path):
+    """Записи журнала, не отмеченные как записанные (битая последняя строка пропускается)"""
+    records = {}
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('op') == 'submit':
+                records[record['id']] = record
+            elif record.get('op') == 'done':
+                for record_id in record['ids']:
+                    records.pop(record_id, None)
+    return list(records.values())
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _journals(directory):
+    """Пары (путь, PID владельца) журналов каталога"""
+    if not os.path.isdir(directory):
+        return []
+    journals = []
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(JOURNAL_PREFIX):
+            continue
+        if name.endswith(JOURNAL_SUFFIX):
+            owner = name[len(JOURNAL_PREFIX):-len(JOURNAL_SUFFIX)]
+        elif name.endswith('.replay'):
+            # Журнал, который начал восстанавливать процесс <pid>: submissions-X.jsonl.<pid>.replay
+            owner = name.rsplit('.', 2)[-2]
+        else:
+            continue
+        journals.append((os.path.join(directory, name), int(owner) if owner.isdigit() else None))
+    return journals
+
+
+def orphaned_journals(directory, include_live=False):
+    """Журналы завершившихся процессов (или все чужие при include_live)"""
+    return [
+        path for path, owner in _journals(directory)
+        if owner != os.getpid() and (include_live or owner is None or not _process_alive(owner))
+    ]
+
+
+def previous_journals(directory):
+    """
+    Журналы с PID текущего процесса, оставшиеся от упавшего процесса с
+    тем же PID. Имеют смысл только до того, как процесс открыл свой журнал.
+    """
+    return [path for path, owner in _journals(directory) if owner == os.getpid()]
+
+
+def claim_journal(path):
+    """
+    Переименовывает журнал, чтобы его не взял второй процесс. Возвращает
+    новый путь или None, если журнал уже забрали.
+    """
+    if path.endswith(f'.{os.getpid()}.replay'):
+        # Уже переименован процессом с текущим PID
+        return path
+    claimed = f'{path}.{os.getpid()}.replay'
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def replay_claimed(claimed, batch_size=500):
+    """
+    Дописывает в базу неотмеченные записи переименованного журнала и
+    удаляет его. Записи, которые не удалось записать, остаются в журнале.
+    Возвращает (найдено записей, завершено попыток).
+    """
+    records = read_journal(claimed)
+    finished = 0
+    failed = []
+    for start in range(0, len(records), batch_size):
+        written, not_written = finalize_records(records[start:start + batch_size])
+        finished += len(written)
+        failed.extend(not_written)
+    if failed:
+        with open(claimed, 'w', encoding='utf-8') as journal:
+            journal.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in failed)
+        logger.error('Журнал %s: не записано %d попыток, они оставлены в журнале', claimed, len(failed))
+    else:
+        os.remove(claimed)
+    return len(records), finished
+
+
+def unwritten_attempt_ids(directory=None):
+    """
+    Попытки с неотмеченными записями в журналах каталога: в очереди любого
+    процесса, не записанные после повторов и ждущие восстановления
+    """
+    attempt_ids = set()
+    for path, _ in _journals(directory or journal_dir()):
+        try:
+            attempt_ids.update(record['attempt'] for record in read_journal(path))
+        except FileNotFoundError:
+            # Журнал успели восстановить и удалить
+            continue
+    return attempt_ids
+
+
+def replay_journal(path, batch_size=500):
+    """
+    Дописывает в базу неотмеченные записи журнала и удаляет его.
+    Журнал сначала переименовывается, чтобы его не взял второй процесс.
+    Возвращает (найдено записей, завершено попыток).
+    """
+    claimed = claim_journal(path)
+    if claimed is None:
+        return 0, 0
+    return replay_claimed(claimed, batch_size)
+
+
+class SubmissionQueue:
+    def __init__(self, directory=None, batch_size=None, max_size=None, batch_wait=None, fsync=None):
+        self.directory = directory or journal_dir()
+        self.batch_size = batch_size or getattr(settings, 'SUBMISSION_BATCH_SIZE', 200)
+        self.max_size = max_size or getattr(settings, 'SUBMISSION_QUEUE_MAX_SIZE', 5000)
+        # Сколько писатель ждёт, добирая пачку после первой попытки
+        self.batch_wait = batch_wait if batch_wait is not None else getattr(settings, 'SUBMISSION_BATCH_WAIT', 0.05)
+        self.fsync = fsync if fsync is not None else getattr(settings, 'SUBMISSION_JOURNAL_FSYNC', True)
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._pending = {}  # id попытки -> время постановки в очередь
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None  # Процесс, запустивший писателя: после fork поток остаётся в родителе
+        self._stopping = threading.Event()
+        self._previous = []  # Журналы упавшего процесса с тем же PID
+        self.journal = None
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'skipped': 0,
+            'rejected': 0,
+            'failed_batches': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_batch_seconds': 0.0,
+            'max_lag_seconds': 0.0,
+            'replayed': 0,
+            'lost_records': 0,  # не записаны после всех повторов, ждут replay_submissions
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            # Журнал с тем же именем мог остаться от упавшего процесса, получившего тот же PID:
+            # его записи восстанавливаются, а не дописываются к новому журналу и не очищаются с ним
+            self._previous = [
+                claimed for claimed in map(claim_journal, previous_journals(self.directory)) if claimed
+            ]
+            path = os.path.join(self.directory, f'{JOURNAL_PREFIX}{os.getpid()}{JOURNAL_SUFFIX}')
+            self.journal = Journal(path, fsync=self.fsync)
+            self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def is_pending(self, attempt_id):
+        """Попытка отправлена, но ещё не записана в базу"""
+        with self._lock:
+            return attempt_id in self._pending
+
+    def submit(self, attempt, submission, submitted_at):
+        """
+        Записывает попытку в журнал и ставит в очередь. Возвращает False,
+        если очередь переполнена - тогда попытку нужно записать сразу.
+        """
+        self.start()
+        if self._queue.full():
+            with self._lock:
+                self.stats['rejected'] += 1
+            return False
+        record = make_record(attempt, submission, submitted_at)
+        with self._lock:
+            # Под общей блокировкой, чтобы писатель не очистил журнал между записью и учётом
+            self.journal.append(record)
+            self._pending[attempt.id] = time.monotonic()
+            self.stats['enqueued'] += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Очередь заполнилась между проверкой и вставкой: запись отменяется, попытка пишется сразу
+            with self._lock:
+                self._pending.pop(attempt.id, None)
+                self.stats['rejected'] += 1
+            self.journal.append({'op': 'done', 'ids': [record['id']]})
+            return False
+        return True
+
+    def metrics(self):
+        with self._lock:
+            oldest = min(self._pending.values(), default=None)
+            metrics = dict(self.stats)
+            metrics.update({
+                'depth': self._queue.qsize(),
+                'max_size': self.max_size,
+                'pending': len(self._pending),
+                'oldest_pending_seconds': time.monotonic() - oldest if oldest is not None else 0.0,
+                'journal_bytes': self.journal.size() if self.journal else 0,
+                'writer_alive': bool(self._thread and self._thread.is_alive()),
+            })
+        return metrics
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        started = time.monotonic()
+        failed = []
+        for retry in range(1, MAX_RETRIES + 1):
+            close_old_connections()
+            try:
+                finished = finalize_attempts(record_item(record) for record in batch)
+                break
+            except Exception:
+                logger.exception('Не удалось записать пачку из %d попыток (попытка %d)', len(batch), retry)
+                with self._lock:
+                    self.stats['failed_batches'] += 1
+                connection.close()
+                time.sleep(min(2 ** retry * 0.1, 5))
+        else:
+            # Ошибка не временная: пачка делится, чтобы испорченные записи не задерживали остальные
+            close_old_connections()
+            finished, failed = finalize_records(batch)
+        failed_ids = {record['id'] for record in failed}
+        written = [record for record in batch if record['id'] not in failed_ids]
+        if written:
+            self.journal.append({'op': 'done', 'ids': [record['id'] for record in written]})
+        now = time.monotonic()
+        with self._lock:
+            for record in written:
+                queued_at = self._pending.pop(record['attempt'], None)
+                if queued_at is not None:
+                    self.stats['max_lag_seconds'] = max(self.stats['max_lag_seconds'], now - queued_at)
+            # Записи остаются в журнале (он больше не очищается) и будут дописаны командой replay_submissions
+            for record in failed:
+                self._pending.pop(record['attempt'], None)
+            self.stats['lost_records'] += len(failed)
+            self.stats['batches'] += 1
+            self.stats['written'] += len(finished)
+            self.stats['skipped'] += len(written) - len(finished)
+            self.stats['last_batch_size'] = len(batch)
+            self.stats['last_batch_seconds'] = now - started
+            if not self._pending and self._queue.empty() and not self.stats['lost_records']:
+                self.journal.truncate()
+
+    def _replay_orphans(self):
+        for path in self._previous + orphaned_journals(self.directory):
+            try:
+                found, finished = replay_journal(path, self.batch_size)
+            except Exception:
+                logger.exception('Не удалось восстановить журнал %s', path)
+                continue
+            with self._lock:
+                self.stats['replayed'] += finished
+            logger.info('Журнал %s: восстановлено %d из %d попыток', path, finished, found)
+
+    def _run(self):
+        self._replay_orphans()
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+        connection.close()
+
+    def stop(self, timeout=10):
+        """Дописывает очередь и останавливает писателя (вызывается при выходе процесса)"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+submission_queue = SubmissionQueue()
+
+
+def start_submission_writer():
+    """Запускает писателя при старте сервера, чтобы журналы упавших процессов дописались сразу"""
+    if queue_enabled():
+        submission_queue.start()
+
+
+def enqueue_submission(attempt, submission, submitted_at):
+    """
+    Ставит завершённую попытку в очередь записи. Возвращает False, если
+    попытку нужно завершить сразу: очередь выключена, переполнена или
+    вызов идёт внутри транзакции, которую писатель не увидит.
+    """
+    if not queue_enabled() or connection.in_atomic_block:
+        return False
+    return submission_queue.submit(attempt, submission, submitted_at)
@@ -0,0 +1,9 @@
+from django.core.cache import cache
+
+from main.answer_key import answer_key_cache
+
+
+def clear_caches():
+    """Кэши переживают откат транзакции теста, а id объектов после отката повторяются"""
+    cache.clear()
+    answer_key_cache.clear()
@@ -0,0 +1,86 @@
+"""
+Асинхронные страницы прохождения теста (main.async_views) ведут себя
+так же, как синхронные.
+"""
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main import async_views
+from main.benchmarks.asgi import urlconf
+from main.builders import TestBuilder
+from main.models import Attempt, AttemptAnswer, StudentAnswer
+
+from . import clear_caches
+
+
+@override_settings(ROOT_URLCONF=urlconf(async_views), SUBMISSION_QUEUE_ENABLED=False)
+class AsyncAttemptViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='p')
+        cls.teacher.profile.role = 'teacher'
+        cls.teacher.profile.save()
+        cls.student = User.objects.create_user('student', password='p')
+        cls.student.profile.role = 'student'
+        cls.student.profile.save()
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(
+            title='Тест',
+            description='',
+            time_limit=10,
+            grading={'name': 'Мои настройки'},
+            questions=[
+                {'text': 'Выбор', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+                {'text': 'Текст', 'is_text_answer': True, 'correct_text_answer': 'ответ'},
+            ],
+        )
+        cls.test, = builder.save()
+        cls.choice, cls.text = cls.test.questions.order_by('id')
+        cls.correct = cls.choice.options.get(is_correct=True)
+
+    def setUp(self):
+        clear_caches()
+
+    async def test_attempt_flow(self):
+        await self.async_client.aforce_login(self.student)
+        response = await self.async_client.post(reverse('enter_test_code'), {'code': self.test.code})
+        self.assertRedirects(response, reverse('start_test', args=[self.test.id]), fetch_redirect_response=False)
+
+        response = await self.async_client.get(reverse('start_test', args=[self.test.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Выбор')
+        self.assertEqual(await Attempt.objects.filter(user=self.student, test=self.test).acount(), 1)
+
+        response = await self.async_client.post(
+            reverse('autosave_answers', args=[self.test.id]),
+            json.dumps({'answers': {str(self.choice.id): [self.correct.id]}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['saved'], 1)
+        self.assertEqual(await AttemptAnswer.objects.filter(attempt__user=self.student).acount(), 1)
+
+        response = await self.async_client.post(reverse('submit_answers', args=[self.test.id]), {
+            f'answer_{self.choice.id}': [str(self.correct.id)],
+            f'answer_{self.text.id}': 'Ответ',
+        })
+        self.assertEqual(response.status_code, 200)
+        attempt = await Attempt.objects.aget(user=self.student, test=self.test)
+        self.assertEqual(attempt.status, Attempt.FINISHED)
+        self.assertEqual(attempt.percentage, 100)
+        self.assertEqual(await StudentAnswer.objects.filter(user=self.student, test=self.test).acount(), 2)
+
+        response = await self.async_client.get(reverse('start_test', args=[self.test.id]))
+        self.assertContains(response, 'Повторное прохождение невозможно')
+
+    async def test_unknown_code(self):
+        await self.async_client.aforce_login(self.student)
+        response = await self.async_client.post(reverse('enter_test_code'), {'code': 'NOPE00'})
+        self.assertContains(response, 'Тест с таким кодом не найден.')
+
+    async def test_teacher_cannot_start(self):
+        await self.async_client.aforce_login(self.teacher)
+        response = await self.async_client.get(reverse('start_test', args=[self.test.id]))
+        self.assertContains(response, 'Этот тест сейчас недоступен.')
@@ -0,0 +1,83 @@
+"""
+Проверка ответов из формы: повторы варианта в POST не меняют оценку и
+одинаково обрабатываются векторизованной проверкой и циклом на Python;
+ключ ответов процесса устаревает вместе с версией содержимого теста.
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.datastructures import MultiValueDict
+
+from main.answer_key import get_answer_key
+from main.builders import TestBuilder
+from main.fragments import bump_content_version
+from main.grading import grade_batch, submission_from_post
+from main.models import Option, StudentAnswer
+
+from . import clear_caches
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False)
+class DuplicateOptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        builder = TestBuilder(User.objects.create_user('teacher'))
+        builder.add_test(title='Столицы', description='', time_limit=10, questions=[
+            {'text': 'Столица Франции', 'options': [{'text': 'Париж', 'is_correct': True}, {'text': 'Лион'}]},
+            {'text': 'Города Франции', 'is_multiple_choice': True, 'options': [
+                {'text': 'Париж', 'is_correct': True}, {'text': 'Лион', 'is_correct': True}, {'text': 'Берлин'},
+            ]},
+        ])
+        cls.test, = builder.save()
+
+    def setUp(self):
+        clear_caches()
+
+    def duplicated_post(self):
+        answer_key = get_answer_key(self.test.id)
+        single, multiple = answer_key.questions
+        paris = min(single.correct_option_ids)
+        first, second = sorted(multiple.correct_option_ids)
+        return answer_key, {
+            f'answer_{single.id}': [str(paris), str(paris)],
+            f'answer_{multiple.id}': [str(first), str(first), str(second)],
+        }
+
+    def test_duplicates_are_dropped_and_both_paths_agree(self):
+        answer_key, data = self.duplicated_post()
+        submission = submission_from_post(answer_key, MultiValueDict(data))
+        self.assertTrue(all(len(ids) == len(set(ids)) for ids in submission.selected.values()))
+        for use_numpy in (False, True):
+            batch = grade_batch(answer_key, [submission], use_numpy=use_numpy)
+            self.assertEqual([grade.score for grade in batch.row(0)], [1, 1], use_numpy)
+
+    def test_duplicate_submit_is_saved_once(self):
+        _, data = self.duplicated_post()
+        student = User.objects.create_user('student')
+        student.profile.role = 'student'
+        student.profile.save()
+        self.client.force_login(student)
+        self.client.get(reverse('start_test', args=[self.test.id]))
+        response = self.client.post(reverse('submit_answers', args=[self.test.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StudentAnswer.objects.filter(user=student).count(), 3)
+
+
+class AnswerKeyVersionTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        builder = TestBuilder(User.objects.create_user('teacher'))
+        builder.add_test(title='Столицы', description='', time_limit=10, questions=[
+            {'text': 'Столица Франции', 'options': [{'text': 'Париж', 'is_correct': True}, {'text': 'Лион'}]},
+        ])
+        self.test, = builder.save()
+
+    def test_key_follows_content_version_of_other_processes(self):
+        question_key, = get_answer_key(self.test.id).questions
+        lyon = Option.objects.get(question_id=question_key.id, is_correct=False)
+        # Правка в другом процессе: сигналы там не сбросят ключ этого процесса,
+        # но поменяют общую версию содержимого
+        Option.objects.filter(id=lyon.id).update(is_correct=True)
+        self.assertIs(get_answer_key(self.test.id).questions[0], question_key)
+        bump_content_version(self.test.id)
+        self.assertEqual(get_answer_key(self.test.id).questions[0].correct_option_ids, question_key.option_ids)
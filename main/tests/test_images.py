@@ -0,0 +1,109 @@
+"""
+Уменьшенные копии изображений вопросов: WebP под именами из хэша
+содержимого, srcset на странице теста, кэширование копий навсегда и
+пересборка копий при замене изображения.
+"""
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from main.builders import TestBuilder
+from main.fragments import test_questions_html
+from main.images import VARIANT_CACHE_CONTROL
+from main.models import Question
+
+from . import clear_caches
+
+
+def upload(width, height, name='photo.jpg'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 120, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class QuestionImageTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGE_WORKER_ENABLED=False, QUESTION_IMAGE_WIDTHS=(320, 640, 1280),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.teacher = User.objects.create_user('teacher')
+
+    def make_test(self, *images):
+        builder = TestBuilder(self.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[
+            {'text': f'Вопрос {number}', 'image': image, 'options': [{'text': 'да', 'is_correct': True}]}
+            for number, image in enumerate(images)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            test, = builder.save()
+        return test
+
+    def test_variants_after_commit(self):
+        test = self.make_test(upload(2000, 1000))
+        question = Question.objects.get(test=test)
+        self.assertEqual(sorted(question.image_variants, key=int), ['320', '640', '1280'])
+        for width, name in question.image_variants.items():
+            self.assertRegex(name, rf'^question_images/variants/[0-9a-f]{{16}}-{width}\.webp$')
+            with Image.open(f'{self.media_root}/{name}') as variant:
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertEqual(variant.size, (int(width), int(width) // 2))
+        self.assertTrue(question.image_src.endswith('-640.webp'))
+
+        html = test_questions_html(test.id)
+        self.assertIn('srcset="/media/question_images/variants/', html)
+        self.assertIn(' 1280w', html)
+
+        response = self.client.get(question.image_src)
+        self.assertEqual(response['Cache-Control'], VARIANT_CACHE_CONTROL)
+
+    def test_same_content_shares_files(self):
+        test = self.make_test(upload(700, 300, 'a.jpg'), upload(700, 300, 'b.jpg'))
+        first, second = Question.objects.filter(test=test).order_by('id')
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants, second.image_variants)
+        # Узкое изображение не увеличивается
+        self.assertEqual(sorted(first.image_variants, key=int), ['320', '640', '700'])
+
+    def test_question_without_variants_shows_original(self):
+        builder = TestBuilder(self.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[
+            {'text': 'Вопрос', 'image': upload(100, 100), 'options': [{'text': 'да', 'is_correct': True}]},
+        ])
+        test, = builder.save()
+        html = test_questions_html(test.id)
+        self.assertNotIn('srcset', html)
+        self.assertIn(Question.objects.get(test=test).image.url, html)
+
+    def test_replaced_image_gets_new_variants(self):
+        test = self.make_test(upload(2000, 1000))
+        question = Question.objects.get(test=test)
+        old_variants = question.image_variants
+        test_questions_html(test.id)
+
+        question.image = upload(800, 800, 'square.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        question.refresh_from_db()
+        self.assertEqual(sorted(question.image_variants, key=int), ['320', '640', '800'])
+        self.assertFalse(set(question.image_variants.values()) & set(old_variants.values()))
+        self.assertIn(question.image_variants['640'], test_questions_html(test.id))
+
+    def test_removed_image_drops_variants(self):
+        test = self.make_test(upload(700, 300))
+        question = Question.objects.get(test=test)
+        question.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        question.refresh_from_db()
+        self.assertEqual(question.image_variants, {})
+        self.assertNotIn('srcset', test_questions_html(test.id))
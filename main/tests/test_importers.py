@@ -0,0 +1,103 @@
+"""
+Импорт тестов: файл с неверной структурой или параметрами оценивания
+отклоняется списком ошибок, а не падает при разборе или записи; все
+принятые ответы GIFT и Moodle XML вместе с допуском чисел попадают в эталон.
+"""
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from main.importers import TestImportError, import_tests, parse_gift, parse_json, parse_moodle_xml, validate_tests
+from main.matching import compile_matcher
+from main.models import GradingScheme, Test
+
+QUESTION = {'text': 'Столица Франции?', 'options': [{'text': 'Париж', 'is_correct': True}, {'text': 'Лион'}]}
+
+
+def json_file(**test):
+    return io.BytesIO(json.dumps({'title': 'Тест', 'time_limit': 10, 'questions': [QUESTION], **test}).encode())
+
+
+class JsonImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.teacher.profile.role = 'teacher'
+        cls.teacher.profile.save()
+
+    def errors(self, fileobj):
+        with self.assertRaises(TestImportError) as raised:
+            import_tests(fileobj, 'json', self.teacher)
+        return raised.exception.errors
+
+    def test_wrong_structure(self):
+        self.assertEqual(self.errors(json_file(questions=['abc'])), ['Тест 1, вопрос 1: вопрос должен быть JSON-объектом.'])
+        self.assertEqual(self.errors(json_file(questions={'text': 'abc'})), ['Тест 1: вопросы должны быть списком.'])
+        bad_options = {**QUESTION, 'options': ['Париж', 'Лион']}
+        self.assertEqual(
+            self.errors(json_file(questions=[QUESTION, bad_options])),
+            ['Тест 1, вопрос 2: варианты ответа должны быть списком JSON-объектов.'],
+        )
+        self.assertEqual(
+            self.errors(json_file(questions=[{**QUESTION, 'is_multiple_choice': 'yes'}])),
+            ['Тест 1, вопрос 1: "is_multiple_choice" должно быть true или false.'],
+        )
+        self.assertEqual(self.errors(json_file(grading=[60])), ['Тест 1: параметры оценивания должны быть JSON-объектом.'])
+        self.assertFalse(Test.objects.exists())
+
+    def test_grading_values(self):
+        errors = self.errors(json_file(grading={'pass_threshold': 'abc', 'threshold_5': 101, 'grading_type': 'other'}))
+        self.assertEqual(len(errors), 3)
+        self.assertIn('Тест 1: параметр оценивания pass_threshold должен быть целым числом от 0 до 100.', errors)
+        self.assertFalse(GradingScheme.objects.exists())
+
+        test, = import_tests(json_file(grading={'grading_type': 'non_differentiated', 'pass_threshold': '70'}), 'json', self.teacher)
+        self.assertEqual(test.grading_scheme.pass_threshold, 70)
+
+    def test_parsed_tests_are_validated(self):
+        tests = parse_json(json_file(), {})
+        self.assertEqual(validate_tests(tests)[0]['time_limit'], 10)
+        tests[0]['grading'] = {'threshold_2': True}
+        with self.assertRaises(TestImportError):
+            validate_tests(tests)
+
+    def test_upload_shows_errors(self):
+        self.client.force_login(self.teacher)
+        upload = SimpleUploadedFile('tests.json', json_file(questions=['abc']).getvalue())
+        response = self.client.post(reverse('import_tests'), {'file': upload, 'time_limit': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['errors'], ['Тест 1, вопрос 1: вопрос должен быть JSON-объектом.'])
+
+
+class AcceptedAnswersTests(TestCase):
+    def correct_answers(self, parse, content):
+        return [question['correct_text_answer'] for question in parse(content, {})[0]['questions']]
+
+    def test_gift(self):
+        content = io.StringIO(
+            'Сколько будет 2+2? {=4 =четыре =%50%5}\n\n'
+            'Число пи {#3.14:0.01}\n\n'
+            'Год {#=2000:0 #Верно =%50%1999 =2001:1}\n\n'
+            'От одного до пяти {#1..5}\n'
+        )
+        self.assertEqual(self.correct_answers(parse_gift, content), ['4 | четыре', '3.14 ± 0.01', '2000 | 2001 ± 1', '3 ± 2'])
+        self.assertTrue(compile_matcher('3.14 ± 0.01').matches('3,145'))
+        with self.assertRaises(TestImportError):
+            parse_gift(io.StringIO('Число {#пи}'), {})
+
+    def test_moodle_xml(self):
+        content = io.BytesIO(
+            '<quiz>'
+            '<question type="shortanswer"><questiontext><text>2+2</text></questiontext>'
+            '<answer fraction="100"><text>4</text></answer><answer fraction="100"><text>четыре</text></answer>'
+            '<answer fraction="50"><text>5</text></answer></question>'
+            '<question type="numerical"><questiontext><text>Пи</text></questiontext>'
+            '<answer fraction="100"><text>3.14</text><tolerance>0.01</tolerance></answer>'
+            '<answer fraction="100"><text>*</text><tolerance>0</tolerance></answer></question>'
+            '</quiz>'.encode()
+        )
+        self.assertEqual(self.correct_answers(parse_moodle_xml, content), ['4 | четыре', '3.14 ± 0.01'])
@@ -0,0 +1,77 @@
+"""
+Замеры запросов: заголовок Server-Timing, гистограммы маршрутов и /metrics.
+"""
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from main.instrumentation import DURATION_BUCKETS, Histogram, route_metrics
+
+
+class HistogramTests(SimpleTestCase):
+    def test_quantiles(self):
+        histogram = Histogram(DURATION_BUCKETS)
+        for _ in range(90):
+            histogram.observe(0.004)
+        for _ in range(10):
+            histogram.observe(0.3)
+        self.assertGreater(histogram.quantile(0.5), 0.0025)
+        self.assertLessEqual(histogram.quantile(0.5), 0.005)
+        self.assertGreater(histogram.quantile(0.99), 0.25)
+        self.assertLessEqual(histogram.quantile(0.99), 0.5)
+        self.assertEqual(histogram.count, 100)
+
+
+class TimingMiddlewareTests(TestCase):
+    def setUp(self):
+        route_metrics.reset()
+        self.student = User.objects.create_user('student', password='p')
+        self.student.profile.role = 'student'
+        self.student.profile.save()
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.student)
+        response = self.client.get(reverse('student_dashboard'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertNotIn('desc="0 queries"', timing)
+
+    def test_metrics_endpoint(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('student_dashboard'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'diplom_request_duration_seconds_count{route="student_dashboard",method="GET",phase="total"} 1', body
+        )
+        self.assertIn('diplom_request_duration_quantile_seconds{route="student_dashboard",method="GET",phase="db",quantile="0.95"}', body)
+        self.assertIn('diplom_requests_total{route="student_dashboard",method="GET",status="200"} 1', body)
+        self.assertIn('diplom_submission_queue_depth', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_forbidden_for_others(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TRUSTED_PROXIES=['127.0.0.1'])
+    def test_metrics_behind_proxy(self):
+        url = reverse('metrics')
+        # Прокси на той же машине: REMOTE_ADDR всегда 127.0.0.1, а клиент - в X-Forwarded-For
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='203.0.113.5').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='127.0.0.1, 203.0.113.5').status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.2']):
+            self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    @override_settings(PERFORMANCE_METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
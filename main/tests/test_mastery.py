@@ -0,0 +1,135 @@
+"""
+Усвоение вопросов обновляется при завершении попыток, а персонализированный
+тест ссылается на слабые вопросы, не копируя их.
+"""
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.answer_key import get_answer_key
+from main.builders import TestBuilder
+from main.mastery import WeightedSampler, rebuild_mastery, recall, weak_questions
+from main.models import Attempt, Option, Question, QuestionMastery, StudentAnswer, Test, TestQuestion
+
+from . import clear_caches
+
+
+class WeightedSamplerTests(SimpleTestCase):
+    def test_without_replacement(self):
+        sampler = WeightedSampler([1, 0, 2, 3])
+        picked = sampler.sample(10, random.Random(1))
+        self.assertEqual(sorted(picked), [0, 2, 3])
+        self.assertEqual(len(sampler), 0)
+
+    def test_proportional(self):
+        rng = random.Random(2)
+        counts = [0, 0]
+        for _ in range(2000):
+            counts[WeightedSampler([1, 3]).take(rng)] += 1
+        self.assertAlmostEqual(counts[1] / 2000, 0.75, delta=0.05)
+
+    def test_recall_decays(self):
+        now = timezone.now()
+        with self.settings(MASTERY_HALF_LIFE_DAYS=14):
+            self.assertAlmostEqual(recall(0.8, now - timedelta(days=14), now), 0.4)
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False, MASTERY_LEARNING_RATE=0.5)
+class PersonalizedTestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.student = User.objects.create_user('student')
+        cls.student.profile.role = 'student'
+        cls.student.profile.save()
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[
+            {'text': f'Вопрос {number}', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]}
+            for number in range(4)
+        ])
+        cls.test, = builder.save()
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.student)
+
+    def submit(self, test, correct):
+        """Отвечает верно на вопросы из correct и неверно на остальные"""
+        self.client.get(reverse('start_test', args=[test.id]))
+        data = {}
+        for question in test.questions.prefetch_related('options'):
+            option = next(option for option in question.options.all() if option.is_correct == (question.id in correct))
+            data[f'answer_{question.id}'] = [str(option.id)]
+        self.client.post(reverse('submit_answers', args=[test.id]), data)
+
+    def strengths(self):
+        return dict(QuestionMastery.objects.filter(user=self.student).values_list('question_id', 'strength'))
+
+    def test_personalized_test_links_weak_questions(self):
+        question_ids = sorted(self.test.questions.values_list('id', flat=True))
+        self.submit(self.test, correct=set(question_ids[:2]))
+        self.assertEqual(self.strengths(), {question_ids[0]: 1, question_ids[1]: 1, question_ids[2]: 0, question_ids[3]: 0})
+
+        questions_before = Question.objects.count()
+        options_before = Option.objects.count()
+        response = self.client.post(reverse('generate_custom_test'), {'num_questions': 2})
+        personalized = Test.objects.get(is_personalized=True)
+        self.assertRedirects(response, reverse('start_test', args=[personalized.id]))
+        self.assertEqual(sorted(personalized.questions.values_list('id', flat=True)), question_ids[2:])
+        self.assertEqual(personalized.question_count, 2)
+        self.assertEqual((Question.objects.count(), Option.objects.count()), (questions_before, options_before))
+
+        # Ответы в персонализированном тесте обновляют усвоение исходных вопросов
+        self.submit(personalized, correct={question_ids[2]})
+        self.assertEqual(self.strengths()[question_ids[2]], 0.5)
+        self.assertEqual(self.strengths()[question_ids[3]], 0)
+        self.assertEqual(self.client.get(reverse('test_result', args=[personalized.id])).status_code, 200)
+
+        self.assertEqual(rebuild_mastery([self.student.id]), 4)
+        self.assertEqual(self.strengths()[question_ids[2]], 0.5)
+
+    def test_not_enough_weak_questions(self):
+        self.submit(self.test, correct=set(self.test.questions.values_list('id', flat=True)))
+        self.assertEqual(weak_questions(self.student), [])
+        response = self.client.post(reverse('generate_custom_test'), {'num_questions': 1})
+        self.assertIn('Недостаточно', response.context['error'])
+        self.assertFalse(Test.objects.filter(is_personalized=True).exists())
+
+    def test_shared_question_edit_resets_linked_tests(self):
+        question = self.test.questions.order_by('id').first()
+        self.submit(self.test, correct=set())
+        self.client.post(reverse('generate_custom_test'), {'num_questions': 4})
+        personalized = Test.objects.get(is_personalized=True)
+        self.assertEqual(TestQuestion.test_ids(question.id), [self.test.id, personalized.id])
+        get_answer_key(personalized.id)
+        option = question.options.get(is_correct=False)
+        option.is_correct = True
+        option.save()
+        # Бывший неправильный вариант теперь засчитывается и в персонализированном тесте
+        self.client.get(reverse('start_test', args=[personalized.id]))
+        self.client.post(reverse('submit_answers', args=[personalized.id]), {f'answer_{question.id}': [str(option.id)]})
+        self.assertEqual(self.strengths()[question.id], 0.5)
+
+    def test_backfilled_attempts_fill_mastery(self):
+        # Ответы, сохранённые до появления Attempt: миграция усвоения их не видит
+        questions = list(self.test.questions.order_by('id').prefetch_related('options'))
+        for question in questions:
+            option = next(option for option in question.options.all() if option.is_correct == (question is questions[0]))
+            StudentAnswer.objects.create(
+                user=self.student, test=self.test, question=question, selected_option=option,
+                is_correct=option.is_correct, score=int(option.is_correct),
+            )
+        self.assertEqual(self.strengths(), {})
+        call_command('backfill_attempts', stdout=io.StringIO())
+        self.assertEqual(Attempt.objects.get(user=self.student).score, 1)
+        self.assertEqual(self.strengths(), {question.id: int(question is questions[0]) for question in questions})
+
+        QuestionMastery.objects.all().delete()
+        call_command('rebuild_mastery', user=[self.student.id], stdout=io.StringIO())
+        self.assertEqual(len(self.strengths()), 4)
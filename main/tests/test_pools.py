@@ -0,0 +1,163 @@
+"""
+Тест с пулом: каждый студент получает свою детерминированную выборку
+вопросов и порядок вариантов, а проверка учитывает только вытянутые вопросы.
+"""
+import io
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.analytics import item_analysis
+from main.answer_key import get_answer_key
+from main.builders import TestBuilder
+from main.importers import TestImportError, import_tests
+from main.models import Attempt, StudentAnswer, Test, TestQuestion
+from main.pools import draw_questions, student_answer_key
+from main.regrade import regrade_test
+
+from . import clear_caches
+
+SECTIONS = {'Алгебра': 2, 'Геометрия': 1}
+
+
+def pool_questions():
+    return [
+        {
+            'text': f'{section}: вопрос {number}', 'section': section,
+            'options': [{'text': f'верно {number}', 'is_correct': True}, {'text': 'нет'}, {'text': 'не знаю'}],
+        }
+        for section in ('Алгебра', 'Геометрия') for number in range(4)
+    ]
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False)
+class QuestionPoolTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.students = []
+        for name in ('first', 'second', 'third'):
+            student = User.objects.create_user(name)
+            student.profile.role = 'student'
+            student.profile.save()
+            cls.students.append(student)
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(
+            title='Пул', description='', time_limit=10, questions=pool_questions(),
+            pool=SECTIONS, shuffle_options=True,
+        )
+        cls.test, = builder.save()
+        cls.section_of = dict(TestQuestion.objects.filter(test=cls.test).values_list('question_id', 'section'))
+
+    def setUp(self):
+        clear_caches()
+        self.student = self.students[0]
+        self.client.force_login(self.student)
+
+    def start(self, student=None):
+        """Открывает тест и возвращает ключ и выборку созданной попытки"""
+        student = student or self.student
+        self.client.force_login(student)
+        html = self.client.get(reverse('start_test', args=[self.test.id])).content.decode()
+        self.html = html
+        return student_answer_key(self.test, Attempt.objects.get(user=student, test=self.test))
+
+    def submit_correct(self):
+        data = {}
+        for question in self.test.questions.prefetch_related('options'):
+            correct = next(option for option in question.options.all() if option.is_correct)
+            data[f'answer_{question.id}'] = [str(correct.id)]
+        return self.client.post(reverse('submit_answers', args=[self.test.id]), data)
+
+    def test_draw_is_deterministic_and_respects_sections(self):
+        _, draw = self.start()
+        clear_caches()
+        self.assertEqual(draw_questions(self.test, get_answer_key(self.test), self.student.id), draw)
+        drawn_sections = [self.section_of[question_id] for question_id in draw.question_ids]
+        self.assertEqual({name: drawn_sections.count(name) for name in SECTIONS}, SECTIONS)
+        self.assertEqual(set(draw.option_orders), set(draw.question_ids))
+
+        draws = {self.start(student)[1].question_ids for student in self.students}
+        self.assertGreater(len(draws), 1)
+
+    def test_page_shows_only_drawn_questions_in_order(self):
+        _, draw = self.start()
+        html = self.html
+        shown = [int(question_id) for question_id in dict.fromkeys(re.findall(r'name="answer_(\d+)"', html))]
+        self.assertEqual(shown, list(draw.question_ids))
+        for question_id in draw.question_ids:
+            options = [int(option_id) for option_id in re.findall(rf'name="answer_{question_id}"\s+value="(\d+)"', html)]
+            self.assertEqual(options, list(draw.option_orders[question_id]))
+
+    def test_submit_grades_drawn_questions_only(self):
+        answer_key, draw = self.start()
+        response = self.submit_correct()
+        self.assertEqual((response.context['correct'], response.context['total']), (3, 3))
+        self.assertEqual(Attempt.objects.get(user=self.student, test=self.test).percentage, 100)
+        answered = set(StudentAnswer.objects.filter(user=self.student).values_list('question_id', flat=True))
+        self.assertEqual(answered, set(draw.question_ids))
+        self.assertEqual(answer_key.total, 3)
+        self.assertEqual(self.client.get(reverse('test_result', args=[self.test.id])).context['total'], 3)
+
+    def test_autosave_ignores_questions_outside_draw(self):
+        _, draw = self.start()
+        other = next(question_id for question_id in self.section_of if question_id not in draw.question_ids)
+        drawn = draw.question_ids[0]
+        response = self.client.post(
+            reverse('autosave_answers', args=[self.test.id]),
+            json.dumps({'answers': {str(drawn): [draw.option_orders[drawn][0]], str(other): []}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['saved'], 1)
+
+    def test_draw_survives_test_edits_and_key_rotation(self):
+        _, draw = self.start()
+        self.submit_correct()
+        Test.objects.filter(pk=self.test.pk).update(pool={'Алгебра': 4, 'Геометрия': 4})
+        self.test.refresh_from_db()
+        clear_caches()
+        with self.settings(SECRET_KEY='rotated'):
+            self.client.force_login(self.student)
+            response = self.client.get(reverse('test_result', args=[self.test.id]))
+            self.assertEqual((response.context['total'], response.context['score']), (3, 100))
+            self.assertEqual(regrade_test(self.test.id).changed_attempts, [])
+            # Новые попытки тянут по новому пулу
+            self.assertEqual(len(self.start(self.students[1])[1].question_ids), 8)
+
+    def test_item_analysis_counts_attempts_shown_the_question(self):
+        shown = {}
+        for student in self.students:
+            _, draw = self.start(student)
+            self.submit_correct()
+            for question_id in draw.question_ids:
+                shown[question_id] = shown.get(question_id, 0) + 1
+        attempts, report = item_analysis(self.test)
+        self.assertEqual(attempts, 3)
+        for item in report:
+            self.assertEqual(item['shown'], shown.get(item['question'].id, 0))
+            if item['shown']:
+                self.assertEqual((item['difficulty'], item['blank_rate']), (1, 0))
+
+    def test_pool_is_validated_on_the_model(self):
+        self.test.pool = {'Алгебра': 0, 'Геометрия': '2'}
+        with self.assertRaises(ValidationError) as raised:
+            self.test.clean()
+        self.assertEqual(len(raised.exception.message_dict['pool']), 2)
+
+
+class PoolImportTests(TestCase):
+    def test_json_pool_sections(self):
+        teacher = User.objects.create_user('teacher')
+        data = {'title': 'Пул', 'time_limit': 10, 'pool': {'Алгебра': 1}, 'questions': pool_questions()}
+        test, = import_tests(io.StringIO(json.dumps(data)), 'json', teacher)
+        self.assertEqual(test.pool, {'Алгебра': 1})
+        self.assertEqual(test.question_links.filter(section='Геометрия').count(), 4)
+
+        data['pool'] = {'Физика': 0}
+        with self.assertRaises(TestImportError) as error:
+            import_tests(io.StringIO(json.dumps(data)), 'json', teacher)
+        self.assertEqual(len(error.exception.errors), 2)
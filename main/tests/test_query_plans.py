@@ -0,0 +1,180 @@
+"""
+Проверка планов запросов: ни один запрос основных страниц не должен
+читать таблицу целиком (SCAN) - только поиск по индексу (SEARCH).
+"""
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.builders import TestBuilder
+from main.models import StudentAnswer, Test
+
+from . import clear_caches
+
+# Строка плана SQLite с чтением таблицы без индекса: "SCAN main_test". Обход по индексу
+# ("SCAN main_test USING INDEX ...") допустим - так читаются частичные индексы и сортировка с LIMIT
+FULL_SCAN = re.compile(r'^SCAN (?P<table>\w+)$')
+
+
+def make_user(username, role):
+    user = User.objects.create_user(username, password='p')
+    user.profile.role = role
+    user.profile.save()
+    return user
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_user('teacher', 'teacher')
+        cls.student = make_user('student', 'student')
+        cls.other = make_user('other', 'student')
+        builder = TestBuilder(cls.teacher)
+        for number in range(3):
+            builder.add_test(
+                title=f'Тест {number}',
+                description='',
+                time_limit=10,
+                grading={'name': 'Мои настройки'},
+                questions=[
+                    {'text': 'Выбор', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+                    {'text': 'Несколько', 'is_multiple_choice': True, 'options': [
+                        {'text': 'a', 'is_correct': True}, {'text': 'b', 'is_correct': True}, {'text': 'c'},
+                    ]},
+                    {'text': 'Текст', 'is_text_answer': True, 'correct_text_answer': 'ответ'},
+                ],
+            )
+        cls.tests = builder.save()
+        cls.test = cls.tests[0]
+
+    def submit(self, user, test):
+        self.client.force_login(user)
+        self.client.get(reverse('start_test', args=[test.id]))
+        data = {}
+        for question in test.questions.prefetch_related('options'):
+            if question.is_text_answer:
+                data[f'answer_{question.id}'] = 'ответ'
+            else:
+                data[f'answer_{question.id}'] = [str(option.id) for option in question.options.all() if option.is_correct]
+        self.client.post(reverse('submit_answers', args=[test.id]), data)
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScans(self, user, method, url, data=None, **extra):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, **extra) if data is not None else getattr(self.client, method)(url)
+        self.assertLess(response.status_code, 400, url)
+        # Подзапросы в FROM тоже читаются через SCAN, но это не таблицы базы
+        tables = set(connection.introspection.table_names())
+        scans = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            # Параметры уже подставлены в текст запроса
+            for detail in self.explain(sql, None):
+                match = FULL_SCAN.match(detail)
+                if match and match.group('table') in tables:
+                    scans.append(f'{detail}: {sql[:200]}')
+        self.assertEqual(scans, [], f'{url}: полное чтение таблицы')
+
+    def setUp(self):
+        clear_caches()
+        self.submit(self.student, self.test)
+        self.submit(self.other, self.test)
+
+    def test_student_pages(self):
+        for name, args in [
+            ('index', []),
+            ('student_dashboard', []),
+            ('test_result', [self.test.id]),
+            ('start_test', [self.tests[1].id]),
+            ('generate_custom_test', []),
+        ]:
+            with self.subTest(name):
+                self.assertNoFullScans(self.student, 'get', reverse(name, args=args))
+
+    def test_autosave(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('start_test', args=[self.tests[2].id]))
+        question = self.tests[2].questions.first()
+        self.assertNoFullScans(
+            self.student, 'post', reverse('autosave_answers', args=[self.tests[2].id]),
+            json.dumps({'answers': {str(question.id): []}}), content_type='application/json',
+        )
+
+    def test_enter_code(self):
+        self.assertNoFullScans(self.student, 'post', reverse('enter_test_code'), {'code': self.test.code})
+
+    def test_teacher_pages(self):
+        for name, args in [
+            ('index', []),
+            ('teacher_dashboard', []),
+            ('test_detail', [self.test.id]),
+            ('test_results', [self.test.id]),
+            ('export_test_results', [self.test.id]),
+            ('test_item_analysis', [self.test.id]),
+        ]:
+            with self.subTest(name):
+                self.assertNoFullScans(self.teacher, 'get', reverse(name, args=args))
+
+
+class IndexUsageTests(TestCase):
+    """Горячие выборки ищут сразу по всем столбцам фильтра и не сортируют результат отдельно"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = make_user('teacher', 'teacher')
+        cls.student = make_user('student', 'student')
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[
+            {'text': 'Текст', 'is_text_answer': True, 'correct_text_answer': 'ответ'},
+        ])
+        cls.test, = builder.save()
+        cls.question = cls.test.questions.get()
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertSearches(self, queryset, *columns, index=None):
+        plan = self.plan(queryset)
+        self.assertTrue(
+            any(detail.startswith('SEARCH') and all(f'{column}=?' in detail for column in columns) for detail in plan),
+            plan,
+        )
+        if index:
+            self.assertTrue(any(index in detail for detail in plan), plan)
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in plan), plan)
+
+    def test_student_answer_lookups(self):
+        answers = StudentAnswer.objects.all()
+        self.assertSearches(answers.filter(user=self.student, test=self.test), 'user_id', 'test_id')
+        self.assertSearches(answers.filter(test=self.test, question=self.question), 'test_id', 'question_id')
+        self.assertSearches(answers.filter(test=self.test).order_by('user_id'), 'test_id')
+        self.assertSearches(answers.filter(user=self.student).order_by('-id')[:10], 'user_id')
+
+    def test_test_lookups(self):
+        self.assertSearches(Test.objects.filter(creator=self.teacher).order_by('-id')[:3], 'creator_id')
+        self.assertSearches(
+            Test.objects.filter(creator=self.teacher, is_active=True), 'creator_id', index='test_creator_active_idx'
+        )
+        plan = self.plan(Test.objects.filter(is_active=True).order_by('-id')[:3])
+        self.assertTrue(any('test_active_recent_idx' in detail for detail in plan), plan)
+        self.assertSearches(Test.objects.filter(code=self.test.code), 'code')
+
+    def test_one_text_answer_per_question(self):
+        StudentAnswer.objects.create(user=self.student, test=self.test, question=self.question, answer_text='a')
+        with self.assertRaises(IntegrityError):
+            StudentAnswer.objects.create(user=self.student, test=self.test, question=self.question, answer_text='b')
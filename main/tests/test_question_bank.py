@@ -0,0 +1,168 @@
+"""
+Банк вопросов: одинаковые вопросы сохраняются один раз, а накопленные
+дубликаты сливаются вместе с ответами студентов. Порядок вопросов в
+тесте задаёт автор, даже если вопрос взят из банка.
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.answer_key import get_answer_key
+from main.bank import merge_duplicates, stored_question_hash
+from main.builders import TestBuilder
+from main.fragments import test_questions_html
+from main.importers import TestImportError, new_question, validate_tests
+from main.models import Attempt, Option, Question, QuestionMastery, StudentAnswer, Test, TestQuestion
+from main.stats import rebuild_test_counters
+
+from . import clear_caches
+
+CHOICE = {'text': 'Столица Франции?', 'options': [{'text': 'Париж', 'is_correct': True}, {'text': 'Лион'}]}
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False)
+class QuestionBankTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.student = User.objects.create_user('student')
+        cls.student.profile.role = 'student'
+        cls.student.profile.save()
+
+    def setUp(self):
+        clear_caches()
+
+    def build(self, *question_lists, teacher=None):
+        builder = TestBuilder(teacher or self.teacher)
+        for number, questions in enumerate(question_lists):
+            builder.add_test(title=f'Тест {number}', description='', time_limit=10, questions=questions)
+        return builder.save()
+
+    def test_same_content_reuses_question(self):
+        reordered = {'text': '  Столица   Франции? ', 'options': [{'text': 'Лион'}, {'text': 'Париж', 'is_correct': True}]}
+        other = {'text': 'Столица Франции?', 'options': [{'text': 'Париж'}, {'text': 'Лион', 'is_correct': True}]}
+        first, second = self.build([CHOICE, CHOICE], [reordered, other])
+        third, = self.build([CHOICE])
+        self.assertEqual(Question.objects.count(), 2)
+        self.assertEqual(Option.objects.count(), 4)
+        self.assertEqual([test.question_count for test in (first, second, third)], [1, 2, 1])
+        self.assertEqual(rebuild_test_counters(), 0)
+        shared = first.questions.get()
+        self.assertIn(shared, second.questions.all())
+        self.assertEqual(third.questions.get(), shared)
+
+    def test_bank_is_per_teacher(self):
+        mine, = self.build([CHOICE])
+        theirs, = self.build([CHOICE], teacher=User.objects.create_user('other'))
+        self.assertNotEqual(mine.questions.get(), theirs.questions.get())
+        self.assertEqual(merge_duplicates(), 0)
+
+    def test_hash_of_normalized_options(self):
+        # У одиночного выбора остаётся только первый правильный вариант
+        two_correct = {'text': 'Столица Франции?', 'options': [
+            {'text': 'Париж', 'is_correct': True}, {'text': 'Лион', 'is_correct': True},
+        ]}
+        self.build([two_correct])
+        question = Question.objects.prefetch_related('options').get()
+        self.assertEqual(stored_question_hash(question), question.content_hash)
+        test, = self.build([CHOICE])
+        self.assertEqual(test.questions.get(), question)
+
+    def test_repeated_question_in_one_test(self):
+        builder = TestBuilder(self.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[CHOICE, CHOICE])
+        test, = builder.save()
+        self.assertEqual((test.question_count, [text for _, text in builder.duplicates]), (1, [CHOICE['text']]))
+        question = new_question(CHOICE['text'], options=[{'text': 'Париж', 'is_correct': True}, {'text': 'Лион', 'is_correct': False}])
+        with self.assertRaises(TestImportError) as raised:
+            validate_tests([{'title': 'Тест', 'time_limit': 10, 'grading': {}, 'questions': [question, question]}])
+        self.assertEqual(raised.exception.errors, ['Тест 1, вопрос 2: повторяет вопрос 1.'])
+
+    def test_question_outlives_owner_test(self):
+        first, second = self.build([CHOICE], [CHOICE])
+        question = first.questions.get()
+        first.delete()
+        question.refresh_from_db()
+        self.assertIsNone(question.test_id)
+        self.assertEqual(list(Test.objects.get(pk=second.pk).questions.all()), [question])
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse('start_test', args=[second.id])).status_code, 200)
+
+    def test_unlinked_questions_are_deleted_with_test(self):
+        test, = self.build([CHOICE])
+        test.delete()
+        self.assertFalse(Question.objects.exists())
+        self.assertFalse(Option.objects.exists())
+
+    def test_edit_rehashes(self):
+        test, = self.build([CHOICE])
+        question = test.questions.get()
+        question.text = 'Столица Италии?'
+        question.save()
+        self.build([CHOICE])
+        self.assertEqual(Question.objects.count(), 2)
+
+    def test_merge_duplicates(self):
+        original, = self.build([CHOICE])
+        # Копия из времён до банка: вопрос, созданный по одному, не ищется в банке
+        copied = Test.objects.create(title='Копия', description='', time_limit=10, creator=self.teacher)
+        duplicate = Question.objects.create(test=copied, text=CHOICE['text'])
+        wrong = Option.objects.create(question=duplicate, text='Лион')
+        Option.objects.create(question=duplicate, text='Париж', is_correct=True)
+        kept = original.questions.get()
+        self.assertEqual(Question.objects.get(pk=duplicate.pk).content_hash, Question.objects.get(pk=kept.pk).content_hash)
+
+        self.client.force_login(self.student)
+        self.client.get(reverse('start_test', args=[copied.id]))
+        self.client.post(reverse('submit_answers', args=[copied.id]), {f'answer_{duplicate.id}': [str(wrong.id)]})
+        self.client.get(reverse('start_test', args=[original.id]))
+        self.client.post(reverse('submit_answers', args=[original.id]), {})
+
+        self.assertEqual(merge_duplicates(), 1)
+        self.assertFalse(Question.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(list(TestQuestion.objects.filter(test=copied).values_list('question_id', flat=True)), [kept.id])
+        answer = StudentAnswer.objects.get(test=copied)
+        self.assertEqual((answer.question_id, answer.selected_option.text), (kept.id, 'Лион'))
+        self.assertEqual(QuestionMastery.objects.get(user=self.student).answer_count, 2)
+        response = self.client.get(reverse('test_result', args=[copied.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(merge_duplicates(), 0)
+
+    def test_merge_regrades_test_with_both_copies(self):
+        test, = self.build([CHOICE])
+        kept = test.questions.get()
+        # Копия из времён до банка в том же тесте
+        duplicate = Question.objects.create(test=test, text=CHOICE['text'])
+        Option.objects.create(question=duplicate, text='Лион')
+        right = Option.objects.create(question=duplicate, text='Париж', is_correct=True)
+        wrong = kept.options.get(text='Лион')
+        clear_caches()
+        self.client.force_login(self.student)
+        self.client.get(reverse('start_test', args=[test.id]))
+        self.client.post(reverse('submit_answers', args=[test.id]), {
+            f'answer_{kept.id}': [str(wrong.id)], f'answer_{duplicate.id}': [str(right.id)],
+        })
+        self.assertEqual(Attempt.objects.values_list('total', 'percentage').get(), (2, 50))
+
+        self.assertEqual(merge_duplicates(), 1)
+        self.assertEqual(Attempt.objects.values_list('total', 'percentage').get(), (1, 0))
+        self.assertEqual(rebuild_test_counters(), 0)
+
+    def test_reused_questions_keep_author_order(self):
+        def question(text):
+            return {'text': text, 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]}
+
+        self.build([question('Первый'), question('Второй'), question('Третий')])
+        test, = self.build([question('Новый первый'), question('Третий'), question('Новый второй'), question('Первый')])
+        expected = ['Новый первый', 'Третий', 'Новый второй', 'Первый']
+        self.assertEqual([q.text for q in test.ordered_questions()], expected)
+        by_id = dict(Question.objects.values_list('id', 'text'))
+        self.assertEqual([by_id[key.id] for key in get_answer_key(test.id).questions], expected)
+        html = test_questions_html(test.id)
+        self.assertEqual(sorted(expected, key=html.index), expected)
+        test = Test.objects.prefetch_related(Test.prefetch_questions('options')).get(pk=test.pk)
+        self.assertEqual([q.text for q in test.questions.all()], expected)
+
+        # Вопрос, добавленный по одному, встаёт в конец
+        Question.objects.create(test=test, text='Последний')
+        self.assertEqual([q.text for q in test.ordered_questions()], [*expected, 'Последний'])
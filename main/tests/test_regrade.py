@@ -0,0 +1,92 @@
+"""
+Пересчёт результатов после исправления ключа: ответы и попытки
+обновляются пачками, сводки и счётчики остаются согласованными.
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.builders import TestBuilder
+from main.models import Attempt, Option, Question, StudentAnswer, StudentStats
+from main.regrade import regrade_test
+from main.stats import rebuild_stats, rebuild_test_counters
+
+from . import clear_caches
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False, TEXT_ANSWER_MAX_TYPOS=0)
+class RegradeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.teacher.profile.role = 'teacher'
+        cls.teacher.profile.save()
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(title='Столицы', description='', time_limit=10, questions=[
+            {'text': 'Столица Франции', 'options': [{'text': 'Лион', 'is_correct': True}, {'text': 'Париж'}]},
+            {'text': 'Столица России', 'is_text_answer': True, 'correct_text_answer': 'Москва'},
+        ])
+        cls.test, = builder.save()
+        cls.choice = Question.objects.get(text='Столица Франции')
+        cls.text = Question.objects.get(text='Столица России')
+        cls.lyon = cls.choice.options.get(text='Лион')
+        cls.paris = cls.choice.options.get(text='Париж')
+
+    def setUp(self):
+        clear_caches()
+
+    def submit(self, name, option, text):
+        student = User.objects.create_user(name)
+        student.profile.role = 'student'
+        student.profile.save()
+        self.client.force_login(student)
+        self.client.get(reverse('start_test', args=[self.test.id]))
+        self.client.post(reverse('submit_answers', args=[self.test.id]), {
+            f'answer_{self.choice.id}': [str(option.id)], f'answer_{self.text.id}': text,
+        })
+        return student
+
+    def percentages(self):
+        return dict(Attempt.objects.filter(test=self.test).values_list('user__username', 'percentage'))
+
+    def test_fixed_key_regrades_answers_attempts_and_counters(self):
+        self.submit('paris', self.paris, 'Москва')
+        self.submit('lyon', self.lyon, 'Moscow')
+        self.assertEqual(self.percentages(), {'paris': 50, 'lyon': 50})
+
+        self.lyon.is_correct = False
+        self.lyon.save()
+        self.paris.is_correct = True
+        self.paris.save()
+        self.text.correct_text_answer = 'Москва | Moscow'
+        self.text.save()
+
+        self.assertEqual(len(regrade_test(self.test.id, dry_run=True).changed_attempts), 1)
+        self.assertEqual(self.percentages(), {'paris': 50, 'lyon': 50})
+
+        report = regrade_test(self.test.id, chunk_size=1)
+        self.assertEqual((report.attempts, report.changed_answers, report.raised, report.lowered), (2, 3, 1, 0))
+        self.assertEqual(self.percentages(), {'paris': 100, 'lyon': 50})
+        self.assertTrue(StudentAnswer.objects.get(selected_option=self.paris).is_correct)
+        self.assertEqual(StudentAnswer.objects.get(selected_option=self.lyon).score, 0)
+        self.assertEqual(StudentAnswer.objects.get(answer_text='moscow').score, 1)
+
+        # Сводки и счётчики уже пересчитаны
+        self.assertEqual(rebuild_stats(), 0)
+        self.assertEqual(rebuild_test_counters([self.test.id]), 0)
+        self.assertEqual(StudentStats.objects.get(user__username='paris').percentage_sum, 100)
+        self.assertEqual(regrade_test(self.test.id).changed_attempts, [])
+
+    def test_view_action(self):
+        self.submit('paris', self.paris, 'Москва')
+        Option.objects.filter(pk=self.paris.pk).update(is_correct=True)
+        Option.objects.filter(pk=self.lyon.pk).update(is_correct=False)
+        clear_caches()
+
+        self.client.force_login(self.teacher)
+        url = reverse('regrade_test_results', args=[self.test.id])
+        self.assertRedirects(self.client.get(url), reverse('test_results', args=[self.test.id]))
+        self.assertEqual(self.percentages(), {'paris': 50})
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, 'изменено попыток 1 из 1')
+        self.assertEqual(self.percentages(), {'paris': 100})
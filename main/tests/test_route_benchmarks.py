@@ -0,0 +1,23 @@
+"""
+Замер маршрутов из main.benchmarks.routes: число запросов каждой
+страницы не растёт с объёмом данных и не превышает базовое значение.
+Время ответа здесь не сравнивается - оно зависит от машины; его
+проверяет `manage.py benchmark routes`.
+"""
+from django.test import TestCase
+
+from main.benchmarks import routes
+
+from . import clear_caches
+
+
+class RouteBenchmarkTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_every_route_is_measured(self):
+        self.assertEqual(routes.missing_routes(), [])
+
+    def test_query_counts(self):
+        results = routes.collect(sizes=(5, 20), repeat=1)
+        self.assertEqual(routes.check(results, routes.load_baseline(), check_latency=False), [])
@@ -0,0 +1,96 @@
+"""
+Поиск преподавателя: индекс FTS5 пополняется TestBuilder и сигналами,
+результаты ранжируются и ограничены тестами преподавателя.
+"""
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from main.builders import TestBuilder
+from main.models import Option, Question
+from main.search import _fts_rowids, _like_ids, fts_available, rebuild_index, search, search_words
+
+from . import clear_caches
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.teacher.profile.role = 'teacher'
+        cls.teacher.profile.save()
+        cls.other = User.objects.create_user('other')
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(title='Квадратные уравнения', description='Дискриминант и корни', time_limit=10, questions=[
+            {'text': 'Сколько корней у уравнения x² = 4?', 'options': [{'text': 'два', 'is_correct': True}, {'text': 'один'}]},
+            {'text': 'Ёмкость конденсатора', 'is_text_answer': True, 'correct_text_answer': 'фарад'},
+        ])
+        builder.add_test(title='Геометрия', description='Про треугольники и уравнения прямых', time_limit=10, questions=[
+            {'text': 'Сумма углов треугольника', 'options': [{'text': '180 градусов', 'is_correct': True}, {'text': '90'}]},
+        ])
+        cls.algebra, cls.geometry = builder.save()
+        other_builder = TestBuilder(cls.other)
+        other_builder.add_test(title='Чужие уравнения', description='', time_limit=10, questions=[
+            {'text': 'Чужой вопрос про уравнение', 'is_text_answer': True, 'correct_text_answer': 'нет'},
+        ])
+        cls.foreign, = other_builder.save()
+
+    def setUp(self):
+        clear_caches()
+
+    def found(self, query, page=1):
+        hits, _ = search(self.teacher, query, page)
+        return [(hit.kind, hit.object.pk) for hit in hits]
+
+    def test_index_is_available_on_sqlite(self):
+        self.assertTrue(fts_available())
+
+    def test_ranked_prefix_search_within_own_tests(self):
+        question = Question.objects.get(text__startswith='Сколько корней')
+        # Совпадение в названии весит больше, чем в описании; чужой тест не виден
+        self.assertEqual(self.found('уравн'), [
+            ('test', self.algebra.pk), ('question', question.pk), ('test', self.geometry.pk),
+        ])
+        self.assertEqual(self.found('корни дискриминант'), [('test', self.algebra.pk)])
+        self.assertEqual(self.found('градусов'), [('question', Question.objects.get(text__startswith='Сумма').pk)])
+        # «ё» и «е» не различаются
+        self.assertEqual(len(self.found('емкость')), 1)
+        self.assertEqual(self.found('"; DROP'), [])
+        self.assertEqual(search_words('  '), [])
+
+    def test_signals_keep_index_in_sync(self):
+        question = Question.objects.get(text__startswith='Сумма')
+        question.text = 'Сумма внешних углов многоугольника'
+        question.save()
+        self.assertEqual(self.found('многоугольник'), [('question', question.pk)])
+        self.assertEqual(self.found('треугольник'), [('test', self.geometry.pk)])
+
+        Option.objects.create(question=question, text='360 градусов')
+        self.assertEqual(self.found('360'), [('question', question.pk)])
+
+        self.geometry.title = 'Планиметрия'
+        self.geometry.save()
+        self.assertEqual(self.found('планиметрия'), [('test', self.geometry.pk)])
+
+        question.delete()
+        self.assertEqual(self.found('многоугольник'), [])
+        self.assertEqual(rebuild_index(), 6)
+        self.assertEqual(self.found('планиметрия'), [('test', self.geometry.pk)])
+
+    def test_like_fallback_finds_the_same(self):
+        for query in ('уравн', 'градусов', 'треугольники прямых'):
+            words = search_words(query)
+            self.assertEqual(
+                sorted(_like_ids(self.teacher, words, 0, 10)), sorted(_fts_rowids(self.teacher, words, 0, 10)), query,
+            )
+
+    @override_settings(SEARCH_PAGE_SIZE=2)
+    def test_view_pages(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('search'), {'q': 'уравнения'})
+        self.assertEqual(len(response.context['hits']), 2)
+        self.assertTrue(response.context['has_next'])
+        self.assertContains(response, 'Квадратные уравнения')
+        response = self.client.get(reverse('search'), {'q': 'уравнения', 'page': 2})
+        self.assertEqual([hit.object.pk for hit in response.context['hits']], [self.geometry.pk])
+        self.assertFalse(response.context['has_next'])
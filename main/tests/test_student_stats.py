@@ -0,0 +1,97 @@
+"""
+Сводка студента (StudentStats) совпадает с его завершёнными попытками
+при завершении, пакетной записи, удалении попытки и пересчёте.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.attempts import finalize_attempts, start_attempt
+from main.builders import TestBuilder
+from main.grading import Submission
+from main.models import Attempt, StudentStats
+from main.stats import compute_stats, rebuild_stats
+
+from . import clear_caches
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False)
+class StudentStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.student = User.objects.create_user('student')
+        cls.student.profile.role = 'student'
+        cls.student.profile.save()
+        builder = TestBuilder(cls.teacher)
+        for number in range(3):
+            builder.add_test(title=f'Тест {number}', description='', time_limit=10, questions=[
+                {'text': 'Выбор', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+                {'text': 'Ещё', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+            ])
+        cls.tests = builder.save()
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.student)
+
+    def submit(self, test, correct):
+        self.client.get(reverse('start_test', args=[test.id]))
+        data = {}
+        for question in test.questions.prefetch_related('options'):
+            option = next(option for option in question.options.all() if option.is_correct == (question.id in correct))
+            data[f'answer_{question.id}'] = [str(option.id)]
+        self.client.post(reverse('submit_answers', args=[test.id]), data)
+
+    def assertConsistent(self):
+        expected = compute_stats([self.student.id])[self.student.id]
+        stats = StudentStats.objects.get(pk=self.student.pk)
+        for field in ('tests_taken', 'percentage_sum', 'pass_count', 'last_attempt_id', 'last_attempt_at'):
+            self.assertEqual(getattr(stats, field), getattr(expected, field), field)
+        return stats
+
+    def test_submit_updates_stats(self):
+        first, second, _ = self.tests
+        self.submit(first, correct=set(first.questions.values_list('id', flat=True)))
+        self.submit(second, correct=set())
+        stats = self.assertConsistent()
+        self.assertEqual((stats.tests_taken, stats.pass_count, stats.average_score), (2, 1, 50))
+        self.assertEqual(stats.last_attempt.test, second)
+
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual(response.context['total_tests'], 2)
+        self.assertEqual(response.context['avg_score'], 50)
+
+    def test_batch_and_delete(self):
+        attempts = [start_attempt(self.student, test) for test in self.tests]
+        now = timezone.now()
+        finalize_attempts([
+            (attempt.id, Submission(selected={}, texts={}), now + timedelta(seconds=index))
+            for index, attempt in enumerate(attempts)
+        ])
+        stats = self.assertConsistent()
+        self.assertEqual(stats.tests_taken, 3)
+        self.assertEqual(stats.last_attempt_id, attempts[2].id)
+
+        Attempt.objects.filter(pk=attempts[2].pk).delete()
+        stats = self.assertConsistent()
+        self.assertEqual(stats.tests_taken, 2)
+        self.assertEqual(stats.last_attempt_id, attempts[1].id)
+
+    def test_rebuild(self):
+        self.submit(self.tests[0], correct=set())
+        other = User.objects.create_user('other')
+        StudentStats.objects.filter(pk=self.student.pk).update(tests_taken=10, pass_count=5)
+        StudentStats.objects.create(user=other, tests_taken=3)
+        self.assertEqual(rebuild_stats(), 2)
+        self.assertConsistent()
+        self.assertFalse(StudentStats.objects.filter(user=other).exists())
+        self.assertEqual(rebuild_stats(), 0)
+
+    def test_dashboard_without_attempts(self):
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual(response.context['total_tests'], 0)
+        self.assertEqual(response.context['avg_score'], 0)
@@ -0,0 +1,109 @@
+"""
+Очередь записи попыток: испорченная запись не мешает остальным попыткам
+пачки и остаётся в журнале, а журнал упавшего процесса с тем же PID
+восстанавливается при старте писателя. Попытка из журнала не завершается
+по автосохранению, а её результат показывается как сохраняемый.
+"""
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.answer_key import get_answer_key
+from main.attempts import finalize_expired_attempts, start_attempt
+from main.builders import TestBuilder
+from main.grading import Submission
+from main.models import Attempt
+from main.submissions import (
+    JOURNAL_PREFIX, JOURNAL_SUFFIX, Journal, SubmissionQueue, make_record, read_journal, replay_journal,
+)
+
+from . import clear_caches
+
+
+class SubmissionQueueTests(TransactionTestCase):
+    def setUp(self):
+        clear_caches()
+        builder = TestBuilder(User.objects.create_user('teacher'))
+        builder.add_test(title='Города', description='', time_limit=10, questions=[
+            {'text': 'Города Франции', 'is_multiple_choice': True, 'options': [
+                {'text': 'Париж', 'is_correct': True}, {'text': 'Лион', 'is_correct': True}, {'text': 'Берлин'},
+            ]},
+        ])
+        test, = builder.save()
+        self.test = test
+        self.question_key, = get_answer_key(test.id).questions
+        self.attempts = [start_attempt(User.objects.create_user(f'student{number}'), test) for number in range(5)]
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.journal_path = os.path.join(self.directory.name, f'{JOURNAL_PREFIX}{os.getpid()}{JOURNAL_SUFFIX}')
+
+    def record(self, attempt, option_ids):
+        return make_record(attempt, Submission(selected={self.question_key.id: option_ids}, texts={}), timezone.now())
+
+    def finished(self):
+        return set(Attempt.objects.filter(status=Attempt.FINISHED).values_list('id', flat=True))
+
+    def test_bad_record_does_not_fail_the_batch(self):
+        option_id = min(self.question_key.correct_option_ids)
+        batch = [self.record(attempt, [option_id]) for attempt in self.attempts]
+        # Повтор варианта нарушает unique_answer_option
+        batch[2] = self.record(self.attempts[2], [option_id, option_id])
+        queue = SubmissionQueue(directory=self.directory.name, fsync=False)
+        queue.journal = Journal(self.journal_path, fsync=False)
+        for record in batch:
+            queue.journal.append(record)
+
+        with mock.patch('main.submissions.MAX_RETRIES', 1), self.assertLogs('main.submissions', 'ERROR'):
+            queue._write(batch)
+        queue.journal.close()
+
+        self.assertEqual(self.finished(), {attempt.id for index, attempt in enumerate(self.attempts) if index != 2})
+        self.assertEqual([record['attempt'] for record in read_journal(self.journal_path)], [self.attempts[2].id])
+        self.assertEqual((queue.stats['written'], queue.stats['lost_records']), (4, 1))
+
+    def test_journal_of_crashed_process_with_same_pid_is_replayed(self):
+        option_id = min(self.question_key.correct_option_ids)
+        previous = Journal(self.journal_path, fsync=False)
+        previous.append(self.record(self.attempts[0], [option_id]))
+        previous.close()
+
+        queue = SubmissionQueue(directory=self.directory.name, fsync=False)
+        with mock.patch.object(SubmissionQueue, '_run', lambda queue: None):
+            queue.start()
+        # Новый журнал не содержит чужих записей и не очистит их вместе с собой
+        self.assertEqual(read_journal(self.journal_path), [])
+        queue._replay_orphans()
+        queue.journal.close()
+
+        self.assertEqual(self.finished(), {self.attempts[0].id})
+        self.assertEqual(queue.stats['replayed'], 1)
+        self.assertEqual(os.listdir(self.directory.name), [os.path.basename(self.journal_path)])
+
+    def test_journaled_attempt_is_not_finalized_from_autosave(self):
+        Attempt.objects.filter(id__in=[self.attempts[0].id, self.attempts[1].id]).update(
+            deadline=timezone.now() - timedelta(hours=1),
+        )
+        # Журнал упавшего процесса, который ещё не восстановлен
+        orphan = os.path.join(self.directory.name, f'{JOURNAL_PREFIX}999999999{JOURNAL_SUFFIX}')
+        journal = Journal(orphan, fsync=False)
+        journal.append(self.record(self.attempts[0], sorted(self.question_key.correct_option_ids)))
+        journal.close()
+
+        with override_settings(SUBMISSION_JOURNAL_DIR=self.directory.name):
+            self.assertEqual(finalize_expired_attempts(self.test), 1)
+            self.assertEqual(self.finished(), {self.attempts[1].id})
+
+            self.client.force_login(self.attempts[0].user)
+            response = self.client.get(reverse('test_result', args=[self.test.id]))
+            self.assertTemplateUsed(response, 'main/result_pending.html')
+
+            self.assertEqual(replay_journal(orphan), (1, 1))
+            self.assertEqual(Attempt.objects.get(id=self.attempts[0].id).score, 1)
+            response = self.client.get(reverse('test_result', args=[self.test.id]))
+            self.assertTemplateUsed(response, 'main/test_result.html')
@@ -0,0 +1,94 @@
+"""
+Счётчики теста (вопросы, прохождения, сумма и сумма квадратов процентов)
+совпадают с вопросами и попытками при завершении, удалении и пересчёте.
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main.attempts import finalize_attempts, start_attempt
+from main.builders import TestBuilder
+from main.grading import Submission
+from main.models import Attempt, Question, Test
+from main.stats import rebuild_test_counters
+
+from . import clear_caches
+
+
+@override_settings(SUBMISSION_QUEUE_ENABLED=False)
+class TestCountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher')
+        cls.teacher.profile.role = 'teacher'
+        cls.teacher.profile.save()
+        cls.students = [User.objects.create_user(f'student{number}') for number in range(3)]
+        builder = TestBuilder(cls.teacher)
+        builder.add_test(title='Тест', description='', time_limit=10, questions=[
+            {'text': 'Выбор', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+            {'text': 'Ещё', 'options': [{'text': 'да', 'is_correct': True}, {'text': 'нет'}]},
+        ])
+        cls.test, = builder.save()
+
+    def setUp(self):
+        clear_caches()
+
+    def finish(self, answers):
+        """Завершает попытки студентов; answers - число правильных ответов каждого"""
+        questions = list(self.test.questions.prefetch_related('options'))
+        now = timezone.now()
+        batch = []
+        for index, (student, correct) in enumerate(zip(self.students, answers)):
+            attempt = start_attempt(student, self.test)
+            selected = {
+                question.id: [next(option.id for option in question.options.all() if option.is_correct)]
+                for question in questions[:correct]
+            }
+            batch.append((attempt.id, Submission(selected=selected, texts={}), now + timedelta(seconds=index)))
+        finalize_attempts(batch)
+
+    def assertConsistent(self):
+        """Пересчёт ничего не исправляет: счётчики уже совпадают с вопросами и попытками"""
+        self.assertEqual(rebuild_test_counters([self.test.pk]), 0)
+        return Test.objects.get(pk=self.test.pk)
+
+    def test_finish_updates_counters(self):
+        self.finish([2, 1, 0])
+        test = self.assertConsistent()
+        self.assertEqual((test.question_count, test.attempt_count, test.score_sum), (2, 3, 150))
+        self.assertEqual(test.avg_score, 50)
+        self.assertAlmostEqual(test.score_stddev, (5000 / 3) ** 0.5)
+        self.assertEqual(test.last_attempt_at, Attempt.objects.order_by('-finished_at').first().finished_at)
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('teacher_dashboard'))
+        row, = response.context['tests']
+        self.assertEqual((row.attempt_count, row.avg_score, row.question_count), (3, 50, 2))
+
+    def test_delete_attempt(self):
+        self.finish([2, 1, 0])
+        latest = Attempt.objects.order_by('-finished_at').first()
+        latest.delete()
+        test = self.assertConsistent()
+        self.assertEqual((test.attempt_count, test.score_sum, test.score_sq_sum), (2, 150, 12500))
+        self.assertEqual(test.last_attempt_at, Attempt.objects.order_by('-finished_at').first().finished_at)
+
+        Attempt.objects.all().delete()
+        test = self.assertConsistent()
+        self.assertEqual((test.attempt_count, test.score_sum, test.last_attempt_at), (0, 0, None))
+
+    def test_question_signals(self):
+        question = Question.objects.create(test=self.test, text='Новый', is_text_answer=True, correct_text_answer='да')
+        self.assertEqual(Test.objects.get(pk=self.test.pk).question_count, 3)
+        question.delete()
+        self.assertConsistent()
+
+    def test_repair(self):
+        self.finish([2, 2])
+        Test.objects.filter(pk=self.test.pk).update(attempt_count=0, score_sum=7, question_count=9, last_attempt_at=None)
+        self.assertEqual(rebuild_test_counters(), 1)
+        test = self.assertConsistent()
+        self.assertEqual((test.question_count, test.attempt_count, test.score_sum), (2, 2, 200))
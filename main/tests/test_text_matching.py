@@ -0,0 +1,85 @@
+"""
+Текстовые ответы: несколько принятых вариантов, нормализация, числа с
+допуском и ограниченное число опечаток.
+"""
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from main.answer_key import get_answer_key
+from main.builders import TestBuilder
+from main.grading import Submission, grade_batch
+from main.matching import compile_matcher, within_distance
+
+from . import clear_caches
+
+
+@override_settings(TEXT_ANSWER_MAX_TYPOS=1, TEXT_ANSWER_FUZZY_MIN_LENGTH=5)
+class TextMatcherTests(SimpleTestCase):
+    def assertAccepts(self, correct, accepted, rejected):
+        matcher = compile_matcher(correct)
+        for answer in accepted:
+            self.assertTrue(matcher.matches(answer), answer)
+        for answer in rejected:
+            self.assertFalse(matcher.matches(answer), answer)
+
+    def test_alternatives_and_normalization(self):
+        self.assertAccepts(
+            'Москва | г. Москва',
+            ['Москва.', '  МОСКВА ', '«Москва»', 'г. москва', 'Масква'],
+            ['', 'Моск', 'Санкт-Петербург'],
+        )
+        self.assertAccepts('Ёлка', ['елка', 'ЁЛКА!'], ['ёлки'])
+        self.assertAccepts('ＡＢＣ', ['abc'], [])
+
+    def test_numbers(self):
+        self.assertAccepts('3.14 ± 0.01 | пи', ['3,14', '3.149', ' 3.135 ', 'Пи'], ['3.2', '-3.14', 'три'])
+        self.assertAccepts('-5', ['-5', '−5', '-5.0'], ['5'])
+        self.assertAccepts('1000', ['1 000'], ['100'])
+
+    def test_exact_prefix_and_short_answers(self):
+        self.assertAccepts('=Фотосинтез | C++', ['фотосинтез', 'c++'], ['фотосинтес', 'c', 'c+'])
+        self.assertAccepts('азот', ['Азот'], ['азон'])
+        with self.settings(TEXT_ANSWER_MAX_TYPOS=0):
+            self.assertAccepts('Москва', ['москва'], ['масква'])
+
+    def test_numerals_are_not_typos(self):
+        self.assertAccepts('1999 год', ['1999 год', '1999 ГОД.'], ['1998 год', '1999 гол'])
+        self.assertAccepts('Пётр I', ['петр i'], ['Петр II', 'Пётр V'])
+        self.assertAccepts('Людовик XIV', ['людовик xiv'], ['Людовик XV'])
+        self.assertAccepts('Максимум', ['Максимун'], [])
+        # Латинские слова на c, d, i, l, m, v, x - не римские числа
+        self.assertAccepts('London', ['Londn'], ['Lisbon'])
+        self.assertAccepts('Moscow', ['Moscw'], [])
+        self.assertAccepts('Vladivostok', ['Vladivostk'], [])
+        self.assertAccepts('Charles XII', ['charles xii'], ['Charles XI', 'Charls XII'])
+
+    def test_bounded_distance(self):
+        self.assertTrue(within_distance('kitten', 'sitting', 3))
+        self.assertFalse(within_distance('kitten', 'sitting', 2))
+        self.assertTrue(within_distance('abc', 'abc', 0))
+        self.assertFalse(within_distance('abc', 'abcdef', 2))
+        self.assertTrue(within_distance('фотосинтез', 'фотосинтес', 1))
+
+
+class TextGradingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        builder = TestBuilder(User.objects.create_user('teacher'))
+        builder.add_test(title='Столицы', description='', time_limit=10, questions=[
+            {'text': 'Столица России', 'is_text_answer': True, 'correct_text_answer': 'Москва | г. Москва'},
+            {'text': 'Число пи', 'is_text_answer': True, 'correct_text_answer': '3.14 ± 0.01'},
+        ])
+        cls.test, = builder.save()
+
+    def setUp(self):
+        clear_caches()
+
+    def test_python_and_numpy_paths_agree(self):
+        answer_key = get_answer_key(self.test.id)
+        capital, pi = (question_key.id for question_key in answer_key.questions)
+        answers = [('москва.', '3,14'), ('масква', '3.2'), ('питер', ''), ('г. москва', '3.141')] * 10
+        submissions = [Submission(selected={}, texts={capital: first, pi: second}) for first, second in answers]
+        expected = [[1, 1], [1, 0], [0, 0], [1, 1]] * 10
+        for use_numpy in (False, True):
+            batch = grade_batch(answer_key, submissions, use_numpy=use_numpy)
+            self.assertEqual([[grade.score for grade in batch.row(row)] for row in range(len(answers))], expected)
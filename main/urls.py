@@ -1,5 +1,17 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+
+def attempt_patterns(module):
+    """Маршруты прохождения теста из main.views или main.async_views"""
+    return [
+        path('test/<int:test_id>/start/', module.start_test, name='start_test'),
+        path('test/<int:test_id>/submit/', module.submit_answers, name='submit_answers'),
+        path('test/<int:test_id>/autosave/', module.autosave_answers, name='autosave_answers'),
+        path('test/code/', module.enter_test_code, name='enter_test_code'),
+    ]
+
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -7,15 +19,20 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('test/create/', views.create_test, name='create_test'),
-    path('test/<int:test_id>/start/', views.start_test, name='start_test'),
-    path('test/<int:test_id>/submit/', views.submit_answers, name='submit_answers'),
+    path('test/import/', views.import_tests_view, name='import_tests'),
     path('test/<int:test_id>/result/', views.test_result, name='test_result'),
-    path('test/code/', views.enter_test_code, name='enter_test_code'),
     path('test/created/<str:test_code>/', views.test_created, name='test_created'),
     path('test/<int:test_id>/', views.test_detail, name='test_detail'),
     path('dashboard/teacher/', views.teacher_dashboard, name='teacher_dashboard'),
     path('dashboard/student/', views.student_dashboard, name='student_dashboard'),
     path('test/<int:test_id>/toggle_active/', views.toggle_test_active, name='toggle_test_active'),
     path('test/<int:test_id>/results/', views.test_results, name='test_results'),
+    path('test/<int:test_id>/results/export/', views.export_test_results, name='export_test_results'),
+    path('test/<int:test_id>/results/regrade/', views.regrade_test_results, name='regrade_test_results'),
+    path('test/<int:test_id>/analysis/', views.test_item_analysis, name='test_item_analysis'),
     path('generate-custom-test/', views.generate_custom_test, name='generate_custom_test'),
-]
\ No newline at end of file
+    path('search/', views.search_view, name='search'),
+    path('metrics/', views.metrics, name='metrics'),
+]
+# Под ASGI страницы прохождения теста работают асинхронно (см. main/async_views.py)
+urlpatterns += attempt_patterns(async_views if settings.ASYNC_VIEWS else views)
\ No newline at end of file
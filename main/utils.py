@@ -1,13 +1,74 @@
 # main/utils.py
-import random
+"""
+Выдача кодов тестов.
+
+Коды не угадываются и не повторяются без проверки "прочитать, потом
+записать": номер берётся из счётчика TestCodeSequence одним атомарным
+UPDATE, а затем переводится в код ключевой перестановкой (сеть Фейстеля
+на 52 битах с "прогулкой по циклу" до попадания в диапазон 36^10).
+Перестановка взаимно однозначна, поэтому разные номера дают разные коды.
+"""
+import hashlib
 import string
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 
-def generate_unique_code():
-    from main.models import Test  # Импортируем модель локально
+CODE_ALPHABET = string.digits + string.ascii_uppercase
+CODE_LENGTH = 10
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+HALF_BITS = 26  # 2^52 > 36^10
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 6
+
+
+def _code_key():
+    secret = getattr(settings, 'TEST_CODE_KEY', None) or settings.SECRET_KEY
+    return hashlib.sha256(f'test-code:{secret}'.encode()).digest()
+
+
+def permute_number(number, key=None):
+    """Ключевая перестановка чисел из [0, 36^10)"""
+    key = key or _code_key()
+    while True:
+        left, right = number >> HALF_BITS, number & HALF_MASK
+        for round_index in range(ROUNDS):
+            digest = hashlib.blake2b(
+                right.to_bytes(4, 'big') + bytes([round_index]), key=key, digest_size=4
+            ).digest()
+            left, right = right, left ^ (int.from_bytes(digest, 'big') & HALF_MASK)
+        number = (left << HALF_BITS) | right
+        if number < CODE_SPACE:
+            return number
+
+
+def encode_code(number):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
 
-    for _ in range(100):
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        if not Test.objects.filter(code=code).exists():
-            return code
-    raise Exception("Не удалось сгенерировать уникальный код теста.")
+
+def reserve_numbers(count):
+    """Резервирует count последовательных номеров и возвращает первый из них"""
+    from main.models import TestCodeSequence  # Импортируем модель локально
+
+    with transaction.atomic():
+        updated = TestCodeSequence.objects.filter(pk=1).update(value=F('value') + count)
+        if not updated:
+            TestCodeSequence.objects.get_or_create(pk=1)
+            TestCodeSequence.objects.filter(pk=1).update(value=F('value') + count)
+        end = TestCodeSequence.objects.values_list('value', flat=True).get(pk=1)
+    return end - count
+
+
+def allocate_codes(count):
+    start = reserve_numbers(count)
+    key = _code_key()
+    return [encode_code(permute_number(number % CODE_SPACE, key)) for number in range(start, start + count)]
+
+
+def generate_unique_code():
+    return allocate_codes(1)[0]
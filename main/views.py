@@ -1,19 +1,66 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from .models import Test, Question, Option, StudentAnswer, GradingScheme
-from .forms import RegisterForm, TestForm, QuestionForm, OptionForm, TestCodeForm
+from django.contrib import messages
+from .models import Test, StudentAnswer, GradingScheme, Attempt, StudentStats
+from .forms import RegisterForm, TestForm, QuestionForm, OptionForm, TestCodeForm, TestImportForm
 from .models import Profile
 from django.utils import timezone
+import json
+import os
 import sqlite3
 from django.db import IntegrityError
 import random
 import string
-from django.db.models import Prefetch, Avg, Count, Max, Sum
+from django.db.models import Prefetch, Sum
 from .utils import generate_unique_code
-from django.db.models import Q
+from .grading import grade_submission, submission_from_answers, submission_from_post
+from .analytics import item_analysis
+from .exports import csv_stream, result_rows, xlsx_stream
+from .importers import GRADING_FIELDS, TestImportError, detect_format, import_tests
+from .builders import TestBuilder, parse_questions_from_post
+from .fragments import test_questions_html
+from .instrumentation import metrics_allowed, render_metrics
+from .mastery import create_personalized_test, pick_weak_questions, weak_questions
+from .pools import drawn_questions, student_answer_key
+from .regrade import regrade_test
+from .search import search
+from .attempts import (
+    AttemptClosed, apply_result, finalize_attempt, finalize_expired_attempts, is_open, parse_autosave,
+    remaining_seconds, save_answers, start_attempt, student_answer_rows, submission_from_attempt,
+)
+from .submissions import enqueue_submission, submission_queue, unwritten_attempt_ids
+
+
+def build_detailed_results(questions, answer_key, submission, grades=None):
+    """Проверяет попытку (если оценки не переданы) и готовит подробные результаты по вопросам для шаблона"""
+    if grades is None:
+        grades = grade_submission(answer_key, submission)
+    grades = {question_grade.question_id: question_grade for question_grade in grades}
+    total_score = 0
+    results = []
+    for question in questions:
+        question_grade = grades[question.id]
+        result = {
+            'question': question,
+            'score': question_grade.score,
+            'is_correct': question_grade.score == 1,
+        }
+        if question.is_text_answer:
+            result['answer_text'] = submission.texts.get(question.id)
+        else:
+            result.update({
+                'selected_ids': submission.selected.get(question.id, []),
+                'correct_selected': question_grade.correct_selected,
+                'incorrect_selected': question_grade.incorrect_selected,
+                'total_correct': len(answer_key.question(question.id).correct_option_ids),
+            })
+        total_score += question_grade.score
+        results.append(result)
+    fully_correct = sum(1 for result in results if result['score'] == 1)
+    return results, total_score, fully_correct
 
 
 def index(request):
@@ -21,16 +68,13 @@ def index(request):
     if request.user.is_authenticated:
         if request.user.profile.role == 'student':
             # Для студентов показываем доступные активные тесты
-            tests = Test.objects.filter(is_active=True).annotate(
-                student_count=Count('studentanswer__user', distinct=True)
-            )[:3]  # Показываем только 3 последних теста
+            # Число прохождений - счётчик в самом тесте (main/stats.py)
+            tests = Test.objects.filter(is_active=True).order_by('-id')[:3]  # Показываем только 3 последних теста
             context['tests'] = tests
             context['user_role'] = 'student'
         elif request.user.profile.role == 'teacher':
             # Для преподавателей показываем их последние тесты
-            tests = Test.objects.filter(creator=request.user).annotate(
-                student_count=Count('studentanswer__user', distinct=True)
-            ).order_by('-id')[:3]
+            tests = Test.objects.filter(creator=request.user).order_by('-id')[:3]
             context['tests'] = tests
             context['user_role'] = 'teacher'
     return render(request, 'main/index.html', context)
@@ -69,78 +113,27 @@ def create_test(request):
             load_template = form.cleaned_data['load_template']
             if load_template:
                 # Используем параметры из шаблона
-                grading_scheme = GradingScheme(
-                    creator=request.user,
-                    grading_type=load_template.grading_type,
-                    threshold_2=load_template.threshold_2,
-                    threshold_3=load_template.threshold_3,
-                    threshold_4=load_template.threshold_4,
-                    threshold_5=load_template.threshold_5,
-                    pass_threshold=load_template.pass_threshold,
-                    name="Мои настройки"
-                )
+                grading = {field: getattr(load_template, field) for field in GRADING_FIELDS}
             else:
                 # Создаём новую схему оценивания из введённых данных
-                grading_scheme = GradingScheme(
-                    creator=request.user,
-                    grading_type=form.cleaned_data['grading_type'],
-                    threshold_2=form.cleaned_data['threshold_2'],
-                    threshold_3=form.cleaned_data['threshold_3'],
-                    threshold_4=form.cleaned_data['threshold_4'],
-                    threshold_5=form.cleaned_data['threshold_5'],
-                    pass_threshold=form.cleaned_data['pass_threshold']
-                )
+                grading = {field: form.cleaned_data[field] for field in GRADING_FIELDS}
+            grading['name'] = "Мои настройки"
             # Если отмечено "Сохранить как шаблон", изменяем имя
             if form.cleaned_data['save_as_template']:
-                grading_scheme.name = form.cleaned_data['template_name'] or f"Шаблон_{request.user.username}_{timezone.now().strftime('%Y%m%d')}"
-            grading_scheme.save()
-
-            # Создаём тест
-            test = form.save(commit=False)
-            test.creator = request.user
-            test.grading_scheme = grading_scheme
-            test.save()
-
-            question_index = 0
-            while True:
-                question_key = f'question_{question_index}_text'
-                if question_key not in request.POST:
-                    break
-                question_text = request.POST.get(question_key)
-                if question_text:
-                    has_image = request.POST.get(f'question_{question_index}_has_image') == 'on'
-                    image = request.FILES.get(f'question_{question_index}_image') if has_image else None
-                    print(f"Creating question {question_index} with image: {image}")
-                    question = Question.objects.create(
-                        test=test,
-                        text=question_text,
-                        is_text_answer=request.POST.get(f'question_{question_index}_is_text_answer') == 'on',
-                        is_multiple_choice=request.POST.get(f'question_{question_index}_is_multiple_choice') == 'on',
-                        correct_text_answer=request.POST.get(f'question_{question_index}_correct_text_answer', ''),
-                        image=image
-                    )
-                    if not question.is_text_answer:
-                        option_index = 0
-                        options_created = []
-                        while True:
-                            option_key = f'question_{question_index}_option_{option_index}_text'
-                            if option_key not in request.POST:
-                                break
-                            option_text = request.POST.get(option_key)
-                            is_correct = request.POST.get(f'question_{question_index}_option_{option_index}_is_correct') == 'on'
-                            options_created.append(Option(
-                                question=question,
-                                text=option_text or f"Вариант {option_index + 1}",
-                                is_correct=is_correct
-                            ))
-                            option_index += 1
-                        if options_created:
-                            Option.objects.bulk_create(options_created)
-                            print(f"Saved {len(options_created)} options for question {question_index}")
-                            if not any(opt.is_correct for opt in options_created):
-                                options_created[0].is_correct = True
-                                options_created[0].save()
-                question_index += 1
+                grading['name'] = form.cleaned_data['template_name'] or f"Шаблон_{request.user.username}_{timezone.now().strftime('%Y%m%d')}"
+
+            # Тест, схема оценивания, вопросы и варианты записываются одной транзакцией
+            builder = TestBuilder(request.user)
+            builder.add_test(
+                title=form.cleaned_data['title'],
+                description=form.cleaned_data['description'],
+                time_limit=form.cleaned_data['time_limit'],
+                grading=grading,
+                questions=parse_questions_from_post(request.POST, request.FILES),
+            )
+            test, = builder.save()
+            for _, text in builder.duplicates:
+                messages.warning(request, f'Вопрос «{text}» повторяет другой вопрос теста и добавлен один раз.')
 
             return redirect('test_detail', test_id=test.id)
     else:
@@ -152,194 +145,160 @@ def create_test(request):
     return render(request, 'main/test_create.html', {'form': form, 'initial_questions': [{'options': [{} for _ in range(4)]}]})
 
 
+@login_required
+def import_tests_view(request):
+    if request.user.profile.role != 'teacher':
+        return redirect('index')
+
+    errors = []
+    if request.method == 'POST':
+        form = TestImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            uploaded = form.cleaned_data['file']
+            file_format = form.cleaned_data['file_format'] or detect_format(uploaded.name)
+            try:
+                tests = import_tests(
+                    uploaded,
+                    file_format,
+                    request.user,
+                    title=form.cleaned_data['title'] or os.path.splitext(uploaded.name)[0],
+                    time_limit=form.cleaned_data['time_limit'],
+                )
+            except TestImportError as error:
+                errors = error.errors
+            else:
+                if len(tests) == 1:
+                    return redirect('test_detail', test_id=tests[0].id)
+                return redirect('teacher_dashboard')
+    else:
+        form = TestImportForm()
+    return render(request, 'main/import_tests.html', {'form': form, 'errors': errors})
+
+
 @login_required
 def start_test(request, test_id):
-    test = get_object_or_404(Test, pk=test_id)
+    test = get_object_or_404(Test.objects.select_related('grading_scheme'), pk=test_id)
     if request.user.profile.role != 'student' or not test.is_active:
         return render(request, 'main/error.html', {'message': 'Этот тест сейчас недоступен.'})
 
-    # Проверяем, проходил ли студент тест ранее
-    student_answers = StudentAnswer.objects.filter(user=request.user, test=test).exists()
-    if student_answers:
+    # Попытка создаётся при первом открытии, повторное открытие продолжает её
+    attempt = start_attempt(request.user, test)
+    if attempt.status == Attempt.FINISHED or submission_queue.is_pending(attempt.id):
         return render(request, 'main/error.html', {
             'message': 'Вы уже проходили этот тест. Повторное прохождение невозможно.'
         })
+    if not is_open(attempt):
+        # Время вышло, пока страница была закрыта: попытка завершается по сохранённым ответам
+        finalize_expired_attempts(test)
+        return redirect('test_result', test_id=test.id)
+
+    saved = submission_from_attempt(attempt.answers.all())
+    # Вопросы берутся из кэша фрагментов; страница теста с пулом собирается в порядке выборки студента
+    draw = student_answer_key(test, attempt)[1] if attempt.draw is not None else None
+    return render(request, 'main/test_timer.html', {
+        'test': test,
+        'questions_html': test_questions_html(test.id, draw),
+        'remaining_seconds': remaining_seconds(attempt),
+        'saved_answers': {**saved.selected, **saved.texts},
+    })
+
 
-    test = Test.objects.prefetch_related('questions__options').get(id=test_id)
-    return render(request, 'main/test_timer.html', {'test': test})
+@login_required
+def autosave_answers(request, test_id):
+    """Принимает пачку изменённых ответов в JSON: {"answers": {"<id вопроса>": [id вариантов] или "текст"}}"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Ожидается POST-запрос.'}, status=405)
+    attempt = Attempt.objects.filter(user=request.user, test_id=test_id).select_related('test').first()
+    if attempt is None or not is_open(attempt):
+        return JsonResponse({'error': 'Попытка завершена или время вышло.'}, status=409)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные данные.'}, status=400)
+    answers = payload.get('answers') if isinstance(payload, dict) else None
+    # Ответы на вопросы вне выборки студента отбрасываются
+    answer_key, _ = student_answer_key(attempt.test, attempt)
+    saved = save_answers(attempt, parse_autosave(answer_key, answers))
+    return JsonResponse({'saved': saved, 'remaining': remaining_seconds(attempt)})
 
 
 @login_required
 def submit_answers(request, test_id):
-    test = get_object_or_404(Test.objects.prefetch_related('questions__options'), pk=test_id)
+    test = get_object_or_404(Test.objects.select_related('grading_scheme').prefetch_related(Test.prefetch_questions('options')), pk=test_id)
     if request.user.profile.role != 'student':
         return redirect('index')
 
     if request.method != 'POST':
         return redirect('start_test', test_id=test.id)
 
-    total_score = 0
-    max_possible_score = test.questions.count()
-    detailed_results = []
-    student_answers = []
-
-    for question in test.questions.all():
-        if question.is_text_answer:
-            user_answer = request.POST.get(f'answer_{question.id}', '').strip().lower()
-            correct_answer = question.correct_text_answer.strip().lower() if question.correct_text_answer else ''
-            is_correct = user_answer == correct_answer
-            question_score = 1 if is_correct else 0
-            student_answers.append(
-                StudentAnswer(
-                    user=request.user,
-                    test=test,
-                    question=question,
-                    answer_text=user_answer,
-                    is_correct=is_correct,
-                    score=question_score
-                )
-            )
-        else:
-            selected_ids = [int(id) for id in request.POST.getlist(f'answer_{question.id}') if id.isdigit()]
-            correct_options = list(question.options.filter(is_correct=True).values_list('id', flat=True))
-            correct_selected = len(set(selected_ids) & set(correct_options))
-            incorrect_selected = len(set(selected_ids) - set(correct_options))
-            if question.is_multiple_choice:
-                question_score = max(0, (correct_selected - incorrect_selected)) / len(correct_options) if correct_options else 0
-                for option_id in selected_ids:
-                    option = Option.objects.get(id=option_id)
-                    student_answers.append(
-                        StudentAnswer(
-                            user=request.user,
-                            test=test,
-                            question=question,
-                            selected_option=option,
-                            is_correct=(option.id in correct_options),
-                            score=question_score if (option.id in correct_options) else 0
-                        )
-                    )
-            else:
-                question_score = 1 if (len(selected_ids) == 1 and selected_ids[0] in correct_options) else 0
-                if selected_ids:
-                    option = Option.objects.get(id=selected_ids[0])
-                    student_answers.append(
-                        StudentAnswer(
-                            user=request.user,
-                            test=test,
-                            question=question,
-                            selected_option=option,
-                            is_correct=(option.id in correct_options),
-                            score=question_score
-                        )
-                    )
-        total_score += question_score
-        detailed_results.append({
-            'question': question,
-            'score': question_score,
-            'is_correct': (question_score == 1),
-            'selected_ids': selected_ids,
-            'correct_selected': correct_selected,
-            'incorrect_selected': incorrect_selected,
-            'total_correct': len(correct_options),
-            'answer_text': user_answer if question.is_text_answer else None
+    attempt = Attempt.objects.filter(user=request.user, test=test).first()
+    if attempt is None:
+        return redirect('start_test', test_id=test.id)
+    # Отправленная попытка может ещё стоять в очереди записи
+    if attempt.status == Attempt.FINISHED or submission_queue.is_pending(attempt.id):
+        return render(request, 'main/error.html', {
+            'message': 'Вы уже проходили этот тест. Повторное прохождение невозможно.'
         })
-
-    fully_correct = sum(1 for result in detailed_results if result['score'] == 1)
-    StudentAnswer.objects.bulk_create(student_answers)
-    final_percentage = round((total_score / max_possible_score) * 100) if max_possible_score > 0 else 0
-
-    # Определяем оценку на основе схемы
-    grade = 'Зачёт' if final_percentage >= 60 else 'Незачёт'
-    if test.grading_scheme:
-        if test.grading_scheme.grading_type == 'differentiated':
-            if final_percentage >= test.grading_scheme.threshold_5:
-                grade = "5"
-            elif final_percentage >= test.grading_scheme.threshold_4:
-                grade = "4"
-            elif final_percentage >= test.grading_scheme.threshold_3:
-                grade = "3"
-            elif final_percentage >= test.grading_scheme.threshold_2:
-                grade = "2"
-            else:
-                grade = "Незачёт"
-        else:
-            grade = "Зачёт" if final_percentage >= test.grading_scheme.pass_threshold else "Незачёт"
+    attempt.test = test
+
+    # Для теста с пулом ключ содержит только вопросы, вытянутые студентом
+    answer_key, draw = student_answer_key(test, attempt, list(test.questions.all()))
+    questions = drawn_questions(test.questions.all(), draw)
+    if is_open(attempt):
+        # Форма содержит текущее состояние всех ответов
+        submission = submission_from_post(answer_key, request.POST)
+    else:
+        # После срока принимаются только ответы, сохранённые автосохранением
+        submission = submission_from_attempt(attempt.answers.all())
+    grades = grade_submission(answer_key, submission)
+    submitted_at = timezone.now()
+    # Запись в базу выполняет поток-писатель пачками; без очереди попытка завершается сразу
+    if enqueue_submission(attempt, submission, submitted_at):
+        apply_result(attempt, answer_key, grades, submitted_at)
+        student_answers = student_answer_rows(attempt, answer_key, submission, grades)
+    else:
+        try:
+            student_answers = finalize_attempt(attempt, answer_key, submission, grades, submitted_at)
+        except AttemptClosed:
+            # Повторная отправка той же формы
+            return render(request, 'main/error.html', {
+                'message': 'Вы уже проходили этот тест. Повторное прохождение невозможно.'
+            })
+    detailed_results, total_score, fully_correct = build_detailed_results(questions, answer_key, submission, grades)
+    max_possible_score = answer_key.total
 
     return render(request, 'main/result.html', {
         'test': test,
         'correct': total_score,
         'fully_correct': fully_correct,
         'total': max_possible_score,
-        'score': final_percentage,
-        'grade': grade,
+        'score': attempt.percentage,
+        'grade': attempt.grade,
         'incorrect': max_possible_score - total_score,
         'results': detailed_results,
-        'answers_by_question': {
-            answer.question_id: answer
-            for answer in StudentAnswer.objects.filter(user=request.user, test=test)
-        }
+        'answers_by_question': {answer.question_id: answer for answer in student_answers}
     })
 
 
 @login_required
 def test_result(request, test_id):
-    test = get_object_or_404(Test, pk=test_id)
-    student_answers = StudentAnswer.objects.filter(user=request.user, test=test).select_related('question', 'selected_option')
-    total_questions_count = test.questions.count()
-    total_score = 0
-    fully_correct = 0
-    results = []
-
-    for question in test.questions.all():
-        answers = student_answers.filter(question=question)
-        if question.is_text_answer:
-            answer = answers.first()
-            question_score = answer.score if answer and answer.is_correct else 0
-            result = {
-                'question': question,
-                'score': question_score,
-                'is_correct': question_score == 1,
-                'answer_text': answer.answer_text if answer else None,
-            }
-        else:
-            selected_ids = [answer.selected_option.id for answer in answers if answer.selected_option]
-            correct_options = list(question.options.filter(is_correct=True).values_list('id', flat=True))
-            correct_selected = len(set(selected_ids) & set(correct_options))
-            incorrect_selected = len(set(selected_ids) - set(correct_options))
-            if question.is_multiple_choice:
-                question_score = max(0, (correct_selected - incorrect_selected)) / len(correct_options) if correct_options else 0
-            else:
-                question_score = 1 if selected_ids and selected_ids[0] in correct_options else 0
-            result = {
-                'question': question,
-                'score': question_score,
-                'is_correct': question_score == 1,
-                'selected_ids': selected_ids,
-                'correct_selected': correct_selected,
-                'incorrect_selected': incorrect_selected,
-                'total_correct': len(correct_options),
-            }
-        total_score += question_score
-        if question_score == 1:
-            fully_correct += 1
-        results.append(result)
+    test = get_object_or_404(Test.objects.select_related('grading_scheme').prefetch_related(Test.prefetch_questions('options')), pk=test_id)
+    attempt = Attempt.objects.filter(user=request.user, test=test).only('id', 'status', 'draw').first()
+    # Отправленная попытка может ещё стоять в очереди записи этого или другого процесса
+    if attempt is not None and attempt.status != Attempt.FINISHED and (
+        submission_queue.is_pending(attempt.id) or attempt.id in unwritten_attempt_ids()
+    ):
+        return render(request, 'main/result_pending.html', {'test': test})
+    student_answers = list(StudentAnswer.objects.filter(user=request.user, test=test))
+    answer_key, draw = student_answer_key(test, attempt, list(test.questions.all()))
+    questions = drawn_questions(test.questions.all(), draw)
+    total_questions_count = answer_key.total
+    results, total_score, fully_correct = build_detailed_results(
+        questions, answer_key, submission_from_answers(student_answers)
+    )
 
     score = round((total_score / total_questions_count) * 100) if total_questions_count > 0 else 0
-    grade = 'Зачёт' if score >= 60 else 'Незачёт'
-    if test.grading_scheme:
-        if test.grading_scheme.grading_type == 'differentiated':
-            if score >= test.grading_scheme.threshold_5:
-                grade = "5"
-            elif score >= test.grading_scheme.threshold_4:
-                grade = "4"
-            elif score >= test.grading_scheme.threshold_3:
-                grade = "3"
-            elif score >= test.grading_scheme.threshold_2:
-                grade = "2"
-            else:
-                grade = "Незачёт"
-        else:
-            grade = "Зачёт" if score >= test.grading_scheme.pass_threshold else "Незачёт"
+    grade = test.get_grade(score)
 
     return render(request, 'main/test_result.html', {
         'test': test,
@@ -400,7 +359,7 @@ def test_created(request, test_code):
 @login_required
 def test_detail(request, test_id):
     test = get_object_or_404(Test, id=test_id)
-    test = Test.objects.prefetch_related('questions__options').get(id=test_id)
+    test = Test.objects.prefetch_related(Test.prefetch_questions('options')).get(id=test_id)
     return render(request, 'main/test_detail.html', {'test': test})
 
 
@@ -408,10 +367,8 @@ def test_detail(request, test_id):
 def teacher_dashboard(request):
     if request.user.profile.role != 'teacher':
         return redirect('student_dashboard')
-    tests = Test.objects.filter(creator=request.user).annotate(
-        student_count=Count('studentanswer__user', distinct=True),
-        avg_score=Avg('studentanswer__score') * 100
-    )
+    # Число вопросов, прохождений и средний балл - счётчики в самом тесте, без агрегации по ответам
+    tests = Test.objects.filter(creator=request.user)
     return render(request, 'main/teacher_dashboard.html', {
         'tests': tests,
     })
@@ -421,48 +378,17 @@ def teacher_dashboard(request):
 def student_dashboard(request):
     if request.user.profile.role != 'student':  # Исправлено на 'student'
         return redirect('teacher_dashboard')
-    test_attempts = StudentAnswer.objects.filter(user=request.user).values(
-        'test__id', 'test__title'
-    ).annotate(
-        max_id=Max('id')  # Сортировка по id
-    ).order_by('-max_id')
-    total_tests = test_attempts.count()
-    processed_attempts = []
-    avg_score = 0
-    if test_attempts:
-        for attempt in test_attempts:
-            test = Test.objects.get(id=attempt['test__id'])
-            student_answers = StudentAnswer.objects.filter(user=request.user, test=test).select_related('question', 'selected_option')
-            total_questions_count = test.questions.count()
-            total_score = 0
-            for question in test.questions.all():
-                answers = student_answers.filter(question=question)
-                if question.is_text_answer:
-                    answer = answers.first()
-                    question_score = answer.score if answer and answer.is_correct else 0
-                else:
-                    selected_ids = [answer.selected_option.id for answer in answers if answer.selected_option]
-                    correct_options = list(question.options.filter(is_correct=True).values_list('id', flat=True))
-                    correct_selected = len(set(selected_ids) & set(correct_options))
-                    incorrect_selected = len(set(selected_ids) - set(correct_options))
-                    if question.is_multiple_choice:
-                        question_score = max(0, (correct_selected - incorrect_selected)) / len(correct_options) if correct_options else 0
-                    else:
-                        question_score = 1 if selected_ids and selected_ids[0] in correct_options else 0
-                total_score += question_score
-            percentage = round((total_score / total_questions_count) * 100) if total_questions_count > 0 else 0
-            processed_attempts.append({
-                'test__id': attempt['test__id'],
-                'test__title': attempt['test__title'],
-                'total_score': percentage,
-                'max_id': attempt['max_id'],
-                'grade': 'Зачёт' if percentage >= 60 else 'Незачёт'
-            })
-        avg_score = sum(attempt['total_score'] for attempt in processed_attempts) / total_tests if total_tests > 0 else 0
+    # Результаты сохраняются при отправке теста, поэтому кабинет читает их одним запросом
+    test_attempts = Attempt.objects.filter(
+        user=request.user, status=Attempt.FINISHED
+    ).select_related('test').order_by('-id')
+    # Шапка - сводка по первичному ключу, без обхода истории попыток
+    stats = StudentStats.objects.filter(pk=request.user.pk).first() or StudentStats(user=request.user)
     return render(request, 'main/student_dashboard.html', {
-        'test_attempts': processed_attempts,
-        'total_tests': total_tests,
-        'avg_score': round(avg_score, 2),
+        'test_attempts': test_attempts,
+        'total_tests': stats.tests_taken,
+        'avg_score': stats.average_score,
+        'pass_count': stats.pass_count,
     })
 
 @login_required
@@ -480,22 +406,8 @@ def test_results(request, test_id):
     if request.user.profile.role != 'teacher':
         return redirect('index')
     test = get_object_or_404(Test, id=test_id, creator=request.user)
-    results = StudentAnswer.objects.filter(test=test).values(
-        'user__username'
-    ).annotate(
-        total_score=Avg('score') * 100,
-        attempt_date=Max('id')  # Используем Max('id'), как в student_dashboard
-    ).order_by('-attempt_date')
-    # Добавляем grade для каждого результата
-    results = [
-        {
-            'user__username': result['user__username'],
-            'total_score': result['total_score'],
-            'attempt_date': result['attempt_date'],
-            'grade': 'Зачёт' if result['total_score'] >= 60 else 'Незачёт'
-        }
-        for result in results
-    ]
+    finalize_expired_attempts(test)
+    results = Attempt.objects.filter(test=test, status=Attempt.FINISHED).select_related('user').order_by('-id')
     return render(request, 'main/test_results.html', {
         'test': test,
         'results': results,
@@ -503,66 +415,109 @@ def test_results(request, test_id):
 
 
 @login_required
-def generate_custom_test(request):
-    if request.user.profile.role != 'student':
+def regrade_test_results(request, test_id):
+    """Пересчитывает результаты после исправления правильных ответов"""
+    if request.user.profile.role != 'teacher':
+        return redirect('index')
+    test = get_object_or_404(Test, id=test_id, creator=request.user)
+    if request.method != 'POST':
+        return redirect('test_results', test_id=test.id)
+    finalize_expired_attempts(test)
+    report = regrade_test(test.id)
+    messages.success(
+        request,
+        f'Результаты пересчитаны: изменено попыток {len(report.changed_attempts)} из {report.attempts} '
+        f'(выше {report.raised}, ниже {report.lowered}), ответов {report.changed_answers}.',
+    )
+    return redirect('test_results', test_id=test.id)
+
+
+@login_required
+def export_test_results(request, test_id):
+    if request.user.profile.role != 'teacher':
+        return redirect('index')
+    test = get_object_or_404(Test, id=test_id, creator=request.user)
+    finalize_expired_attempts(test)
+    rows = result_rows(test, include_questions=request.GET.get('questions') == '1')
+    if request.GET.get('format') == 'xlsx':
+        response = StreamingHttpResponse(
+            xlsx_stream(rows),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        extension = 'xlsx'
+    else:
+        response = StreamingHttpResponse(csv_stream(rows), content_type='text/csv; charset=utf-8')
+        extension = 'csv'
+    response['Content-Disposition'] = f'attachment; filename="test_{test.code}_results.{extension}"'
+    return response
+
+
+@login_required
+def search_view(request):
+    if request.user.profile.role != 'teacher':
+        return redirect('index')
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    hits, has_next = search(request.user, query, page)
+    return render(request, 'main/search.html', {
+        'query': query,
+        'hits': hits,
+        'page': page,
+        'has_next': has_next,
+    })
+
+
+@login_required
+def test_item_analysis(request, test_id):
+    if request.user.profile.role != 'teacher':
         return redirect('index')
+    test = get_object_or_404(Test.objects.prefetch_related(Test.prefetch_questions('options')), id=test_id, creator=request.user)
+    finalize_expired_attempts(test)
+    attempts_count, report = item_analysis(test)
+    return render(request, 'main/item_analysis.html', {
+        'test': test,
+        'attempts_count': attempts_count,
+        'report': report,
+    })
 
-    # Получаем все последние ответы студента с неправильными ответами
-    incorrect_answers = StudentAnswer.objects.filter(
-        Q(user=request.user) & (Q(is_correct=False) | Q(score__lt=1))
-    ).order_by('-id')[:10]
 
-    # Создаём словарь для хранения уникальных вопросов, выбираем последний ответ по id
-    question_ids = {}
-    for answer in incorrect_answers:
-        question_ids[answer.question_id] = answer
+@login_required
+def generate_custom_test(request):
+    if request.user.profile.role != 'student':
+        return redirect('index')
 
-    # Преобразуем в список уникальных вопросов
-    incorrect_questions = [answer.question for answer in question_ids.values()]
-    num_incorrect = len(incorrect_questions)
+    # Слабые места - по усвоению вопросов, которое обновляется при каждом завершении теста
+    candidates = weak_questions(request.user)
 
     if request.method == 'POST':
         num_questions = int(request.POST.get('num_questions', 5))
         if num_questions < 1 or num_questions > 20:
             return render(request, 'main/generate_custom_test.html', {
-                'error': 'Количество вопросов должно быть от 1 до 20.'
+                'error': 'Количество вопросов должно быть от 1 до 20.',
+                'available': len(candidates),
             })
 
-        # Проверяем, достаточно ли неправильных вопросов
-        if num_incorrect < num_questions:
+        # Проверяем, достаточно ли вопросов для повторения
+        if len(candidates) < num_questions:
             return render(request, 'main/generate_custom_test.html', {
-                'error': f'Недостаточно неправильных ответов для создания теста. Доступно только {num_incorrect} неправильных вопроса(ов). Пройдите больше тестов или выберите меньшее количество вопросов.'
+                'error': f'Недостаточно вопросов для повторения. Доступно только {len(candidates)} вопроса(ов). Пройдите больше тестов или выберите меньшее количество вопросов.',
+                'available': len(candidates),
             })
 
-        # Создаём новый тест
-        test = Test.objects.create(
-            title=f"Персонализированный тест для {request.user.username}",
-            description="Этот тест создан на основе ваших последних неправильных ответов, чтобы помочь вам улучшить слабые места.",
-            creator=request.user,
-            time_limit=10,
-            is_active=True,
-            is_personalized=True
-        )
-
-        # Копируем вопросы в новый тест
-        for question in incorrect_questions[:num_questions]:
-            new_question = Question.objects.create(
-                test=test,
-                text=question.text,
-                is_text_answer=question.is_text_answer,
-                is_multiple_choice=question.is_multiple_choice,
-                correct_text_answer=question.correct_text_answer,
-                image=question.image
-            )
-            if not question.is_text_answer:
-                for option in question.options.all():
-                    Option.objects.create(
-                        question=new_question,
-                        text=option.text,
-                        is_correct=option.is_correct
-                    )
+        # Тест ссылается на выбранные вопросы, а не копирует их
+        test = create_personalized_test(request.user, pick_weak_questions(candidates, num_questions))
 
         # Перенаправляем студента на прохождение теста
         return redirect('start_test', test_id=test.id)
 
-    return render(request, 'main/generate_custom_test.html', {})
+    return render(request, 'main/generate_custom_test.html', {'available': len(candidates)})
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus: доступ проверяет metrics_allowed"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')